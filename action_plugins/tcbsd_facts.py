@@ -0,0 +1,123 @@
+"""
+Controller-side cache for the tcbsd_facts module.
+
+Facts gathered from a PLC are stored as JSON in the controller cache
+directory, one file per inventory host.  When the task's ``cache_ttl`` allows
+it, a recent enough entry for the same address and module arguments is
+returned without contacting the PLC at all.  Otherwise the module runs as
+usual and its facts replace the cache entry.
+"""
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import tempfile
+import time
+
+import ansible.module_utils
+from ansible.plugins.action import ActionBase
+from ansible.utils.display import Display
+
+# Plugins run on the controller, where ansible.module_utils does not include
+# this repository's module_utils unless it is added here.
+_MODULE_UTILS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "module_utils"
+)
+if _MODULE_UTILS not in ansible.module_utils.__path__:
+    ansible.module_utils.__path__.append(_MODULE_UTILS)
+
+from ansible.module_utils.tcbsd_cache import default_cache_dir  # noqa: E402
+
+__metaclass__ = type
+
+display = Display()
+
+
+def facts_cache_path(hostname, cache_dir=None):
+    """Get the cache file for a host's facts."""
+    return os.path.join(
+        cache_dir or default_cache_dir(), "facts", "%s.json" % (hostname,)
+    )
+
+
+def read_cached_facts(path, key, ttl, now=None):
+    """
+    Get cached facts if they match ``key`` and are at most ``ttl`` seconds old.
+
+    Returns
+    -------
+    facts : dict or None
+    age : float or None
+    """
+    if ttl <= 0:
+        return None, None
+    try:
+        with open(path, "r") as fp:
+            entry = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return None, None
+    if not isinstance(entry, dict) or entry.get("key") != key:
+        return None, None
+    age = (time.time() if now is None else now) - entry.get("gathered_at", 0)
+    if not 0 <= age <= ttl:
+        return None, None
+    return entry.get("facts"), age
+
+
+def write_cached_facts(path, key, facts):
+    """Write a cache entry atomically.  Failing to cache is not an error."""
+    try:
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, temp_name = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as fp:
+            json.dump(dict(key=key, gathered_at=time.time(), facts=facts), fp)
+        os.rename(temp_name, path)
+    except (IOError, OSError, TypeError, ValueError) as ex:
+        display.vvv("tcbsd_facts: unable to cache facts (%s)" % (ex,))
+
+
+class ActionModule(ActionBase):
+    TRANSFERS_FILES = False
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+        task_vars = task_vars or {}
+
+        module_args = self._task.args.copy()
+        try:
+            ttl = int(module_args.get("cache_ttl") or 0)
+        except (TypeError, ValueError):
+            result.update(failed=True, msg="cache_ttl must be an integer")
+            return result
+
+        hostname = task_vars.get("inventory_hostname", self._play_context.remote_addr)
+        path = facts_cache_path(hostname)
+        key = dict(
+            address=task_vars.get("ansible_host", hostname),
+            registry_path=module_args.get("registry_path"),
+            routes_path=module_args.get("routes_path"),
+        )
+
+        facts, age = read_cached_facts(path, key, ttl)
+        if facts is not None:
+            result.update(
+                changed=False,
+                cached=True,
+                cache_age=round(age, 1),
+                ansible_facts=dict(tcbsd=facts),
+            )
+            return result
+
+        result.update(
+            self._execute_module(
+                module_name="tcbsd_facts",
+                module_args=module_args,
+                task_vars=task_vars,
+            )
+        )
+        if not result.get("failed"):
+            write_cached_facts(path, key, result["ansible_facts"]["tcbsd"])
+        return result
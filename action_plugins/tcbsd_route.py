@@ -0,0 +1,164 @@
+"""
+Controller-side half of the tcbsd_route module.
+
+Reads StaticRoutes.xml from the PLC with a single remote ``cat`` and works out
+the route changes on the controller, using the module's own RouteTable logic.
+Hostnames of routes without a ``net_id`` are therefore resolved by the
+controller's DNS, not the PLC's.
+The module itself is only shipped to and run on the PLC when there is
+something to write.  Anything unexpected (check mode, an unreadable file, a
+file that does not parse, lxml missing on the controller) falls back to
+running the module as usual.
+"""
+from __future__ import absolute_import, division, print_function
+
+import hashlib
+import importlib.util
+import io
+import shlex
+
+from ansible.plugins.action import ActionBase
+from ansible.utils.display import Display
+
+__metaclass__ = type
+
+display = Display()
+
+DEFAULT_FILE = "/usr/local/etc/TwinCAT/3.1/Target/StaticRoutes.xml"
+
+_route_module = None
+
+
+def load_route_module(path):
+    """Import the tcbsd_route module source for use on the controller."""
+    global _route_module
+    if _route_module is None:
+        spec = importlib.util.spec_from_file_location("_tcbsd_route", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _route_module = module
+    return _route_module
+
+
+class ActionModule(ActionBase):
+    TRANSFERS_FILES = False
+
+    def _find_route_module(self):
+        context = self._shared_loader_obj.module_loader.find_plugin_with_context(
+            "tcbsd_route"
+        )
+        if not context.resolved:
+            raise ImportError("tcbsd_route module not found")
+        return load_route_module(context.plugin_resolved_path)
+
+    def _read_remote_file(self, filename):
+        """
+        Read ``filename`` from the target, without running Python there.
+
+        Uses the task's become settings, as the module does when it writes
+        the file, so a file only root can read is not skipped.
+        """
+        res = self._low_level_execute_command(
+            "cat %s" % (shlex.quote(filename),), sudoable=True
+        )
+        if res["rc"] != 0:
+            raise IOError(res["stderr"] or "Unable to read %s" % (filename,))
+        return res["stdout"].encode("utf-8", "surrogateescape")
+
+    def _plan(self, args):
+        """
+        Compute the route changes on the controller.
+
+        Returns
+        -------
+        result : dict
+            The result the module would return if nothing needs writing.
+        module_args : dict
+            Arguments for the module, with Net IDs resolved here so the
+            module acts on exactly what was planned.
+        """
+        mod = self._find_route_module()
+        filename = args.get("file") or DEFAULT_FILE
+        state = args.get("state") or "present"
+        profiler = mod.Profiler()
+        dns_lookups_before = mod.RESOLVER.lookups
+
+        route_dicts = []
+        new_routes = []
+        with profiler.phase("resolve"):
+            # Routes without a net_id are resolved here on the controller, in
+            # parallel and with the task's limits, as the module would.
+            mod.RESOLVER.timeout = float(args.get("resolve_timeout") or 5.0)
+            mod.RESOLVER.max_workers = int(args.get("resolve_workers") or 8)
+            _, resolve_errors = mod.RESOLVER.resolve_all(
+                route_dict["address"]
+                for route_dict in args.get("routes") or []
+                if route_dict.get("address") and not route_dict.get("net_id")
+            )
+            if resolve_errors:
+                raise mod.ResolutionError(
+                    "Unable to resolve %s" % (", ".join(sorted(resolve_errors)),)
+                )
+            for route_dict in args.get("routes") or []:
+                route = mod.Route(**route_dict)
+                route_dicts.append(dict(route_dict, net_id=route.net_id))
+                new_routes.append(route)
+
+        with profiler.phase("parse"):
+            data = self._read_remote_file(filename)
+            profiler.count("xml_bytes_read", len(data))
+            routes = mod.RouteTable(mod.iter_routes_from_file(io.BytesIO(data)))
+
+        result = dict(
+            changed=False,
+            routes_added=0,
+            routes_removed=0,
+            routes_modified=0,
+            routes_before=len(routes),
+            routes_after=0,
+            message="No changes in routes",
+        )
+        with profiler.phase("match"):
+            mod.combine_results(result, routes.apply(state, new_routes))
+        result["routes_after"] = len(routes)
+        result["changed"] = False
+        result["sha256"] = hashlib.sha256(data).hexdigest()
+        if args.get("profile"):
+            profiler.count("dns_lookups", mod.RESOLVER.lookups - dns_lookups_before)
+            result.update(profiler.report())
+        return result, dict(args, routes=route_dicts)
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(ActionModule, self).run(tmp, task_vars)
+        del tmp
+
+        module_args = self._task.args.copy()
+        if not self._play_context.check_mode:
+            try:
+                planned, module_args = self._plan(self._task.args)
+            except Exception as ex:
+                display.vvv(
+                    "tcbsd_route: planning on the controller failed (%s); "
+                    "running the module on the target" % (ex,)
+                )
+                module_args = self._task.args.copy()
+            else:
+                if not any(
+                    (
+                        planned["routes_added"],
+                        planned["routes_modified"],
+                        planned["routes_removed"],
+                        planned["routes_before"] != planned["routes_after"],
+                    )
+                ):
+                    result.update(planned)
+                    return result
+
+        result.update(
+            self._execute_module(
+                module_name="tcbsd_route",
+                module_args=module_args,
+                task_vars=task_vars,
+            )
+        )
+        return result
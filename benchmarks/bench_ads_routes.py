@@ -0,0 +1,282 @@
+"""
+Benchmark and sanity-check the ADS UDP client in scripts/ads_routes.py.
+
+Starts a stand-in responder for each simulated PLC on its own loopback
+address (127.0.0.2, 127.0.0.3, ...), each answering discovery and add-route
+requests after a random delay.  Some drop the first datagram, to exercise
+the retries, and some refuse the password.  The client's per-host results
+are checked against what each stand-in was set up to do and against the
+routes it actually received, and its wall time is compared with adding the
+routes one PLC at a time.
+
+Loopback addresses other than 127.0.0.1 work out of the box on Linux only.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT / "scripts"))
+
+import ads_routes  # noqa: E402
+
+DEFAULT_COUNTS = (1, 10, 50, 200)
+PASSWORD = "1"
+ERROR_ACCESS_DENIED = 0x704
+
+
+class StandInPLC(asyncio.DatagramProtocol):
+    """Answers UDP service requests the way a TwinCAT/BSD PLC would."""
+
+    def __init__(
+        self,
+        address: str,
+        delay: float,
+        drop_first: bool = False,
+        refuse: bool = False,
+    ):
+        self.address = address
+        self.net_id = f"{address}.1.1"
+        self.delay = delay
+        self.drop_first = drop_first
+        self.refuse = refuse
+        self.received = 0
+        self.routes: list[dict[str, str]] = []
+        self.transport = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.received += 1
+        if self.drop_first and self.received == 1:
+            return
+        request = ads_routes.Message.from_bytes(data)
+        asyncio.get_running_loop().call_later(
+            self.delay, self.transport.sendto, self.respond(request), addr
+        )
+
+    def respond(self, request: ads_routes.Message) -> bytes:
+        tags: list[tuple[int, bytes]] = []
+        if request.service == ads_routes.SERVICE_DISCOVER:
+            tags = [
+                (ads_routes.TAG_COMPUTER_NAME, f"plc-{self.address}\x00".encode()),
+                (ads_routes.TAG_TC_VERSION, struct.pack("<BBH", 3, 1, 4026)),
+            ]
+        elif request.service == ads_routes.SERVICE_ADD_ROUTE:
+            password = ads_routes._tag_string(request.tag(ads_routes.TAG_PASSWORD))
+            refused = self.refuse or password != PASSWORD
+            if not refused:
+                self.routes.append(dict(
+                    name=ads_routes._tag_string(
+                        request.tag(ads_routes.TAG_ROUTE_NAME)
+                    ),
+                    net_id=ads_routes.bytes_to_ams_net_id(
+                        request.tag(ads_routes.TAG_NET_ID)
+                    ),
+                    address=ads_routes._tag_string(
+                        request.tag(ads_routes.TAG_COMPUTER_NAME)
+                    ),
+                    username=ads_routes._tag_string(
+                        request.tag(ads_routes.TAG_USERNAME)
+                    ),
+                ))
+            status = ERROR_ACCESS_DENIED if refused else 0
+            tags = [(ads_routes.TAG_STATUS, struct.pack("<I", status))]
+        return ads_routes.Message(
+            request.invoke_id, request.service | ads_routes.RESPONSE_FLAG,
+            self.net_id, ads_routes.DEFAULT_AMS_PORT, tuple(tags),
+        ).to_bytes()
+
+
+async def start_plcs(
+    count: int,
+    port: int,
+    delay: float,
+    drop_fraction: float,
+    refuse_fraction: float,
+    seed: int,
+) -> list[StandInPLC]:
+    rng = random.Random(seed)
+    loop = asyncio.get_running_loop()
+    plcs = []
+    for idx in range(count):
+        address = f"127.0.{(idx + 2) // 256}.{(idx + 2) % 256}"
+        _, plc = await loop.create_datagram_endpoint(
+            lambda address=address: StandInPLC(
+                address,
+                delay=rng.uniform(delay / 2, delay * 1.5),
+                drop_first=rng.random() < drop_fraction,
+                refuse=rng.random() < refuse_fraction,
+            ),
+            local_addr=(address, port),
+        )
+        plcs.append(plc)
+    return plcs
+
+
+class Benchmark:
+    """Collects timings and correctness checks for one benchmark run."""
+
+    def __init__(self, port: int, delay: float, timeout: float):
+        self.port = port
+        self.delay = delay
+        self.timeout = timeout
+        self.results: list[dict[str, Any]] = []
+        self.checks: list[dict[str, Any]] = []
+
+    def record(self, count: int, operation: str, seconds: float) -> None:
+        self.results.append(dict(plcs=count, operation=operation, seconds=seconds))
+        print(f"{count:>5} {operation:<24} {seconds * 1000:10.1f} ms")
+
+    def check(self, count: int, name: str, passed: bool) -> None:
+        self.checks.append(dict(plcs=count, check=name, passed=passed))
+        if not passed:
+            print(f"FAILED: {name} ({count} PLCs)")
+
+    async def add_routes(self, targets: dict[str, str], concurrency: int):
+        start = time.perf_counter()
+        results = await ads_routes.add_routes(
+            targets, route_name="bench", address="127.0.0.1",
+            net_id="127.0.0.1.1.1", username="Administrator", password=PASSWORD,
+            timeout=self.timeout, retries=2, concurrency=concurrency,
+            port=self.port,
+        )
+        return results, time.perf_counter() - start
+
+    async def run_count(self, count: int, seed: int) -> None:
+        plcs = await start_plcs(
+            count, self.port, self.delay,
+            drop_fraction=0.1, refuse_fraction=0.1, seed=seed,
+        )
+        targets = {f"plc-{idx}": plc.address for idx, plc in enumerate(plcs)}
+        try:
+            start = time.perf_counter()
+            found = await ads_routes.discover(
+                targets, net_id="127.0.0.1.1.1", timeout=self.timeout,
+                port=self.port,
+            )
+            self.record(count, "discover", time.perf_counter() - start)
+            self.check(count, "discover finds every PLC", all(
+                result.ok and result.info.net_id == f"{result.address}.1.1"
+                and result.info.tc_version == "3.1.4026"
+                for result in found
+            ))
+
+            results, seconds = await self.add_routes(targets, concurrency=count)
+            self.record(count, "add_routes concurrent", seconds)
+            expected = {plc.address: not plc.refuse for plc in plcs}
+            self.check(count, "per-host results", all(
+                result.ok == expected[result.address] for result in results
+            ))
+            self.check(count, "latency reported", all(
+                result.latency is not None and result.latency >= 0
+                for result in results
+            ))
+            self.check(count, "routes received", all(
+                plc.routes[-1:] == [dict(
+                    name="bench", net_id="127.0.0.1.1.1",
+                    address="127.0.0.1", username="Administrator",
+                )]
+                for plc in plcs if not plc.refuse
+            ))
+
+            for plc in plcs:
+                plc.drop_first = False
+            await ads_routes.add_routes(
+                targets, route_name="bench", address=None, net_id=None,
+                username="Administrator", password=PASSWORD,
+                timeout=self.timeout, retries=2, concurrency=count, port=self.port,
+            )
+            self.check(count, "route to the address facing each PLC", all(
+                plc.routes[-1]["address"] == ads_routes.local_address_for(plc.address)
+                and plc.routes[-1]["net_id"] == f"{plc.routes[-1]['address']}.1.1"
+                for plc in plcs if not plc.refuse
+            ))
+
+            _, serial = await self.add_routes(targets, concurrency=1)
+            self.record(count, "add_routes one at a time", serial)
+            if count > 1:
+                self.check(count, "concurrent is faster", seconds < serial)
+        finally:
+            for plc in plcs:
+                plc.transport.close()
+
+    def to_json(self) -> dict[str, Any]:
+        return dict(
+            meta=dict(
+                python=platform.python_version(),
+                platform=platform.platform(),
+                timestamp=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                delay=self.delay,
+                timeout=self.timeout,
+            ),
+            results=self.results,
+            checks=self.checks,
+        )
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the parser used for CLI argument parsing."""
+    parser = argparse.ArgumentParser(
+        prog="bench_ads_routes.py",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--counts", type=int, nargs="+", default=list(DEFAULT_COUNTS),
+        help="Numbers of simulated PLCs",
+    )
+    parser.add_argument(
+        "--delay", type=float, default=0.02,
+        help="Typical response delay of a simulated PLC, in seconds",
+    )
+    parser.add_argument("--timeout", type=float, default=0.5)
+    parser.add_argument("--port", type=int, default=ads_routes.ADS_UDP_PORT)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", type=str, default="ads_routes_bench.json",
+        help="JSON file to write results to",
+    )
+    return parser
+
+
+def main(
+    counts: list[int],
+    delay: float,
+    timeout: float,
+    port: int,
+    seed: int,
+    output: str,
+) -> int:
+    bench = Benchmark(port=port, delay=delay, timeout=timeout)
+    for count in counts:
+        asyncio.run(bench.run_count(count, seed=seed))
+
+    Path(output).write_text(json.dumps(bench.to_json(), indent=2) + "\n")
+    print(f"Wrote results to {output}")
+    failed = [check for check in bench.checks if not check["passed"]]
+    print(f"{len(bench.checks) - len(failed)}/{len(bench.checks)} checks passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    args = parser.parse_args()
+    exit(main(
+        counts=args.counts,
+        delay=args.delay,
+        timeout=args.timeout,
+        port=args.port,
+        seed=args.seed,
+        output=args.output,
+    ))
@@ -0,0 +1,247 @@
+"""
+Benchmark and sanity-check the cached hostname resolvers.
+
+Both ``HostnameResolver`` in library/tcbsd_route.py and ``Resolver`` in
+scripts/hostname_resolver.py are run with ``socket.getaddrinfo`` patched to
+a stand-in DNS, where each name answers after a set delay or fails.  The
+checks cover addresses, cache hits and expiry, per-lookup timeouts, errors
+and the worker limit, and resolve_all's wall time is compared with
+resolving the same names one at a time.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable
+from unittest import mock
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT / "library"))
+sys.path.insert(0, str(REPO_ROOT / "scripts"))
+
+import hostname_resolver  # noqa: E402
+import tcbsd_route  # noqa: E402
+
+DEFAULT_COUNTS = (1, 10, 50)
+RESOLVERS: dict[str, Callable[..., Any]] = {
+    "tcbsd_route.HostnameResolver": tcbsd_route.HostnameResolver,
+    "hostname_resolver.Resolver": hostname_resolver.Resolver,
+}
+TIMEOUT_ERRORS = (tcbsd_route.ResolutionError, hostname_resolver.ResolutionError)
+
+
+class StandInDNS:
+    """A getaddrinfo replacement answering from a table, after a delay."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.delays: dict[str, float] = {}
+        self.failing: set[str] = set()
+        self.calls: list[str] = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def address_of(hostname: str) -> str:
+        number = sum(hostname.encode()) % 250 + 1
+        return f"10.0.{len(hostname) % 250}.{number}"
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        with self._lock:
+            self.calls.append(host)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delays.get(host, self.delay))
+            if host in self.failing:
+                raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+            if family not in (0, socket.AF_INET):
+                raise socket.gaierror(socket.EAI_FAMILY, "Unexpected family")
+            address = self.address_of(host)
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, 0))]
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+class Benchmark:
+    """Collects timings and correctness checks for one benchmark run."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.results: list[dict[str, Any]] = []
+        self.checks: list[dict[str, Any]] = []
+
+    def record(self, resolver: str, count: int, operation: str, seconds: float):
+        self.results.append(dict(
+            resolver=resolver, hosts=count, operation=operation, seconds=seconds,
+        ))
+        print(f"{resolver:<30} {count:>4} {operation:<16} {seconds * 1000:9.1f} ms")
+
+    def check(self, resolver: str, name: str, passed: bool) -> None:
+        self.checks.append(dict(resolver=resolver, check=name, passed=passed))
+        if not passed:
+            print(f"FAILED: {name} ({resolver})")
+
+    def run_behavior(self, name: str, factory: Callable[..., Any]) -> None:
+        dns = StandInDNS(delay=0.0)
+        dns.delays["slow.invalid"] = 1.0
+        dns.failing.add("missing.invalid")
+        with mock.patch("socket.getaddrinfo", dns.getaddrinfo):
+            resolver = factory(ttl=60.0, timeout=0.2)
+            address = resolver.resolve("plc-a")
+            self.check(name, "resolves through getaddrinfo", (
+                address == dns.address_of("plc-a") and dns.calls == ["plc-a"]
+            ))
+            resolver.resolve("plc-a")
+            self.check(name, "cache hit skips the lookup", (
+                resolver.lookups == 1 and len(dns.calls) == 1
+            ))
+            resolver.clear()
+            resolver.resolve("plc-a")
+            self.check(name, "clear forgets addresses", resolver.lookups == 2)
+
+            expiring = factory(ttl=0.05, timeout=0.2)
+            expiring.resolve("plc-b")
+            time.sleep(0.1)
+            expiring.resolve("plc-b")
+            self.check(name, "expired entries are looked up again", (
+                expiring.lookups == 2
+            ))
+
+            start = time.perf_counter()
+            try:
+                resolver.resolve("slow.invalid")
+                timed_out = False
+            except TIMEOUT_ERRORS:
+                timed_out = True
+            elapsed = time.perf_counter() - start
+            self.check(name, "slow lookup times out", timed_out and elapsed < 0.6)
+
+            try:
+                resolver.resolve("missing.invalid")
+                failed = False
+            except socket.gaierror:
+                failed = True
+            self.check(name, "failed lookup raises", failed)
+            self.check(name, "failures are not cached", (
+                "missing.invalid" not in resolver._cache
+            ))
+
+            dns.calls.clear()
+            lookups_before = resolver.lookups
+            addresses, errors = resolver.resolve_all(
+                ["plc-a", "plc-c", "plc-c", "missing.invalid", "slow.invalid"]
+            )
+            self.check(name, "resolve_all addresses", addresses == {
+                "plc-a": dns.address_of("plc-a"),
+                "plc-c": dns.address_of("plc-c"),
+            })
+            self.check(name, "resolve_all errors", (
+                set(errors) == {"missing.invalid", "slow.invalid"}
+                and isinstance(errors["slow.invalid"], TIMEOUT_ERRORS)
+            ))
+            self.check(name, "resolve_all uses the cache and deduplicates", (
+                sorted(dns.calls) == ["missing.invalid", "plc-c", "slow.invalid"]
+                and resolver.lookups - lookups_before == 3
+            ))
+
+    def run_count(self, name: str, factory: Callable[..., Any], count: int) -> None:
+        hostnames = [f"plc-{idx}.example" for idx in range(count)]
+        expected = {hostname: StandInDNS.address_of(hostname) for hostname in hostnames}
+
+        dns = StandInDNS(delay=self.delay)
+        with mock.patch("socket.getaddrinfo", dns.getaddrinfo):
+            resolver = factory(timeout=5.0, max_workers=1)
+            start = time.perf_counter()
+            serial, _ = resolver.resolve_all(hostnames)
+            serial_seconds = time.perf_counter() - start
+        self.record(name, count, "one at a time", serial_seconds)
+
+        workers = 8
+        dns = StandInDNS(delay=self.delay)
+        with mock.patch("socket.getaddrinfo", dns.getaddrinfo):
+            resolver = factory(timeout=5.0, max_workers=workers)
+            start = time.perf_counter()
+            parallel, errors = resolver.resolve_all(hostnames)
+            seconds = time.perf_counter() - start
+            self.record(name, count, "resolve_all", seconds)
+
+            start = time.perf_counter()
+            cached, _ = resolver.resolve_all(hostnames)
+            self.record(name, count, "resolve_all cached", time.perf_counter() - start)
+
+        self.check(name, f"{count} addresses", (
+            serial == parallel == cached == expected and not errors
+        ))
+        self.check(name, f"{count} worker limit", dns.max_active <= workers)
+        self.check(name, f"{count} cached run skips lookups", (
+            resolver.lookups == count and len(dns.calls) == count
+        ))
+        if count > 1:
+            self.check(name, f"{count} parallel is faster", seconds < serial_seconds)
+
+    def to_json(self) -> dict[str, Any]:
+        return dict(
+            meta=dict(
+                python=platform.python_version(),
+                platform=platform.platform(),
+                timestamp=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                delay=self.delay,
+            ),
+            results=self.results,
+            checks=self.checks,
+        )
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the parser used for CLI argument parsing."""
+    parser = argparse.ArgumentParser(
+        prog="bench_hostname_resolver.py",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--counts", type=int, nargs="+", default=list(DEFAULT_COUNTS),
+        help="Numbers of hostnames to resolve",
+    )
+    parser.add_argument(
+        "--delay", type=float, default=0.02,
+        help="Seconds the stand-in DNS takes to answer each lookup",
+    )
+    parser.add_argument(
+        "--output", type=str, default="hostname_resolver_bench.json",
+        help="JSON file to write results to",
+    )
+    return parser
+
+
+def main(counts: list[int], delay: float, output: str) -> int:
+    bench = Benchmark(delay=delay)
+    for name, factory in RESOLVERS.items():
+        bench.run_behavior(name, factory)
+        for count in counts:
+            bench.run_count(name, factory, count)
+
+    Path(output).write_text(json.dumps(bench.to_json(), indent=2) + "\n")
+    print(f"Wrote results to {output}")
+    failed = [check for check in bench.checks if not check["passed"]]
+    print(f"{len(bench.checks) - len(failed)}/{len(bench.checks)} checks passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    args = parser.parse_args()
+    exit(main(
+        counts=args.counts,
+        delay=args.delay,
+        output=args.output,
+    ))
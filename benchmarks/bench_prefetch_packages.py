@@ -0,0 +1,415 @@
+"""
+Benchmark and sanity-check scripts/prefetch_packages.py.
+
+Builds a stand-in SLAC repository under a file:// URL: a packagesite
+catalog, several TC31-XAR builds, libraries with dependencies and tools.
+The catalog, dependency resolution, XAR build choice, each host's
+repository URL and the controller cache are checked against what the
+repository was built with, and a cold fetch is timed against a cached one.
+
+The script that moves staged files into a PLC's pkg cache is run locally
+with sh on temporary directories, and again through ansible on localhost
+when ansible is installed, to check how its results are read.  When rsync
+is installed, the rsync push is run through a stand-in ssh that executes
+the remote command locally; otherwise those checks are skipped.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import platform
+import shutil
+import stat
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT / "scripts"))
+
+import inventory_loader  # noqa: E402
+import prefetch_packages  # noqa: E402
+
+XAR_VERSION = "4026.14"
+XAR_BUILDS = (1, 3, 2)
+FAKE_SSH = """\
+#!/bin/sh
+# Stand-in for ssh: skip the options and host, run the command locally
+while [ $# -gt 0 ]; do
+  case "$1" in
+    -[Fiolp]) shift 2 ;;
+    -*) shift ;;
+    *) break ;;
+  esac
+done
+shift
+cd "$FAKE_PLC_HOME" && exec sh -c "$*"
+"""
+
+
+def make_package(name: str, version: str) -> bytes:
+    """Get the contents of a stand-in package file."""
+    return f"{name}-{version}\n".encode() * 64
+
+
+def build_repository(
+    root: Path, libraries: int, catalog_name: str = "packagesite.pkg"
+) -> dict[str, dict[str, Any]]:
+    """
+    Write a stand-in repository to root and return its manifests by name.
+
+    TC31-XAR depends on TF-Base, library N depends on library N - 1 and
+    the first library depends on TF-Base.
+    """
+    manifests = []
+
+    def add(name: str, version: str, deps: list[str]) -> None:
+        data = make_package(name, version)
+        repopath = f"All/{name}-{version}.pkg"
+        (root / "All").mkdir(parents=True, exist_ok=True)
+        (root / repopath).write_bytes(data)
+        manifests.append(dict(
+            name=name, version=version, repopath=repopath,
+            sum=hashlib.sha256(data).hexdigest(), pkgsize=len(data), deps=deps,
+        ))
+
+    add("TF-Base", "1.0", [])
+    for build in XAR_BUILDS:
+        add(prefetch_packages.XAR_PACKAGE, f"{XAR_VERSION}_{build}", ["TF-Base"])
+    for idx in range(libraries):
+        add(f"TC-Lib{idx}", "1.0", [f"TC-Lib{idx - 1}" if idx else "TF-Base"])
+    add("TC-Tool", "2.1", [])
+
+    catalog = "\n".join(json.dumps(manifest) for manifest in manifests).encode()
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:xz") as archive:
+        info = tarfile.TarInfo("packagesite.yaml")
+        info.size = len(catalog)
+        archive.addfile(info, io.BytesIO(catalog))
+    (root / catalog_name).write_bytes(buffer.getvalue())
+    by_name: dict[str, dict[str, Any]] = {}
+    for manifest in manifests:
+        by_name[manifest["name"]] = manifest
+    return by_name
+
+
+class Benchmark:
+    """Collects timings and correctness checks for one benchmark run."""
+
+    def __init__(self, workdir: Path, libraries: int):
+        self.workdir = workdir
+        self.libraries = libraries
+        self.results: list[dict[str, Any]] = []
+        self.checks: list[dict[str, Any]] = []
+        self.skipped: list[str] = []
+
+    def record(self, operation: str, seconds: float) -> None:
+        self.results.append(dict(operation=operation, seconds=seconds))
+        print(f"{operation:<28} {seconds * 1000:10.1f} ms")
+
+    def check(self, name: str, passed: bool) -> None:
+        self.checks.append(dict(check=name, passed=passed))
+        if not passed:
+            print(f"FAILED: {name}")
+
+    def skip(self, reason: str) -> None:
+        self.skipped.append(reason)
+        print(f"Skipped: {reason}")
+
+    def run(self) -> None:
+        repo = self.workdir / "repo" / "14" / XAR_VERSION
+        manifests = build_repository(repo, self.libraries)
+        repo_url = repo.as_uri()
+
+        start = time.perf_counter()
+        catalog = prefetch_packages.load_catalog(repo_url)
+        self.record("load_catalog", time.perf_counter() - start)
+        self.check("catalog loads from packagesite.pkg", sorted(catalog) == sorted(
+            manifests
+        ))
+
+        fallback = self.workdir / "repo-txz"
+        build_repository(fallback, 1, catalog_name="packagesite.txz")
+        self.check(
+            "catalog falls back to packagesite.txz",
+            "TC-Lib0" in prefetch_packages.load_catalog(fallback.as_uri()),
+        )
+        try:
+            prefetch_packages.load_catalog((self.workdir / "nowhere").as_uri())
+            self.check("missing catalog is reported", False)
+        except RuntimeError:
+            self.check("missing catalog is reported", True)
+
+        xar = prefetch_packages.pick_xar(
+            catalog[prefetch_packages.XAR_PACKAGE], XAR_VERSION
+        )
+        self.check(
+            "newest XAR build picked",
+            xar is not None and xar.version == f"{XAR_VERSION}_{max(XAR_BUILDS)}",
+        )
+
+        last_lib = f"TC-Lib{self.libraries - 1}"
+        resolved, missing = prefetch_packages.resolve_packages(
+            catalog, [last_lib, "TC-Tool", "Not-There"], XAR_VERSION
+        )
+        expected = {
+            prefetch_packages.XAR_PACKAGE, "TF-Base", "TC-Tool",
+            *(f"TC-Lib{idx}" for idx in range(self.libraries)),
+        }
+        self.check("dependencies resolved", set(resolved) == expected)
+        self.check("missing names reported", missing == ["Not-There"])
+        _, missing = prefetch_packages.resolve_packages(catalog, [], "4024.99")
+        self.check(
+            "missing XAR version reported",
+            missing == [f"{prefetch_packages.XAR_PACKAGE}-4024.99"],
+        )
+
+        cache = prefetch_packages.PackageCache(self.workdir / "cache")
+        entries = list(resolved.values())
+        start = time.perf_counter()
+        downloaded = sum(cache.fetch(repo_url, entry) for entry in entries)
+        self.record("fetch cold", time.perf_counter() - start)
+        self.check("first fetch downloads every file", downloaded == len(entries))
+        self.check("cached files match sha256", all(
+            hashlib.sha256(cache.path_for(entry.sha256).read_bytes()).hexdigest()
+            == entry.sha256
+            for entry in entries
+        ))
+        start = time.perf_counter()
+        downloaded = sum(cache.fetch(repo_url, entry) for entry in entries)
+        self.record("fetch cached", time.perf_counter() - start)
+        self.check("second fetch uses the cache", downloaded == 0)
+
+        tampered = catalog["TC-Tool"][-1]._replace(sha256="0" * 64)
+        try:
+            cache.fetch(repo_url, tampered)
+            self.check("sha256 mismatch rejected", False)
+        except ValueError:
+            self.check("sha256 mismatch rejected", True)
+        self.check("rejected file not cached", not cache.has(tampered))
+
+        self.check_host_repos()
+        self.check_install_script(entries, cache)
+        self.check_ansible_results(entries, cache)
+        self.check_rsync_push(entries, cache)
+
+    def check_host_repos(self) -> None:
+        mirror = prefetch_packages.DEFAULT_MIRROR
+        unpinned = dict(fixed_xar_version=XAR_VERSION, set_fixed_xar=False)
+        self.check(
+            "repository follows fixed_xar_version without set_fixed_xar",
+            prefetch_packages.host_repo_url(mirror, unpinned, "14").endswith(
+                f"/tcbsd/14/{XAR_VERSION}"
+            ),
+        )
+        self.check(
+            "XAR pinned only with set_fixed_xar",
+            prefetch_packages.host_requirements(unpinned)[0] == ""
+            and prefetch_packages.host_requirements(
+                dict(unpinned, set_fixed_xar=True)
+            )[0] == XAR_VERSION,
+        )
+
+        facts_dir = self.workdir / "cache-dir" / "facts"
+        facts_dir.mkdir(parents=True)
+        (facts_dir / "plc-13.json").write_text(
+            json.dumps(dict(facts=dict(freebsd_version="13.2-RELEASE-p4")))
+        )
+        saved = os.environ.get(inventory_loader.CACHE_DIR_ENV)
+        os.environ[inventory_loader.CACHE_DIR_ENV] = str(facts_dir.parent)
+        try:
+            majors = [
+                prefetch_packages.host_os_major(hostname, "14")
+                for hostname in ("plc-13", "plc-no-facts")
+            ]
+        finally:
+            if saved is None:
+                del os.environ[inventory_loader.CACHE_DIR_ENV]
+            else:
+                os.environ[inventory_loader.CACHE_DIR_ENV] = saved
+        self.check("OS major from each host's cached facts", majors == ["13", "14"])
+
+    def stage(self, entries, cache, staging: Path, pkg_cache: Path) -> None:
+        """Lay out a staging directory and pkg cache as a PLC would have them."""
+        staging.mkdir(parents=True)
+        pkg_cache.mkdir(parents=True)
+        for entry in entries:
+            shutil.copy(cache.path_for(entry.sha256), staging / entry.cache_name)
+        # Already in the pkg cache, with other contents that must be kept
+        (pkg_cache / entries[0].cache_name).write_bytes(b"kept")
+        (staging / "link.pkg").symlink_to("/etc/hostname")
+
+    def check_install_script(self, entries, cache) -> None:
+        staging = self.workdir / "plc" / "home" / prefetch_packages.STAGING_DIR
+        pkg_cache = self.workdir / "plc" / "var-cache-pkg"
+        self.stage(entries, cache, staging, pkg_cache)
+        script = prefetch_packages.install_script(str(staging), str(pkg_cache), "")
+
+        start = time.perf_counter()
+        proc = subprocess.run(["sh", "-c", script], capture_output=True, text=True)
+        self.record("install script", time.perf_counter() - start)
+        installed = [line for line in proc.stdout.splitlines() if line]
+        self.check("install script succeeds", proc.returncode == 0)
+        self.check("new files installed", installed == [
+            f"installed {entry.cache_name}"
+            for entry in sorted(entries[1:], key=lambda entry: entry.cache_name)
+        ])
+        self.check(
+            "cached files kept",
+            (pkg_cache / entries[0].cache_name).read_bytes() == b"kept",
+        )
+        self.check("symlinks not followed", not (pkg_cache / "link.pkg").exists())
+        self.check("installed files are 0644", all(
+            stat.S_IMODE((pkg_cache / entry.cache_name).stat().st_mode) == 0o644
+            for entry in entries[1:]
+        ))
+        self.check("no temporary files left", not list(pkg_cache.glob("*.tmp")))
+        self.check("staging directory removed", not staging.exists())
+        proc = subprocess.run(["sh", "-c", script], capture_output=True, text=True)
+        self.check(
+            "install script without staging is a no-op",
+            proc.returncode == 0 and not proc.stdout.strip(),
+        )
+
+    def check_ansible_results(self, entries, cache) -> None:
+        if shutil.which("ansible") is None:
+            self.skip("ansible is not installed; not reading results through it")
+            return
+        staging = self.workdir / "ansible" / "staging"
+        pkg_cache = self.workdir / "ansible" / "var-cache-pkg"
+        self.stage(entries, cache, staging, pkg_cache)
+        script = prefetch_packages.install_script(str(staging), str(pkg_cache), "")
+        env = dict(
+            os.environ,
+            ANSIBLE_STDOUT_CALLBACK="ansible.builtin.minimal",
+            ANSIBLE_PYTHON_INTERPRETER="auto_silent",
+        )
+        hosts = ["localhost", "unreachable.invalid"]
+        command = [
+            "ansible", ",".join(hosts), "-i", ",".join(hosts) + ",",
+            "-e", "ansible_connection="
+            "{{ 'local' if inventory_hostname == 'localhost' else 'ssh' }}",
+            "-m", "ansible.builtin.shell", "-a", script,
+        ]
+        proc = subprocess.run(
+            command, cwd=self.workdir, env=env, stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        )
+        results = prefetch_packages.parse_install_output(
+            proc.stdout, hosts + ["never-run"]
+        )
+        self.check("ansible result read", results["localhost"] == dict(
+            ok=True, installed=len(entries) - 1, error="",
+        ))
+        self.check(
+            "unreachable host reported",
+            not results["unreachable.invalid"]["ok"]
+            and results["unreachable.invalid"]["error"].startswith("UNREACHABLE"),
+        )
+        self.check(
+            "missing host reported",
+            results["never-run"]["error"] == "no result from ansible",
+        )
+
+    def check_rsync_push(self, entries, cache) -> None:
+        if shutil.which("rsync") is None:
+            self.skip("rsync is not installed; not running the rsync push")
+            return
+        home = self.workdir / "rsync" / "home"
+        pkg_cache = self.workdir / "rsync" / "var-cache-pkg"
+        bin_dir = self.workdir / "rsync" / "bin"
+        for path in (home, pkg_cache, bin_dir):
+            path.mkdir(parents=True)
+        ssh = bin_dir / "ssh"
+        ssh.write_text(FAKE_SSH)
+        ssh.chmod(0o755)
+        already = entries[: len(entries) // 2]
+        for entry in already:
+            shutil.copy(cache.path_for(entry.sha256), pkg_cache / entry.cache_name)
+
+        saved = dict(os.environ)
+        os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+        os.environ["FAKE_PLC_HOME"] = str(home)
+        try:
+            start = time.perf_counter()
+            result = prefetch_packages.push_to_host(
+                "plc.invalid", entries, cache, private_key="unused",
+                pkg_cache_dir=str(pkg_cache),
+            )
+            self.record("rsync push", time.perf_counter() - start)
+        finally:
+            os.environ.clear()
+            os.environ.update(saved)
+
+        staging = home / prefetch_packages.STAGING_DIR
+        missing = sorted(entry.cache_name for entry in entries[len(already):])
+        self.check("rsync push succeeds", result["ok"])
+        self.check("only missing files sent", sorted(result["sent"]) == missing)
+        self.check("staged files are complete", all(
+            (staging / name).is_file() and not (staging / name).is_symlink()
+            for name in missing
+        ))
+        script = prefetch_packages.install_script(str(staging), str(pkg_cache), "")
+        subprocess.run(["sh", "-c", script], capture_output=True)
+        self.check("pushed files reach the pkg cache", all(
+            (pkg_cache / entry.cache_name).is_file() for entry in entries
+        ))
+
+    def to_json(self) -> dict[str, Any]:
+        return dict(
+            meta=dict(
+                python=platform.python_version(),
+                platform=platform.platform(),
+                timestamp=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                libraries=self.libraries,
+            ),
+            results=self.results,
+            checks=self.checks,
+            skipped=self.skipped,
+        )
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the parser used for CLI argument parsing."""
+    parser = argparse.ArgumentParser(
+        prog="bench_prefetch_packages.py",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--libraries", type=int, default=200,
+        help="Number of chained library packages in the stand-in repository",
+    )
+    parser.add_argument(
+        "--output", type=str, default="prefetch_packages_bench.json",
+        help="JSON file to write results to",
+    )
+    return parser
+
+
+def main(libraries: int, output: str) -> int:
+    with tempfile.TemporaryDirectory(prefix="tcbsd-prefetch-bench-") as workdir:
+        bench = Benchmark(Path(workdir), libraries=max(libraries, 1))
+        bench.run()
+
+    Path(output).write_text(json.dumps(bench.to_json(), indent=2) + "\n")
+    print(f"Wrote results to {output}")
+    failed = [check for check in bench.checks if not check["passed"]]
+    print(f"{len(bench.checks) - len(failed)}/{len(bench.checks)} checks passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    args = parser.parse_args()
+    exit(main(
+        libraries=args.libraries,
+        output=args.output,
+    ))
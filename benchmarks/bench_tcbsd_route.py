@@ -0,0 +1,382 @@
+"""
+Benchmark and sanity-check the tcbsd_route module.
+
+Generates StaticRoutes.xml files of increasing size, times the module's
+load/match/serialize/save functions and whole module runs on add, modify,
+conflict, no-op and removal mixes, and checks every result against a
+straightforward list-scan reference so that speedups can be trusted.
+
+Results are written as JSON.  Pass a previous results file as --baseline to
+flag operations that got slower.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from generate_static_routes import RouteSpec, make_route, write_static_routes
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+MODULE_PATH = REPO_ROOT / "library" / "tcbsd_route.py"
+sys.path.insert(0, str(MODULE_PATH.parent))
+
+import tcbsd_route  # noqa: E402
+
+DEFAULT_SIZES = (10, 100, 1_000, 10_000, 100_000)
+CASES = ("add", "modify", "conflict", "noop", "remove")
+
+
+def make_requests(case: str, size: int, count: int) -> list[RouteSpec]:
+    """
+    Get ``count`` requested routes for ``case`` against a file of ``size``.
+
+    Requests that refer to existing routes are spread across the whole file.
+    """
+    count = min(count, size)
+    step = max(size // max(count, 1), 1)
+    existing = [make_route(index * step) for index in range(count)]
+    if case == "add":
+        return [make_route(index, network=11) for index in range(count)]
+    if case == "modify":
+        return [route._replace(flags="65") for route in existing]
+    if case == "conflict":
+        # A new name, with the address of one route and the Net ID of another
+        return [
+            RouteSpec(
+                name=f"conflict-{index:06d}",
+                address=route.address,
+                net_id=make_route((index * step + step // 2) % size).net_id,
+            )
+            for index, route in enumerate(existing)
+        ]
+    if case in ("noop", "remove"):
+        return existing
+    raise ValueError(f"Unknown case: {case}")
+
+
+def state_for(case: str) -> str:
+    return "absent" if case == "remove" else "present"
+
+
+def to_routes(specs: list[RouteSpec]) -> list[tcbsd_route.Route]:
+    return [tcbsd_route.Route(**spec.as_task_dict()) for spec in specs]
+
+
+def route_key(route: tcbsd_route.Route) -> tuple[str, ...]:
+    return (route.name, route.address, route.net_id, route.type_, route.flags)
+
+
+def reference_apply(
+    routes: list[tcbsd_route.Route],
+    state: str,
+    requests: list[tcbsd_route.Route],
+) -> dict[str, int]:
+    """The original list-scanning algorithm, used to check the results."""
+    result = dict(routes_added=0, routes_removed=0, routes_modified=0)
+
+    def matches(existing, route):
+        return (
+            existing.name == route.name
+            or existing.net_id == route.net_id
+            or existing.address == route.address
+        )
+
+    for request in requests:
+        existing = [rt for rt in routes if matches(rt, request)]
+        if state == "absent":
+            routes[:] = [rt for rt in routes if not matches(rt, request)]
+            result["routes_removed"] += len(existing)
+            continue
+        if not existing:
+            routes.append(request)
+            result["routes_added"] += 1
+            continue
+        by_name = [rt for rt in existing if rt.name == request.name]
+        keep = by_name[0] if by_name else None
+        if keep is None:
+            routes.append(request)
+            result["routes_added"] += 1
+        for rt in existing:
+            if rt is keep:
+                if rt != request:
+                    result["routes_modified"] += 1
+                    rt.name, rt.address, rt.net_id = (
+                        request.name, request.address, request.net_id
+                    )
+                    rt.type_, rt.flags = request.type_, request.flags
+            else:
+                routes.remove(rt)
+                result["routes_removed"] += 1
+    return result
+
+
+def time_call(
+    func: Callable[[Any], Any],
+    setup: Callable[[], Any] | None = None,
+    repeat: int = 3,
+) -> dict[str, float]:
+    """Time ``func(setup())`` ``repeat`` times, excluding the setup."""
+    elapsed = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        start = time.perf_counter()
+        func(arg)
+        elapsed.append(time.perf_counter() - start)
+    return dict(
+        seconds_min=min(elapsed),
+        seconds_median=statistics.median(elapsed),
+    )
+
+
+def run_module(filename: Path, state: str, routes: list[RouteSpec], **options):
+    """Run the module end to end in a fresh interpreter, as Ansible would."""
+    args = dict(
+        file=str(filename),
+        state=state,
+        routes=[route.as_task_dict() for route in routes],
+        **options,
+    )
+    args_path = filename.with_suffix(".args.json")
+    args_path.write_text(json.dumps({"ANSIBLE_MODULE_ARGS": args}))
+    proc = subprocess.run(
+        [sys.executable, str(MODULE_PATH), str(args_path)],
+        capture_output=True,
+        text=True,
+    )
+    result = json.loads(proc.stdout)
+    if result.get("failed"):
+        raise RuntimeError(f"Module failed: {result.get('msg')}")
+    return result
+
+
+class Benchmark:
+    """Collects timings and correctness checks for one benchmark run."""
+
+    def __init__(self, workdir: Path, requests: int, repeat: int):
+        self.workdir = workdir
+        self.requests = requests
+        self.repeat = repeat
+        self.results: list[dict[str, Any]] = []
+        self.checks: list[dict[str, Any]] = []
+
+    def record(self, size: int, case: str, operation: str, timing: dict) -> None:
+        self.results.append(
+            dict(routes=size, case=case, operation=operation, **timing)
+        )
+        print(
+            f"{size:>7} {case:<9} {operation:<26} "
+            f"{timing['seconds_median'] * 1000:10.3f} ms"
+        )
+
+    def check(self, size: int, case: str, name: str, passed: bool) -> None:
+        self.checks.append(dict(routes=size, case=case, check=name, passed=passed))
+        if not passed:
+            print(f"FAILED: {name} ({size} routes, {case})")
+
+    def run_size(self, size: int) -> None:
+        source = write_static_routes(self.workdir / f"routes-{size}.xml", size)
+        target = self.workdir / f"target-{size}.xml"
+
+        self.record(size, "-", "load_routes_from_file", time_call(
+            lambda _: tcbsd_route.load_routes_from_file(source),
+            repeat=self.repeat,
+        ))
+        loaded = tcbsd_route.load_routes_from_file(source)
+        self.check(size, "-", "load count", len(loaded) == size)
+
+        table = tcbsd_route.RouteTable(loaded)
+        self.record(size, "-", "routes_to_xml", time_call(
+            lambda _: tcbsd_route.routes_to_xml(table), repeat=self.repeat,
+        ))
+
+        for case in CASES:
+            self.run_case(size, case, source, target)
+
+    def run_case(self, size: int, case: str, source: Path, target: Path) -> None:
+        specs = make_requests(case, size, self.requests)
+        state = state_for(case)
+
+        def fresh_table(_=None):
+            return tcbsd_route.RouteTable(tcbsd_route.load_routes_from_file(source))
+
+        def apply_all(table):
+            operation = (
+                tcbsd_route.remove_route_if_existing if state == "absent"
+                else tcbsd_route.ensure_route_exists
+            )
+            result = dict(routes_added=0, routes_removed=0, routes_modified=0)
+            for route in to_routes(specs):
+                tcbsd_route.combine_results(result, operation(table, route))
+            return result
+
+        operation_name = (
+            "remove_route_if_existing" if state == "absent"
+            else "ensure_route_exists"
+        )
+        self.record(size, case, operation_name, time_call(
+            apply_all, setup=fresh_table, repeat=self.repeat,
+        ))
+
+        # Correctness against the list-scan reference
+        table = fresh_table()
+        counts = apply_all(table)
+        expected_routes = tcbsd_route.load_routes_from_file(source)
+        expected = reference_apply(expected_routes, state, to_routes(specs))
+        expected_keys = [route_key(route) for route in expected_routes]
+        self.check(size, case, "match counts", counts == expected)
+        self.check(
+            size, case, "match routes",
+            [route_key(route) for route in table] == expected_keys,
+        )
+
+        def copy_source(_=None):
+            shutil.copyfile(source, target)
+
+        self.record(size, case, "save_routes_to_file", time_call(
+            lambda _: tcbsd_route.save_routes_to_file(str(target), table),
+            setup=copy_source, repeat=self.repeat,
+        ))
+
+        for patch in (False, True):
+            label = "run_module[patch]" if patch else "run_module"
+            results = []
+
+            def run(_):
+                results.append(run_module(target, state, specs, patch=patch))
+
+            self.record(size, case, label, time_call(
+                run, setup=copy_source, repeat=self.repeat,
+            ))
+            result = results[-1]
+            self.check(size, case, f"{label} counts", all(
+                result[key] == value for key, value in expected.items()
+            ))
+            reloaded = tcbsd_route.load_routes_from_file(str(target))
+            self.check(
+                size, case, f"{label} file",
+                [route_key(route) for route in reloaded] == expected_keys,
+            )
+            self.check(
+                size, case, f"{label} no-op unchanged",
+                case != "noop" or target.read_bytes() == source.read_bytes(),
+            )
+
+    def to_json(self) -> dict[str, Any]:
+        return dict(
+            meta=dict(
+                python=platform.python_version(),
+                lxml=".".join(str(part) for part in tcbsd_route.lxml.etree.LXML_VERSION),
+                platform=platform.platform(),
+                timestamp=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                requests=self.requests,
+                repeat=self.repeat,
+            ),
+            results=self.results,
+            checks=self.checks,
+        )
+
+
+def find_regressions(
+    results: list[dict[str, Any]],
+    baseline: list[dict[str, Any]],
+    tolerance: float,
+) -> list[str]:
+    """Describe operations whose median time grew by more than ``tolerance``."""
+    before = {
+        (entry["routes"], entry["case"], entry["operation"]): entry["seconds_median"]
+        for entry in baseline
+    }
+    regressions = []
+    for entry in results:
+        key = (entry["routes"], entry["case"], entry["operation"])
+        if key not in before or before[key] <= 0:
+            continue
+        ratio = entry["seconds_median"] / before[key]
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{entry['operation']} ({entry['routes']} routes, {entry['case']}): "
+                f"{ratio:.2f}x slower"
+            )
+    return regressions
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the parser used for CLI argument parsing."""
+    parser = argparse.ArgumentParser(
+        prog="bench_tcbsd_route.py",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+        help="Numbers of routes in the generated files",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=50,
+        help="Number of routes requested per case",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--output", type=str, default="tcbsd_route_bench.json",
+        help="JSON file to write results to",
+    )
+    parser.add_argument(
+        "--baseline", type=str, default="",
+        help="Previous results to compare against",
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25,
+        help="Allowed slowdown relative to the baseline, as a fraction",
+    )
+    return parser
+
+
+def main(
+    sizes: list[int],
+    requests: int,
+    repeat: int,
+    output: str,
+    baseline: str = "",
+    tolerance: float = 0.25,
+) -> int:
+    with tempfile.TemporaryDirectory() as workdir:
+        bench = Benchmark(Path(workdir), requests=requests, repeat=repeat)
+        for size in sizes:
+            bench.run_size(size)
+
+    report = bench.to_json()
+    Path(output).write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Wrote results to {output}")
+
+    failed = [check for check in bench.checks if not check["passed"]]
+    regressions = []
+    if baseline:
+        previous = json.loads(Path(baseline).read_text())
+        regressions = find_regressions(report["results"], previous["results"], tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+
+    print(f"{len(bench.checks) - len(failed)}/{len(bench.checks)} checks passed")
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    args = parser.parse_args()
+    exit(main(
+        sizes=args.sizes,
+        requests=args.requests,
+        repeat=args.repeat,
+        output=args.output,
+        baseline=args.baseline,
+        tolerance=args.tolerance,
+    ))
@@ -0,0 +1,104 @@
+"""
+Generate synthetic StaticRoutes.xml files for benchmarking tcbsd_route.
+
+The output follows the tab-indented layout TwinCAT/BSD writes itself.
+"""
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+from typing import Iterator, NamedTuple
+
+HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<TcConfig xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n'
+    "\t<RemoteConnections>\n"
+)
+FOOTER = "\t</RemoteConnections>\n</TcConfig>\n"
+ROUTE = (
+    "\t\t<Route>\n"
+    "\t\t\t<Name>{name}</Name>\n"
+    "\t\t\t<Address>{address}</Address>\n"
+    "\t\t\t<NetId>{net_id}</NetId>\n"
+    "\t\t\t<Type>{type}</Type>\n"
+    "\t\t\t<Flags>{flags}</Flags>\n"
+    "\t\t</Route>\n"
+)
+
+
+class RouteSpec(NamedTuple):
+    """A route as it appears in StaticRoutes.xml or a tcbsd_route task."""
+
+    name: str
+    address: str
+    net_id: str
+    type: str = "TCP_IP"
+    flags: str = "64"
+
+    def as_task_dict(self) -> dict[str, str]:
+        """Get the route as it would be listed in tc_add_missing_static_routes."""
+        return dict(
+            name=self.name,
+            address=self.address,
+            net_id=self.net_id,
+            type=self.type,
+            flags=self.flags,
+        )
+
+
+def address_for(index: int, network: int = 10) -> str:
+    """Get a unique IPv4 address for route number ``index``."""
+    return f"{network}.{(index >> 16) & 0xFF}.{(index >> 8) & 0xFF}.{index & 0xFF}"
+
+
+def make_route(index: int, network: int = 10) -> RouteSpec:
+    """Get the synthetic route number ``index``."""
+    address = address_for(index, network)
+    return RouteSpec(
+        name=f"route-{network}-{index:06d}",
+        address=address,
+        net_id=f"{address}.1.1",
+    )
+
+
+def iter_routes(count: int, network: int = 10) -> Iterator[RouteSpec]:
+    """Yield ``count`` synthetic routes with distinct names and addresses."""
+    for index in range(count):
+        yield make_route(index, network)
+
+
+def render_static_routes(routes: Iterator[RouteSpec]) -> str:
+    """Render routes as StaticRoutes.xml contents."""
+    return "".join(
+        (HEADER, "".join(ROUTE.format(**route._asdict()) for route in routes), FOOTER)
+    )
+
+
+def write_static_routes(path: str | Path, count: int, network: int = 10) -> Path:
+    """Write a StaticRoutes.xml with ``count`` synthetic routes to ``path``."""
+    path = Path(path)
+    path.write_text(render_static_routes(iter_routes(count, network)))
+    return path
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the parser used for CLI argument parsing."""
+    parser = argparse.ArgumentParser(
+        prog="generate_static_routes.py",
+        description=__doc__,
+    )
+    parser.add_argument("count", type=int, help="Number of routes")
+    parser.add_argument("output", type=str, help="StaticRoutes.xml to write")
+    return parser
+
+
+def main(count: int, output: str) -> int:
+    path = write_static_routes(output, count)
+    print(f"Wrote {count} routes to {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    args = parser.parse_args()
+    exit(main(count=args.count, output=args.output))
@@ -0,0 +1,204 @@
+"""
+AMS Net ID filters for the playbooks.
+
+``ip_to_ams_net_id`` resolves a PLC's hostname on the controller and appends
+``.1.1``.  Addresses are kept for a few minutes in a JSON file in the
+controller cache directory, shared by every host and fork of a play, so that
+a fleet run does not look the same name up over and over.  Lookups have a
+timeout and run outside the lock file, which is only held to read and
+update the cache.
+
+``with_ams_net_ids`` fills in the ``net_id`` of static routes the same way,
+so that their hostnames go through the same cache.
+"""
+from __future__ import absolute_import, division, print_function
+
+import contextlib
+import fcntl
+import json
+import os
+import socket
+import tempfile
+import time
+
+import ansible.module_utils
+from ansible.errors import AnsibleFilterError
+from ansible.utils.display import Display
+
+# Plugins run on the controller, where ansible.module_utils does not include
+# this repository's module_utils unless it is added here.
+_MODULE_UTILS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "module_utils"
+)
+if _MODULE_UTILS not in ansible.module_utils.__path__:
+    ansible.module_utils.__path__.append(_MODULE_UTILS)
+
+from ansible.module_utils.tcbsd_cache import default_cache_dir  # noqa: E402
+from ansible.module_utils.tcbsd_dns import (  # noqa: E402
+    ResolutionError,
+    lookup_ipv4_address,
+    lookup_with_timeout,
+)
+
+__metaclass__ = type
+
+display = Display()
+
+# Short, so that a re-addressed PLC is picked up on the next run; the
+# playbook passes tc_dns_cache_ttl
+DEFAULT_DNS_CACHE_TTL = 300
+# Seconds to wait for a single lookup
+DNS_TIMEOUT = 5.0
+
+# Addresses already looked up by this process
+_addresses = {}
+
+
+def parse_ipv4(text):
+    """Get the four octets of a dotted IPv4 address, or None."""
+    parts = str(text).strip().split(".")
+    if len(parts) != 4 or not all(part.isdigit() for part in parts):
+        return None
+    octets = [int(part) for part in parts]
+    if not all(0 <= octet <= 255 for octet in octets):
+        return None
+    return octets
+
+
+def _read_cache(path):
+    try:
+        with open(path, "r") as fp:
+            entries = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return {}
+    return entries if isinstance(entries, dict) else {}
+
+
+def _write_cache(path, entries):
+    fd, temp_name = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as fp:
+        json.dump(entries, fp, indent=2, sort_keys=True)
+    os.rename(temp_name, path)
+
+
+@contextlib.contextmanager
+def _locked(path):
+    """Hold the cache's lock file, or yield False if it cannot be used."""
+    try:
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        lock = open(path + ".lock", "a")
+    except (IOError, OSError) as ex:
+        display.vvv("ip_to_ams_net_id: not caching addresses (%s)" % (ex,))
+        yield False
+        return
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield True
+    finally:
+        lock.close()
+
+
+def _fresh(entry, now, ttl):
+    return (
+        isinstance(entry, dict)
+        and parse_ipv4(entry.get("address", "")) is not None
+        and 0 <= now - entry.get("resolved_at", 0) <= ttl
+    )
+
+
+def resolve_hostname(
+    hostname, ttl=DEFAULT_DNS_CACHE_TTL, cache_dir=None, timeout=DNS_TIMEOUT
+):
+    """
+    Resolve ``hostname`` to an IPv4 address through the persisted cache.
+
+    Raises
+    ------
+    AnsibleFilterError
+        If the hostname does not resolve within ``timeout`` seconds.
+    """
+    now = time.time()
+    entry = _addresses.get(hostname)
+    if _fresh(entry, now, ttl):
+        return entry["address"]
+
+    path = os.path.join(cache_dir or default_cache_dir(), "dns.json")
+    with _locked(path) as cached:
+        entry = _read_cache(path).get(hostname) if cached else None
+    if _fresh(entry, now, ttl):
+        _addresses[hostname] = entry
+        return entry["address"]
+
+    try:
+        address = lookup_with_timeout(lookup_ipv4_address, hostname, timeout)
+    except (ResolutionError, socket.error, UnicodeError) as ex:
+        raise AnsibleFilterError(
+            "ip_to_ams_net_id: unable to resolve %r: %s" % (hostname, ex)
+        )
+    entry = dict(address=address, resolved_at=now)
+    _addresses[hostname] = entry
+
+    # Merge into what other forks may have written meanwhile
+    with _locked(path) as cached:
+        if cached:
+            entries = _read_cache(path)
+            entries[hostname] = entry
+            try:
+                _write_cache(path, entries)
+            except (IOError, OSError) as ex:
+                display.vvv("ip_to_ams_net_id: unable to cache %s (%s)" % (path, ex))
+    return address
+
+
+def ip_to_ams_net_id(host, cache_ttl=DEFAULT_DNS_CACHE_TTL):
+    """
+    Get the AMS Net ID for a host: its IPv4 address plus ``.1.1``.
+
+    Parameters
+    ----------
+    host : str
+        An IPv4 address or a hostname to resolve on the controller.
+    cache_ttl : int, optional
+        Use a cached address if it was resolved at most this many seconds ago.
+    """
+    host = str(host).strip()
+    if not host:
+        raise AnsibleFilterError("ip_to_ams_net_id: no hostname given")
+    if parse_ipv4(host) is not None:
+        address = host
+    else:
+        try:
+            ttl = int(cache_ttl)
+        except (TypeError, ValueError):
+            raise AnsibleFilterError("ip_to_ams_net_id: cache_ttl must be an integer")
+        address = resolve_hostname(host, ttl=ttl)
+    return "%s.1.1" % (address,)
+
+
+def with_ams_net_ids(routes, cache_ttl=DEFAULT_DNS_CACHE_TTL):
+    """
+    Fill in the ``net_id`` of each tcbsd_route route that has none.
+
+    Routes are copied, not modified.  Anything that is not a route with an
+    address is passed through for tcbsd_route to report.
+    """
+    if not routes:
+        return []
+    result = []
+    for route in routes:
+        if isinstance(route, dict) and route.get("address"):
+            if not route.get("net_id"):
+                net_id = ip_to_ams_net_id(route["address"], cache_ttl)
+                route = dict(route, net_id=net_id)
+        result.append(route)
+    return result
+
+
+class FilterModule(object):
+    def filters(self):
+        return {
+            "ip_to_ams_net_id": ip_to_ams_net_id,
+            "with_ams_net_ids": with_ams_net_ids,
+        }
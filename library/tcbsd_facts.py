@@ -0,0 +1,326 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import, division, print_function
+
+import re
+
+import lxml
+import lxml.etree
+from ansible.module_utils.basic import AnsibleModule
+
+__metaclass__ = type
+
+# NOTE: like tcbsd_route, this needs to remain Python 2 compatible.
+
+
+DOCUMENTATION = r"""
+---
+module: tcbsd_facts
+
+short_description: Gather TwinCAT/BSD facts in one call
+
+version_added: "1.0.0"
+
+description:
+    - Gathers the TwinCAT/BSD state the provision playbook depends on in a
+      single module run, in place of separate command and shell tasks and
+      the full C(setup) fact gathering.
+    - Covers the TwinCAT run/config mode, the installed TC31-XAR version,
+      the AmsNetId and memory settings from TcRegistry.xml, the number of
+      static routes, C(freebsd-version) and the interface addresses.
+    - A probe that fails does not fail the module; its fact is left empty
+      and the error is listed under C(tcbsd.errors).
+    - The action plugin of the same name can answer from a controller-side
+      cache instead, see C(cache_ttl).
+
+options:
+    registry_path:
+        description:
+            - Location of TcRegistry.xml.
+        required: false
+        type: str
+        default: /usr/local/etc/TwinCAT/3.1/TcRegistry.xml
+    routes_path:
+        description:
+            - Location of StaticRoutes.xml.
+        required: false
+        type: str
+        default: /usr/local/etc/TwinCAT/3.1/Target/StaticRoutes.xml
+    cache_ttl:
+        description:
+            - Handled by the action plugin on the controller.  If facts for
+              this host were gathered less than this many seconds ago, they
+              are returned from the cache without contacting the host.
+            - C(0) always gathers.  Fresh facts are always cached.
+        required: false
+        type: int
+        default: 0
+
+author:
+    - klauer (@klauer)
+"""
+
+EXAMPLES = r"""
+- name: Gather TwinCAT/BSD facts
+  tcbsd_facts:
+
+- name: Assert that the PLC is in CONFIG mode
+  ansible.builtin.assert:
+    that: ansible_facts.tcbsd.mode == "CONFIG"
+
+- name: Use facts up to an hour old for a read-only check
+  tcbsd_facts:
+    cache_ttl: 3600
+"""
+
+RETURN = r"""
+ansible_facts:
+    description: Facts to add to ansible_facts
+    returned: always
+    type: complex
+    contains:
+        tcbsd:
+            description: TwinCAT/BSD state of the host
+            type: dict
+            sample:
+                mode: CONFIG
+                mode_output: "Current mode: CONFIG"
+                xar_version: "4026.3.55_1"
+                ams_net_id: "172.21.148.1.1.1"
+                locked_mem_size: "33554432"
+                heap_mem_size_mb: "2048"
+                route_count: 3
+                freebsd_version: "14.1-RELEASE-p5"
+                interfaces:
+                    igb0:
+                        ether: "00:01:05:aa:bb:cc"
+                        ipv4:
+                            - address: 172.21.148.1
+                              netmask: "0xffffff00"
+                              broadcast: 172.21.148.255
+                        ipv6: []
+                        status: active
+                errors: {}
+cached:
+    description: Whether the facts came from the controller-side cache
+    type: bool
+    returned: always
+    sample: false
+"""
+
+
+XAR_PACKAGE = "TC31-XAR"
+SYSTEM_KEY = "HKLM/Software/Beckhoff/TwinCAT3/System"
+REGISTRY_FACTS = (
+    ("ams_net_id", "AmsNetId"),
+    ("locked_mem_size", "LockedMemSize"),
+    ("heap_mem_size_mb", "HeapMemSizeMB"),
+)
+_INTERFACE_RE = re.compile(r"^([^\s:]+): flags=")
+
+
+def binary_to_ams_net_id(text):
+    """
+    Convert the hex string TcRegistry.xml stores to an AMS Net ID.
+
+    Parameters
+    ----------
+    text : str
+        The hex encoding, e.g. AC1594010101.
+
+    Returns
+    -------
+    str
+        The dotted AMS Net ID, e.g. 172.21.148.1.1.1.
+
+    Raises
+    ------
+    ValueError
+        If ``text`` is not six hex-encoded octets.
+    """
+    text = (text or "").strip()
+    if len(text) != 12:
+        raise ValueError("AmsNetId %r is not six hex-encoded octets" % (text,))
+    return ".".join(str(int(text[idx:idx + 2], 16)) for idx in range(0, 12, 2))
+
+
+def parse_mode(output):
+    """Get CONFIG, RUN or the like from ``TcSysExe.exe --mode`` output."""
+    for mode in ("CONFIG", "RUN", "STOP", "EXCEPTION"):
+        if mode in output:
+            return mode
+    return None
+
+
+def parse_ifconfig(output):
+    """
+    Parse ``ifconfig -a`` output.
+
+    Returns
+    -------
+    dict
+        Interface name to its ``ether``, ``ipv4``, ``ipv6`` and ``status``.
+    """
+    interfaces = {}
+    current = None
+    for line in output.splitlines():
+        match = _INTERFACE_RE.match(line)
+        if match:
+            current = interfaces.setdefault(
+                match.group(1), dict(ether=None, ipv4=[], ipv6=[], status=None)
+            )
+            continue
+        if current is None or not line[:1].isspace():
+            continue
+        words = line.split()
+        if not words:
+            continue
+        if words[0] == "inet" and len(words) > 1:
+            address = dict(address=words[1], netmask=None, broadcast=None)
+            for key, value in zip(words[2::2], words[3::2]):
+                if key in ("netmask", "broadcast"):
+                    address[key] = value
+            current["ipv4"].append(address)
+        elif words[0] == "inet6" and len(words) > 1:
+            current["ipv6"].append(words[1])
+        elif words[0] == "ether" and len(words) > 1:
+            current["ether"] = words[1]
+        elif words[0] == "status:":
+            current["status"] = " ".join(words[1:])
+    return interfaces
+
+
+def read_registry_facts(path):
+    """Read the AmsNetId and memory settings from TcRegistry.xml."""
+    root = lxml.etree.parse(path).getroot()
+    parent = root
+    for key in SYSTEM_KEY.split("/"):
+        parent = next(
+            (
+                child for child in parent
+                if child.tag == "Key" and child.get("Name") == key
+            ),
+            None,
+        )
+        if parent is None:
+            break
+
+    facts = dict((fact, None) for fact, _ in REGISTRY_FACTS)
+    if parent is None:
+        return facts
+    values = dict(
+        (child.get("Name"), child.text or "")
+        for child in parent
+        if child.tag == "Value"
+    )
+    for fact, name in REGISTRY_FACTS:
+        if name in values:
+            facts[fact] = values[name].strip()
+    if facts["ams_net_id"]:
+        facts["ams_net_id"] = binary_to_ams_net_id(facts["ams_net_id"])
+    return facts
+
+
+def count_routes(path):
+    """Count the Route elements of StaticRoutes.xml, without keeping them."""
+    count = 0
+    for _, element in lxml.etree.iterparse(path, events=("end",), tag="Route"):
+        if element.getparent() is not None and (
+            element.getparent().tag == "RemoteConnections"
+        ):
+            count += 1
+        element.clear()
+    return count
+
+
+class FactGatherer(object):
+    """
+    Run each probe, recording failures instead of raising.
+
+    Parameters
+    ----------
+    module : AnsibleModule
+    """
+
+    def __init__(self, module):
+        self.module = module
+        self.errors = {}
+
+    def command(self, name, args):
+        """Run a command, returning its stdout or None on failure."""
+        executable = self.module.get_bin_path(args[0])
+        if executable is None:
+            self.errors[name] = "%s not found" % (args[0],)
+            return None
+        rc, out, err = self.module.run_command([executable] + args[1:])
+        if rc != 0:
+            self.errors[name] = (err or out).strip() or "exit code %d" % (rc,)
+            return None
+        return out
+
+    def call(self, name, func, *args):
+        try:
+            return func(*args)
+        except Exception as ex:
+            self.errors[name] = str(ex)
+            return None
+
+    def gather(self, registry_path, routes_path):
+        facts = {}
+        mode_output = self.command("mode", ["TcSysExe.exe", "--mode"])
+        facts["mode_output"] = (mode_output or "").strip()
+        facts["mode"] = parse_mode(facts["mode_output"])
+
+        xar_version = self.command(
+            "xar_version", ["pkg", "query", "%v", XAR_PACKAGE]
+        )
+        facts["xar_version"] = (xar_version or "").strip() or None
+
+        registry = self.call("registry", read_registry_facts, registry_path)
+        facts.update(registry or dict((fact, None) for fact, _ in REGISTRY_FACTS))
+        facts["route_count"] = self.call("route_count", count_routes, routes_path)
+
+        version = self.command("freebsd_version", ["freebsd-version"])
+        facts["freebsd_version"] = (version or "").strip() or None
+
+        ifconfig = self.command("interfaces", ["ifconfig", "-a"])
+        facts["interfaces"] = parse_ifconfig(ifconfig or "")
+
+        facts["errors"] = self.errors
+        return facts
+
+
+def run_module():
+    """Run the fact gathering module."""
+    module_args = dict(
+        registry_path=dict(
+            type="str",
+            required=False,
+            default="/usr/local/etc/TwinCAT/3.1/TcRegistry.xml",
+        ),
+        routes_path=dict(
+            type="str",
+            required=False,
+            default="/usr/local/etc/TwinCAT/3.1/Target/StaticRoutes.xml",
+        ),
+        cache_ttl=dict(type="int", required=False, default=0),
+    )
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=True,
+    )
+
+    facts = FactGatherer(module).gather(
+        registry_path=module.params["registry_path"],
+        routes_path=module.params["routes_path"],
+    )
+    module.exit_json(changed=False, cached=False, ansible_facts=dict(tcbsd=facts))
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import, division, print_function
+
+from ansible.module_utils.basic import AnsibleModule
+
+__metaclass__ = type
+
+# NOTE: like tcbsd_route, this needs to remain Python 2 compatible.
+
+
+DOCUMENTATION = r"""
+---
+module: tcbsd_pkg
+
+short_description: Install TwinCAT/BSD package sets in a single pkg transaction
+
+version_added: "1.0.0"
+
+description:
+    - Brings several named sets of packages to their latest version, and
+      optionally pins the TwinCAT runtime (TC31-XAR) to a fixed version.
+    - The installed packages and the repository catalog are each queried
+      once, a single plan is made for all sets and it is applied with one
+      C(pkg install) run.
+    - Which sets changed is reported per set, so that later tasks can
+      depend on a single set (for example restarting TwinCAT only when the
+      runtime changed).
+
+options:
+    package_sets:
+        description:
+            - Mapping of set name to the list of packages in that set.
+            - Each package is installed, or upgraded if the catalog has a
+              newer version.
+        required: false
+        type: dict
+        default: {}
+    xar_version:
+        description:
+            - TwinCAT runtime version to pin, e.g. C(4026.3.55).  The newest
+              build of that version in the catalog is used, replacing what
+              the previous C(pkg search TC31-XAR-<version>) lookup found.
+            - Reported as the set named C(xar).
+        required: false
+        type: str
+    update_catalog:
+        description:
+            - Run C(pkg update) once before querying the catalog.
+            - Skipped in check mode, which plans against the catalog
+              already on the host and so changes nothing there.
+        required: false
+        type: bool
+        default: true
+
+author:
+    - klauer (@klauer)
+"""
+
+EXAMPLES = r"""
+- name: Install all TwinCAT/BSD packages
+  tcbsd_pkg:
+    package_sets:
+      system: [bash, htop, rsync]
+      tools: "{{ tc_tools_packages }}"
+      libraries: "{{ tc_libraries }}"
+    xar_version: "{{ fixed_xar_version }}"
+  register: tc_packages
+
+- name: Restart TwinCAT if the runtime changed
+  ansible.builtin.service:
+    name: TcSystemService
+    state: restarted
+  when: "'xar' in tc_packages.changed_sets"
+"""
+
+RETURN = r"""
+changed_sets:
+    description: Names of the sets that had packages installed or upgraded
+    type: list
+    returned: always
+    sample: ["tools", "xar"]
+sets:
+    description: Per-set change flag and the packages installed or upgraded
+    type: dict
+    returned: always
+    sample:
+        tools:
+            changed: true
+            installed: ["TcAdsTool-1.0.2"]
+            upgraded: []
+        xar:
+            changed: true
+            installed: []
+            upgraded: ["TC31-XAR-4026.3.55_2"]
+message:
+    description: Summary message
+    type: str
+    returned: always
+    sample: 'Installed or upgraded 2 package(s)'
+"""
+
+
+XAR_PACKAGE = "TC31-XAR"
+_REGEX_SPECIAL = set(".^$*+?()[]{}|\\")
+
+
+def _regex_escape(name):
+    """Escape a package name for a POSIX extended regular expression."""
+    return "".join("\\" + char if char in _REGEX_SPECIAL else char for char in name)
+
+
+def parse_name_versions(output):
+    """
+    Parse ``%n\\t%v`` query output.
+
+    Returns
+    -------
+    dict
+        Package name to the list of versions seen, in output order.
+    """
+    versions = {}
+    for line in output.splitlines():
+        if "\t" not in line:
+            continue
+        name, version = line.split("\t", 1)
+        versions.setdefault(name.strip(), []).append(version.strip())
+    return versions
+
+
+class PkgClient(object):
+    """
+    The few pkg(8) commands the module needs.
+
+    Parameters
+    ----------
+    module : AnsibleModule
+    """
+
+    def __init__(self, module):
+        self.module = module
+        self.pkg = module.get_bin_path("pkg", required=True)
+        self._comparisons = {}
+
+    def _run(self, args, check_rc=True):
+        rc, out, err = self.module.run_command([self.pkg] + args)
+        if check_rc and rc != 0:
+            self.module.fail_json(
+                msg="pkg %s failed: %s" % (" ".join(args), err or out),
+                rc=rc,
+                stdout=out,
+                stderr=err,
+            )
+        return rc, out, err
+
+    def update_catalog(self):
+        self._run(["update", "-q"])
+
+    def installed(self):
+        """Get the installed package versions, by name."""
+        _, out, _ = self._run(["query", "-a", "%n\t%v"])
+        return dict(
+            (name, versions[-1])
+            for name, versions in parse_name_versions(out).items()
+        )
+
+    def available(self, names):
+        """Get all catalog versions of the named packages, in one query."""
+        if not names:
+            return {}
+        pattern = "^(%s)$" % ("|".join(_regex_escape(name) for name in names),)
+        # rquery exits 1 when nothing matches
+        _, out, _ = self._run(["rquery", "-U", "-x", "%n\t%v", pattern], check_rc=False)
+        return parse_name_versions(out)
+
+    def compare(self, version_a, version_b):
+        """Compare two versions the way pkg does: returns "<", "=" or ">"."""
+        if version_a == version_b:
+            return "="
+        key = (version_a, version_b)
+        if key not in self._comparisons:
+            _, out, _ = self._run(["version", "-t", version_a, version_b])
+            self._comparisons[key] = out.strip()
+        return self._comparisons[key]
+
+    def newest(self, versions):
+        best = None
+        for version in versions:
+            if best is None or self.compare(best, version) == "<":
+                best = version
+        return best
+
+    def install(self, specs):
+        self._run(["install", "-y", "-U"] + list(specs))
+
+
+def xar_candidates(versions, xar_version):
+    """Get the catalog TC31-XAR versions that are builds of ``xar_version``."""
+    return [
+        version for version in versions
+        if version == xar_version or version.startswith(xar_version + "_")
+    ]
+
+
+def plan_packages(client, package_sets, xar_version=None):
+    """
+    Work out the pkg install specs and per-set changes.
+
+    Parameters
+    ----------
+    client : PkgClient
+    package_sets : dict
+        Set name to list of package names.
+    xar_version : str, optional
+        TwinCAT runtime version to pin.
+
+    Returns
+    -------
+    specs : list of str
+        name-version specs to pass to a single pkg install.
+    sets : dict
+        Per-set ``changed``, ``installed`` and ``upgraded`` details.
+    missing : list of str
+        Packages that are neither installed nor in the catalog.
+    """
+    names = set()
+    for packages in package_sets.values():
+        names.update(packages)
+    if xar_version:
+        names.add(XAR_PACKAGE)
+
+    installed = client.installed()
+    available = client.available(sorted(names))
+
+    specs = []
+    missing = []
+    actions = {}
+
+    def plan(name, candidates):
+        if name in actions:
+            return actions[name]
+        target = client.newest(candidates) if candidates else None
+        current = installed.get(name)
+        action = None
+        if target is None:
+            if current is None:
+                missing.append(name)
+        elif current is None:
+            action = ("installed", "%s-%s" % (name, target))
+        elif client.compare(current, target) != "=" and (
+            name == XAR_PACKAGE or client.compare(current, target) == "<"
+        ):
+            # The runtime is pinned, so it may also move to an older build
+            action = ("upgraded", "%s-%s" % (name, target))
+        if action is not None:
+            specs.append(action[1])
+        actions[name] = action
+        return action
+
+    if xar_version:
+        candidates = xar_candidates(available.get(XAR_PACKAGE, []), xar_version)
+        current = installed.get(XAR_PACKAGE)
+        if not candidates and current and xar_candidates([current], xar_version):
+            candidates = [current]
+        if not candidates:
+            missing.append("%s-%s" % (XAR_PACKAGE, xar_version))
+            actions[XAR_PACKAGE] = None
+        package_sets = dict(package_sets, xar=[XAR_PACKAGE])
+        plan(XAR_PACKAGE, candidates)
+
+    sets = {}
+    for set_name, packages in sorted(package_sets.items()):
+        details = dict(changed=False, installed=[], upgraded=[])
+        for name in packages:
+            if name == XAR_PACKAGE and set_name != "xar" and xar_version:
+                action = actions.get(XAR_PACKAGE)
+            else:
+                action = plan(name, available.get(name, []))
+            if action is not None:
+                details[action[0]].append(action[1])
+                details["changed"] = True
+        sets[set_name] = details
+    return specs, sets, missing
+
+
+def run_module():
+    """Run the package module."""
+    module_args = dict(
+        package_sets=dict(type="dict", required=False, default={}),
+        xar_version=dict(type="str", required=False, default=None),
+        update_catalog=dict(type="bool", required=False, default=True),
+    )
+
+    result = dict(
+        changed=False,
+        changed_sets=[],
+        sets={},
+        message="",
+    )
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=True,
+    )
+
+    package_sets = {}
+    for set_name, packages in (module.params["package_sets"] or {}).items():
+        if set_name == "xar":
+            module.fail_json(msg="The set name xar is reserved", **result)
+        if packages is None:
+            packages = []
+        if not isinstance(packages, list):
+            packages = [packages]
+        package_sets[set_name] = [str(package) for package in packages if package]
+
+    client = PkgClient(module)
+    # pkg update rewrites the local catalog, so check mode uses the current one
+    if module.params["update_catalog"] and not module.check_mode:
+        client.update_catalog()
+
+    specs, sets, missing = plan_packages(
+        client, package_sets, xar_version=module.params["xar_version"]
+    )
+    result["sets"] = sets
+    result["changed_sets"] = sorted(
+        set_name for set_name, details in sets.items() if details["changed"]
+    )
+    if missing:
+        module.fail_json(
+            msg="Packages not found in the catalog: %s" % (", ".join(sorted(missing)),),
+            **result
+        )
+
+    result["changed"] = bool(specs)
+    if not specs:
+        result["message"] = "All packages are up to date"
+        module.exit_json(**result)
+
+    result["message"] = "Installed or upgraded %d package(s)" % (len(specs),)
+    if not module.check_mode:
+        client.install(specs)
+    module.exit_json(**result)
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
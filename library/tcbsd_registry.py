@@ -0,0 +1,388 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import lxml
+import lxml.etree
+from ansible.module_utils.basic import AnsibleModule
+
+try:
+    from ansible.module_utils.tcbsd_files import write_file_atomically
+except ImportError:
+    # Imported from the checkout by the action plugin, scripts and benchmarks
+    import ansible.module_utils
+
+    ansible.module_utils.__path__.append(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "module_utils")
+    )
+    from ansible.module_utils.tcbsd_files import write_file_atomically
+
+__metaclass__ = type
+
+# NOTE: like tcbsd_route, this needs to remain Python 2 compatible.
+
+
+DOCUMENTATION = r"""
+---
+module: tcbsd_registry
+
+short_description: Manage TwinCAT/BSD registry values
+
+version_added: "1.0.0"
+
+description:
+    - Set values in TcRegistry.xml in TwinCAT/BSD.
+    - All values are applied with a single parse and at most a single write
+      of the file.
+
+options:
+    path:
+        description:
+            - Location of TcRegistry.xml file to be changed.  Defaults to
+            - the system-level one.
+        required: false
+        type: str
+    values:
+        description:
+            - Mapping of registry value path to its desired setting.
+            - A path is the slash-separated list of Key names followed by
+              the Value name, for example
+              C(HKLM/Software/Beckhoff/TwinCAT3/System/LockedMemSize).
+            - A setting is either the value text itself, or a dictionary
+              with any of C(value) (the text), C(ams_net_id) (an AMS Net ID
+              to store in its binary form, as TwinCAT expects for AmsNetId)
+              and C(attributes) (a dictionary of attributes to set on the
+              Value element, such as C(Type)).
+            - Keys and Values that do not exist yet are created.
+        required: true
+        type: dict
+
+author:
+    - klauer (@klauer)
+"""
+
+EXAMPLES = r"""
+- name: Set the AMS Net ID and router memory
+  tcbsd_registry:
+    values:
+      HKLM/Software/Beckhoff/TwinCAT3/System/AmsNetId:
+        ams_net_id: 172.21.148.1.1.1
+      HKLM/Software/Beckhoff/TwinCAT3/System/LockedMemSize: "33554432"
+
+- name: Set the heap memory size, including its type
+  tcbsd_registry:
+    values:
+      HKLM/Software/Beckhoff/TwinCAT3/System/HeapMemSizeMB:
+        value: "2048"
+        attributes:
+          Type: DW
+"""
+
+RETURN = r"""
+changed_values:
+    description: Paths of the registry values that were changed
+    type: list
+    returned: always
+    sample: ["HKLM/Software/Beckhoff/TwinCAT3/System/AmsNetId"]
+values:
+    description: Per-path details of the previous and requested settings
+    type: dict
+    returned: always
+    sample:
+        HKLM/Software/Beckhoff/TwinCAT3/System/LockedMemSize:
+            changed: true
+            before:
+                value: "16777216"
+            after:
+                value: "33554432"
+message:
+    description: Summary message
+    type: str
+    returned: always
+    sample: ''
+"""
+
+
+def ams_net_id_to_binary(ams_net_id):
+    """
+    Convert an AMS Net ID to the hex string TcRegistry.xml stores.
+
+    Parameters
+    ----------
+    ams_net_id : str
+        The AMS Net ID, e.g. 172.21.148.1.1.1.
+
+    Returns
+    -------
+    str
+        The upper-case hex encoding, e.g. AC1594010101.
+
+    Raises
+    ------
+    ValueError
+        If ``ams_net_id`` is not six dot-separated octets.
+    """
+    parts = str(ams_net_id).strip().split(".")
+    if len(parts) != 6:
+        raise ValueError(
+            "AMS Net ID %r does not have six parts" % (ams_net_id,)
+        )
+
+    octets = []
+    for part in parts:
+        try:
+            octet = int(part)
+        except ValueError:
+            octet = -1
+        if not 0 <= octet <= 255:
+            raise ValueError(
+                "AMS Net ID %r has an invalid part %r" % (ams_net_id, part)
+            )
+        octets.append(octet)
+    return "".join("%02X" % (octet,) for octet in octets)
+
+
+class RegistrySetting(object):
+    """
+    The desired state of a single registry value.
+
+    Parameters
+    ----------
+    path : str
+        Slash-separated Key names, followed by the Value name.
+    value : str, optional
+        The value text.  None leaves the text alone.
+    attributes : dict, optional
+        Attributes to set on the Value element.
+    """
+
+    def __init__(self, path, value=None, attributes=None):
+        self.keys = [part for part in path.strip("/").split("/") if part]
+        if len(self.keys) < 2:
+            raise ValueError(
+                "Registry path %r needs at least a Key and a Value name" % (path,)
+            )
+        self.name = self.keys.pop()
+        self.path = path
+        self.value = None if value is None else str(value)
+        self.attributes = dict(
+            (str(key), str(val)) for key, val in (attributes or {}).items()
+        )
+
+    @classmethod
+    def from_param(cls, path, setting):
+        """Create a setting from an entry of the ``values`` module option."""
+        if not isinstance(setting, dict):
+            return cls(path, value=setting)
+
+        unknown = set(setting) - set(("value", "ams_net_id", "attributes"))
+        if unknown:
+            raise ValueError("Unknown options: %s" % (", ".join(sorted(unknown)),))
+        if "value" in setting and "ams_net_id" in setting:
+            raise ValueError("Only one of value and ams_net_id may be given")
+
+        value = setting.get("value")
+        if setting.get("ams_net_id") is not None:
+            value = ams_net_id_to_binary(setting["ams_net_id"])
+        return cls(path, value=value, attributes=setting.get("attributes"))
+
+    def describe(self, element):
+        """Describe the value text and attributes of ``element``."""
+        if element is None:
+            return None
+        description = dict(
+            (key, element.get(key)) for key in sorted(self.attributes)
+        )
+        if self.value is not None:
+            description["value"] = element.text or ""
+        return description
+
+    def apply(self, element):
+        """
+        Update ``element`` to match this setting.
+
+        Returns
+        -------
+        bool
+            True if the element was changed.
+        """
+        changed = False
+        if self.value is not None and (element.text or "") != self.value:
+            element.text = self.value
+            changed = True
+        for key, val in sorted(self.attributes.items()):
+            if element.get(key) != val:
+                element.set(key, val)
+                changed = True
+        return changed
+
+
+def _find_named_child(parent, tag, name):
+    for child in parent:
+        if child.tag == tag and child.get("Name") == name:
+            return child
+    return None
+
+
+def _append_child(parent, child):
+    """Append ``child`` to ``parent``, following the existing indentation."""
+    if len(parent):
+        last = parent[-1]
+        child.tail = last.tail
+        last.tail = parent.text
+    else:
+        previous = parent.getprevious()
+        if previous is not None:
+            outer = previous.tail
+        elif parent.getparent() is not None:
+            outer = parent.getparent().text
+        else:
+            outer = None
+        outer = outer if outer and not outer.strip() else "\n"
+        parent.text = outer + "\t"
+        child.tail = outer
+    parent.append(child)
+
+
+def find_value_element(root, setting, create=False):
+    """
+    Find the Value element for ``setting`` under the TcRegistry ``root``.
+
+    Parameters
+    ----------
+    root : lxml.etree.Element
+        The TcRegistry element.
+    setting : RegistrySetting
+        The setting to look up.
+    create : bool, optional
+        Create any missing Key and Value elements.
+
+    Returns
+    -------
+    lxml.etree.Element or None
+    """
+    parent = root
+    for key in setting.keys:
+        element = _find_named_child(parent, "Key", key)
+        if element is None:
+            if not create:
+                return None
+            element = lxml.etree.Element("Key", Name=key)
+            _append_child(parent, element)
+        parent = element
+
+    element = _find_named_child(parent, "Value", setting.name)
+    if element is None and create:
+        element = lxml.etree.Element("Value", Name=setting.name)
+        _append_child(parent, element)
+    return element
+
+
+def apply_settings(root, settings):
+    """
+    Apply all ``settings`` to the TcRegistry ``root`` element.
+
+    Returns
+    -------
+    dict
+        Per-path ``changed``, ``before`` and ``after`` details.
+    """
+    details = {}
+    for setting in settings:
+        element = find_value_element(root, setting)
+        before = setting.describe(element)
+        if element is None:
+            element = find_value_element(root, setting, create=True)
+        changed = setting.apply(element) or before is None
+        details[setting.path] = dict(
+            changed=changed,
+            before=before,
+            after=setting.describe(element),
+        )
+    return details
+
+
+def run_module():
+    """Run the registry modifying module."""
+    module_args = dict(
+        path=dict(
+            type="str",
+            required=False,
+            default="/usr/local/etc/TwinCAT/3.1/TcRegistry.xml",
+        ),
+        values=dict(type="dict", required=True),
+    )
+
+    result = dict(
+        changed=False,
+        changed_values=[],
+        values={},
+        message="",
+    )
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=True,
+    )
+
+    filename = module.params["path"]
+    settings = []
+    for path, setting in sorted(module.params["values"].items()):
+        try:
+            settings.append(RegistrySetting.from_param(path, setting))
+        except Exception as ex:
+            module.fail_json(
+                msg="Invalid registry value specified: %s %s" % (path, ex),
+                **result
+            )
+
+    try:
+        with open(filename, "rb") as fp:
+            original = fp.read()
+    except (IOError, OSError) as ex:
+        module.fail_json(msg="Unable to read %s: %s" % (filename, ex), **result)
+
+    try:
+        tree = lxml.etree.ElementTree(lxml.etree.fromstring(original))
+    except lxml.etree.XMLSyntaxError as ex:
+        module.fail_json(msg="Unable to parse %s: %s" % (filename, ex), **result)
+
+    result["values"] = apply_settings(tree.getroot(), settings)
+    result["changed_values"] = [
+        setting.path for setting in settings
+        if result["values"][setting.path]["changed"]
+    ]
+
+    if not result["changed_values"]:
+        result["message"] = "No changes in registry values"
+        module.exit_json(**result)
+
+    contents = lxml.etree.tostring(
+        tree,
+        xml_declaration=True,
+        encoding=tree.docinfo.encoding or "UTF-8",
+    )
+    if not contents.endswith(b"\n"):
+        contents += b"\n"
+
+    result["changed"] = contents != original
+    result["message"] = "Updated %d registry value(s)" % (
+        len(result["changed_values"]),
+    )
+    if result["changed"] and not module.check_mode:
+        try:
+            write_file_atomically(filename, contents)
+        except (IOError, OSError) as ex:
+            module.fail_json(msg="Unable to write %s: %s" % (filename, ex), **result)
+
+    module.exit_json(**result)
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,16 +2,48 @@
 
 from __future__ import absolute_import, division, print_function
 
-import socket
+import collections
+import contextlib
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+
+from xml.sax.saxutils import escape
 
 import lxml
 import lxml.etree
 from ansible.module_utils.basic import AnsibleModule
 
+try:
+    from ansible.module_utils.tcbsd_dns import (
+        ResolutionError,
+        lookup_ipv4_address,
+        lookup_with_timeout,
+    )
+    from ansible.module_utils.tcbsd_files import write_file_atomically
+except ImportError:
+    # Imported from the checkout by the action plugin, scripts and benchmarks
+    import ansible.module_utils
+
+    ansible.module_utils.__path__.append(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "module_utils")
+    )
+    from ansible.module_utils.tcbsd_dns import (
+        ResolutionError,
+        lookup_ipv4_address,
+        lookup_with_timeout,
+    )
+    from ansible.module_utils.tcbsd_files import write_file_atomically
+
 __metaclass__ = type
 
 # NOTE to self: this needs to remain Python 2 compatible! Type hints :(
 
+_monotonic = getattr(time, "monotonic", time.time)
+
 
 DOCUMENTATION = r"""
 ---
@@ -32,14 +64,62 @@ options:
         type: str
     state:
         description:
-            - "present" to add/update routes; "absent" to remove routes
+            - "present" to add/update routes; "absent" to remove routes;
+            - "exact" to make the file contain exactly the given routes,
+            - removing all others.
         required: false
-        type: bool
+        type: str
+        choices: [present, absent, exact]
+        default: present
     routes:
         description:
             - List of routes to add.
         required: true
         type: list
+    patch:
+        description:
+            - Patch only the added, modified and removed Route elements into
+            - the existing file, keeping everything else (including elements
+            - and attributes this module does not know about) byte-for-byte.
+            - Falls back to regenerating the file if its layout is not
+            - understood.
+        required: false
+        type: bool
+        default: false
+    backup:
+        description:
+            - Back up the file before changing it, as
+            - ansible.builtin.template does.
+        required: false
+        type: bool
+        default: false
+    backup_keep:
+        description:
+            - With backup, keep at most this many backups of the file,
+            - removing the oldest.  Backups left by ansible.builtin.template
+            - count towards the limit.  0 keeps every backup.
+        required: false
+        type: int
+        default: 5
+    profile:
+        description:
+            - Add per-phase timings and I/O counters to the result.
+        required: false
+        type: bool
+        default: false
+    resolve_timeout:
+        description:
+            - Seconds to wait for each hostname lookup of a route without a
+            - net_id.
+        required: false
+        type: float
+        default: 5.0
+    resolve_workers:
+        description:
+            - Maximum number of hostname lookups to run concurrently.
+        required: false
+        type: int
+        default: 8
 
 author:
     - klauer (@klauer)
@@ -64,6 +144,13 @@ EXAMPLES = r"""
         net_id: 1.1.1.2.1.1
         type: TCP_IP
 
+- name: Configure exactly these routes, keeping the last 3 versions
+  tcbsd_route:
+    state: exact
+    routes: "{{ tc_routes }}"
+    backup: true
+    backup_keep: 3
+
 - name: Add routes to the system from the inventory
   tcbsd_route:
     state: present
@@ -102,6 +189,35 @@ routes_after:
     type: int
     returned: always
     sample: 0
+backup_file:
+    description: The backup made before the file was changed
+    type: str
+    returned: changed and backup is true
+    sample: /usr/local/etc/TwinCAT/3.1/Target/StaticRoutes.xml.2417.2024-05-01@10:12:31~
+backups_removed:
+    description: Old backups removed to stay within backup_keep
+    type: list
+    returned: changed and backup is true
+    sample: []
+sha256:
+    description: SHA-256 hex digest of the routes file after the module ran
+    type: str
+    returned: success
+    sample: 9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08
+timings:
+    description:
+        - Milliseconds spent resolving hostnames, parsing the routes file,
+        - matching routes, serializing and writing.  Only with profile.
+    type: dict
+    returned: when profile is true
+    sample: {"resolve": 1.2, "parse": 0.8, "match": 0.1, "serialize": 0.4, "write": 2.5}
+counts:
+    description:
+        - XML bytes read and written, and DNS lookups made.  Only with
+        - profile.
+    type: dict
+    returned: when profile is true
+    sample: {"xml_bytes_read": 445, "xml_bytes_written": 592, "dns_lookups": 1}
 message:
     description: Summary message
     type: str
@@ -110,6 +226,16 @@ message:
 """
 
 
+# Route child element tag -> Route keyword argument
+_ROUTE_FIELD_TAGS = {
+    "Name": "name",
+    "Address": "address",
+    "NetId": "net_id",
+    "Type": "type",
+    "Flags": "flags",
+}
+
+
 class Route(object):
     """
     A single static route in TwinCAT/BSD land.
@@ -156,19 +282,16 @@ class Route(object):
 
     @classmethod
     def from_xml_element(cls, element):
-        def text_by_tag(tag, default=""):
-            try:
-                return element.xpath(tag)[0].text
-            except IndexError:
-                return default
-
-        return cls(
-            name=text_by_tag("Name"),
-            address=text_by_tag("Address"),
-            net_id=text_by_tag("NetId"),
-            type=text_by_tag("Type"),
-            flags=text_by_tag("Flags"),
-        )
+        # A single pass over the children; the first element with each tag
+        # wins and missing ones default to "", as element.xpath(tag)[0] would.
+        fields = dict.fromkeys(_ROUTE_FIELD_TAGS.values(), "")
+        found = set()
+        for child in element:
+            field = _ROUTE_FIELD_TAGS.get(child.tag)
+            if field is not None and field not in found:
+                found.add(field)
+                fields[field] = child.text
+        return cls(**fields)
 
     def to_xml_element(self):
         self.validate()
@@ -195,10 +318,138 @@ class Route(object):
         )
 
 
+class HostnameResolver(object):
+    """
+    Hostname to IPv4 address resolution with a TTL cache.
+
+    Lookups are made through ``lookup`` (``lookup_ipv4_address`` by default),
+    which may be replaced with a stand-in for testing.
+
+    Parameters
+    ----------
+    lookup : callable, optional
+        Function taking a hostname and returning its IPv4 address.
+    ttl : float, optional
+        Seconds a successful lookup is kept in the cache.
+    timeout : float, optional
+        Seconds to wait for a single lookup.  None waits indefinitely.
+    max_workers : int, optional
+        Maximum number of concurrent lookups in ``resolve_all``.
+    """
+
+    def __init__(self, lookup=None, ttl=300.0, timeout=5.0, max_workers=8):
+        self.lookup = lookup or lookup_ipv4_address
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.lookups = 0
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _get_cached(self, hostname):
+        with self._lock:
+            entry = self._cache.get(hostname)
+        if entry is not None and entry[0] > _monotonic():
+            return entry[1]
+        return None
+
+    def _lookup_with_timeout(self, hostname):
+        with self._lock:
+            self.lookups += 1
+        return lookup_with_timeout(self.lookup, hostname, self.timeout)
+
+    def clear(self):
+        """Forget all cached addresses."""
+        with self._lock:
+            self._cache.clear()
+
+    def resolve(self, hostname):
+        """
+        Resolve a single hostname, using the cache where possible.
+
+        Parameters
+        ----------
+        hostname : str
+            The hostname or IP.
+
+        Returns
+        -------
+        str
+            An IP address for the provided host.
+        """
+        address = self._get_cached(hostname)
+        if address is None:
+            address = self._lookup_with_timeout(hostname)
+            with self._lock:
+                self._cache[hostname] = (_monotonic() + self.ttl, address)
+        return address
+
+    def resolve_all(self, hostnames):
+        """
+        Resolve many hostnames concurrently.
+
+        Parameters
+        ----------
+        hostnames : iterable of str
+            The hostnames or IPs.  Duplicates are resolved once.
+
+        Returns
+        -------
+        addresses : dict
+            Hostname to IP address, for each host that resolved.
+        errors : dict
+            Hostname to the exception raised, for each host that did not.
+        """
+        addresses = {}
+        errors = {}
+        pending = []
+        for hostname in hostnames:
+            if hostname in addresses or hostname in pending:
+                continue
+            address = self._get_cached(hostname)
+            if address is None:
+                pending.append(hostname)
+            else:
+                addresses[hostname] = address
+
+        pending.reverse()
+        results_lock = threading.Lock()
+
+        def worker():
+            while True:
+                with results_lock:
+                    if not pending:
+                        return
+                    hostname = pending.pop()
+                try:
+                    address = self.resolve(hostname)
+                except Exception as ex:
+                    with results_lock:
+                        errors[hostname] = ex
+                else:
+                    with results_lock:
+                        addresses[hostname] = address
+
+        workers = [
+            threading.Thread(target=worker)
+            for _ in range(min(max(self.max_workers, 1), len(pending)))
+        ]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return addresses, errors
+
+
+RESOLVER = HostnameResolver()
+
+
 def hostname_to_ip_address(hostname):
     """
     Convert the provided hostname to an IPv4 address.
 
+    Results are cached by the module-level ``RESOLVER``.
+
     Parameters
     ----------
     hostname : str
@@ -209,7 +460,43 @@ def hostname_to_ip_address(hostname):
     str
         An IP address for the provided host.
     """
-    return socket.gethostbyname(hostname)
+    return RESOLVER.resolve(hostname)
+
+
+def iter_routes_from_file(filename):
+    """
+    Lazily load static routes from the provided filename.
+
+    The file is parsed incrementally and each ``Route`` element is discarded
+    once it has been converted, so memory use does not grow with the number
+    of routes.
+
+    Parameters
+    ----------
+    filename : str or file-like
+        The XML filename on disk, or an open binary file.
+
+    Yields
+    ------
+    Route
+        Routes under ``/TcConfig/RemoteConnections``, in file order.
+    """
+    for _, element in lxml.etree.iterparse(
+        filename, events=("end",), tag="Route"
+    ):
+        parent = element.getparent()
+        if (
+            parent is not None
+            and parent.tag == "RemoteConnections"
+            and parent.getparent() is not None
+            and parent.getparent().tag == "TcConfig"
+            and parent.getparent().getparent() is None
+        ):
+            yield Route.from_xml_element(element)
+
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
 
 
 def load_routes_from_file(filename):
@@ -225,13 +512,7 @@ def load_routes_from_file(filename):
     -------
     list of Route
     """
-    with open(filename, "rb") as fp:
-        routes = lxml.etree.fromstring(fp.read())
-
-    return [
-        Route.from_xml_element(route)
-        for route in routes.xpath("/TcConfig/RemoteConnections/Route")
-    ]
+    return list(iter_routes_from_file(filename))
 
 
 def routes_to_xml(routes):
@@ -240,7 +521,7 @@ def routes_to_xml(routes):
 
     Parameters
     ----------
-    routes : list of Route
+    routes : list of Route or RouteTable
         The routes.
 
     Returns
@@ -258,29 +539,661 @@ def routes_to_xml(routes):
     return tc_config
 
 
-def save_routes_to_file(filename, routes):
+def routes_to_bytes(routes):
     """
-    Save the provided routes to ``filename``.
+    Serialize the provided routes to StaticRoutes.xml contents.
 
     Parameters
     ----------
-    filename : str
-        The destination filename to write to.
-    routes : list of Route
-        Routes to save.
+    routes : list of Route or RouteTable
+        The routes.
+
+    Returns
+    -------
+    bytes
     """
     tc_config = routes_to_xml(routes)
     # NOTE: TCBSD writes tabs here; so let's conform
     lxml.etree.indent(tc_config, space="\t")
-    xml_contents = lxml.etree.tostring(
+    return lxml.etree.tostring(
         tc_config,
         xml_declaration=True,
         pretty_print=True,
         encoding="UTF-8",
-
     )
-    with open(filename, "wb") as fp:
-        fp.write(xml_contents)
+
+
+def read_file(filename):
+    """Read all of ``filename``, or return None if it cannot be read."""
+    try:
+        with open(filename, "rb") as fp:
+            return fp.read()
+    except (IOError, OSError):
+        return None
+
+
+def sha256_of_file(filename):
+    """
+    Get the SHA-256 hex digest of ``filename``, or None if it does not exist.
+    """
+    contents = read_file(filename)
+    if contents is None:
+        return None
+    return hashlib.sha256(contents).hexdigest()
+
+
+# Markup tokens of interest when locating elements in the raw document bytes.
+# Text between tokens is skipped; it may not contain a bare "<".
+_XML_TOKEN = re.compile(
+    br"<!--.*?-->"
+    br"|<!\[CDATA\[.*?\]\]>"
+    br"|<\?.*?\?>"
+    br"|<!DOCTYPE(?:[^\[>]|\[.*?\])*>"
+    br"|</(?P<end>[^\s>]+)\s*>"
+    br"|<(?P<start>[^\s/>!?]+)"
+    br"(?:\s+[^\s=/>]+\s*=\s*(?:\"[^\"]*\"|'[^']*'))*\s*(?P<empty>/?)>",
+    re.S,
+)
+
+# Route attribute -> child element tag, in the order TwinCAT writes them
+_ROUTE_FIELDS = (
+    ("name", b"Name"),
+    ("address", b"Address"),
+    ("net_id", b"NetId"),
+    ("type_", b"Type"),
+    ("flags", b"Flags"),
+)
+
+
+def _xml_text(value):
+    """Escape ``value`` for use as UTF-8 element text."""
+    text = escape(value if isinstance(value, str) else "%s" % (value,))
+    if not isinstance(text, bytes):
+        text = text.encode("utf-8")
+    return text
+
+
+def _open_tag(empty_tag):
+    """Turn a self-closing tag (``<Tag a="1"/>``) into an opening one."""
+    return empty_tag[:-2].rstrip() + b">"
+
+
+class _ElementSpan(object):
+    """Byte offsets of an element in a raw XML document."""
+
+    def __init__(self, tag, start, start_tag_end, gap_start):
+        self.tag = tag
+        self.start = start
+        self.start_tag_end = start_tag_end
+        # Start of the whitespace preceding the element, removed along with it
+        self.gap_start = gap_start
+        self.end_gap_start = None
+        self.end_tag_start = None
+        self.end = None
+        self.children = []
+
+    @property
+    def empty(self):
+        return self.end_tag_start is None
+
+
+class RouteDocument(object):
+    """
+    The raw contents of a StaticRoutes.xml file, for patching in place.
+
+    Only the ``Route`` elements that are added, modified or removed are
+    touched when patching; everything else - including elements and
+    attributes this module does not know about - is kept byte-for-byte.
+
+    Parameters
+    ----------
+    data : bytes
+        The file contents.
+
+    Raises
+    ------
+    ValueError
+        If the document layout is not understood well enough to patch it.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._container, self._spans = self._scan(data)
+        self.routes = list(iter_routes_from_file(io.BytesIO(data)))
+        if len(self._spans) != len(self.routes):
+            raise ValueError("Route elements could not be located for patching")
+
+        # Routes are modified in place, so keep their original values around
+        self._sources = dict(
+            (id(route), (span, self._route_values(route)))
+            for route, span in zip(self.routes, self._spans)
+        )
+
+    @classmethod
+    def from_file(cls, filename):
+        with open(filename, "rb") as fp:
+            return cls(fp.read())
+
+    @staticmethod
+    def _route_values(route):
+        return dict((attr, getattr(route, attr)) for attr, _ in _ROUTE_FIELDS)
+
+    @staticmethod
+    def _scan(data):
+        """Locate RemoteConnections and its Route elements in ``data``."""
+        stack = []
+        container = None
+        spans = []
+        pos = 0
+        for match in _XML_TOKEN.finditer(data):
+            gap = data[pos:match.start()]
+            if b"<" in gap:
+                raise ValueError("Unrecognized markup at byte %d" % (pos,))
+            gap_start = match.start() if gap.strip() else pos
+            pos = match.end()
+
+            if match.group("end") is not None:
+                if not stack or stack[-1].tag != match.group("end"):
+                    raise ValueError("Mismatched end tag at byte %d" % (pos,))
+                span = stack.pop()
+                span.end_gap_start = gap_start
+                span.end_tag_start = match.start()
+                span.end = match.end()
+                continue
+
+            if match.group("start") is None:
+                continue
+
+            span = _ElementSpan(
+                tag=match.group("start"),
+                start=match.start(),
+                start_tag_end=match.end(),
+                gap_start=gap_start,
+            )
+            path = [parent.tag for parent in stack]
+            if path == [b"TcConfig"] and span.tag == b"RemoteConnections":
+                if container is not None:
+                    raise ValueError("Multiple RemoteConnections elements")
+                container = span
+            elif path == [b"TcConfig", b"RemoteConnections"]:
+                if span.tag == b"Route":
+                    spans.append(span)
+            elif path == [b"TcConfig", b"RemoteConnections", b"Route"]:
+                stack[-1].children.append(span)
+
+            if match.group("empty"):
+                span.end = match.end()
+            else:
+                stack.append(span)
+
+        if stack:
+            raise ValueError("Unclosed element %r" % (stack[-1].tag,))
+        if container is None:
+            raise ValueError("No /TcConfig/RemoteConnections element")
+        return container, spans
+
+    def _indent_of(self, span, default):
+        """Get the indentation of the line ``span`` starts on."""
+        line_start = self.data.rfind(b"\n", 0, span.start) + 1
+        indent = self.data[line_start:span.start]
+        if line_start == 0 or indent.strip():
+            return default
+        return indent
+
+    def _route_indent(self):
+        default = self._indent_of(self._container, b"") + b"\t"
+        if not self._spans:
+            return default
+        return self._indent_of(self._spans[0], default)
+
+    def _serialize_route(self, route, indent):
+        route.validate()
+        child_indent = b"\n" + indent + b"\t"
+        parts = [b"<Route>"]
+        for attr, tag in _ROUTE_FIELDS:
+            parts.extend(
+                (child_indent, b"<", tag, b">", _xml_text(getattr(route, attr)),
+                 b"</", tag, b">")
+            )
+        parts.extend((b"\n", indent, b"</Route>"))
+        return b"".join(parts)
+
+    def _route_edits(self, route, span, original):
+        """Edits updating the changed fields of an existing Route element."""
+        values = self._route_values(route)
+        changed = [
+            (attr, tag) for attr, tag in _ROUTE_FIELDS
+            if values[attr] != original[attr]
+        ]
+        if not changed:
+            return []
+
+        indent = self._indent_of(span, self._route_indent())
+        if span.empty:
+            return [(span.start, span.end, self._serialize_route(route, indent))]
+
+        route.validate()
+        children = {}
+        for child in span.children:
+            children.setdefault(child.tag, child)
+
+        edits = []
+        for attr, tag in changed:
+            text = _xml_text(values[attr])
+            child = children.get(tag)
+            if child is None:
+                child_indent = indent + b"\t"
+                if span.children:
+                    child_indent = self._indent_of(span.children[0], child_indent)
+                element = b"".join((b"<", tag, b">", text, b"</", tag, b">"))
+                edits.append(
+                    (span.end_gap_start, span.end_gap_start,
+                     b"\n" + child_indent + element)
+                )
+            elif child.empty:
+                open_tag = _open_tag(self.data[child.start:child.end])
+                edits.append(
+                    (child.start, child.end,
+                     b"".join((open_tag, text, b"</", tag, b">")))
+                )
+            else:
+                edits.append((child.start_tag_end, child.end_tag_start, text))
+        return edits
+
+    def _insert_routes(self, routes):
+        """An edit appending new Route elements to RemoteConnections."""
+        indent = self._route_indent()
+        body = b"".join(
+            b"\n" + indent + self._serialize_route(route, indent)
+            for route in routes
+        )
+        container = self._container
+        if container.empty:
+            return (
+                container.start,
+                container.end,
+                b"".join((
+                    _open_tag(self.data[container.start:container.end]),
+                    body,
+                    b"\n",
+                    self._indent_of(container, b""),
+                    b"</RemoteConnections>",
+                ))
+            )
+        return (container.end_gap_start, container.end_gap_start, body)
+
+    def patch(self, routes):
+        """
+        Get the document contents with ``routes`` patched in.
+
+        Parameters
+        ----------
+        routes : list of Route or RouteTable
+            The desired routes.  Routes loaded from this document keep their
+            position; any others are appended.
+
+        Returns
+        -------
+        bytes
+        """
+        edits = []
+        additions = []
+        present = set()
+        for route in routes:
+            present.add(id(route))
+            source = self._sources.get(id(route))
+            if source is None:
+                additions.append(route)
+            else:
+                edits.extend(self._route_edits(route, *source))
+
+        for route_id, (span, _) in self._sources.items():
+            if route_id not in present:
+                edits.append((span.gap_start, span.end, b""))
+
+        if additions:
+            edits.append(self._insert_routes(additions))
+
+        # Zero-width insertions at the same offset keep their relative order
+        edits.sort(key=lambda edit: edit[0])
+        pieces = []
+        pos = 0
+        for start, end, replacement in edits:
+            if start < pos:
+                raise ValueError("Overlapping edits at byte %d" % (start,))
+            pieces.append(self.data[pos:start])
+            pieces.append(replacement)
+            pos = end
+        pieces.append(self.data[pos:])
+        return b"".join(pieces)
+
+
+def save_routes_to_file(filename, routes, document=None, profiler=None,
+                        backup=None):
+    """
+    Save the provided routes to ``filename``, if its contents would change.
+
+    Parameters
+    ----------
+    filename : str
+        The destination filename to write to.
+    routes : list of Route or RouteTable
+        Routes to save.
+    document : RouteDocument, optional
+        The document ``routes`` were loaded from.  If given, it is patched in
+        place rather than the file being regenerated from scratch.
+    profiler : Profiler, optional
+        Records the serialize and write phases.
+    backup : callable, optional
+        Called with ``filename`` just before it is replaced.
+
+    Returns
+    -------
+    written : bool
+        True if the file was rewritten.
+    sha256 : str
+        The SHA-256 hex digest of the file contents after saving.
+    """
+    if profiler is None:
+        profiler = Profiler()
+
+    with profiler.phase("serialize"):
+        if document is not None:
+            xml_contents = document.patch(routes)
+        else:
+            xml_contents = routes_to_bytes(routes)
+        sha256 = hashlib.sha256(xml_contents).hexdigest()
+
+    with profiler.phase("write"):
+        if document is not None:
+            original = document.data
+        else:
+            original = read_file(filename)
+            profiler.count("xml_bytes_read", len(original or b""))
+
+        if original == xml_contents:
+            return False, sha256
+
+        if backup is not None and original is not None:
+            backup(filename)
+        write_file_atomically(filename, xml_contents)
+        profiler.count("xml_bytes_written", len(xml_contents))
+    return True, sha256
+
+
+# Backups as made by AnsibleModule.backup_local: <file>.<pid>.<timestamp>~
+_BACKUP_SUFFIX = re.compile(
+    r"^\.\d+\.(\d{4}-\d{2}-\d{2}@\d{2}:\d{2}:\d{2})~$"
+)
+
+
+def find_backups(filename):
+    """
+    Find the backups of ``filename`` in its directory.
+
+    Returns
+    -------
+    list of str
+        Backup filenames, oldest first.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    basename = os.path.basename(filename)
+    backups = []
+    for name in os.listdir(directory):
+        if not name.startswith(basename):
+            continue
+        match = _BACKUP_SUFFIX.match(name[len(basename):])
+        if match is None:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        backups.append((match.group(1), mtime, path))
+    return [path for _, _, path in sorted(backups)]
+
+
+def prune_backups(filename, keep):
+    """
+    Remove all but the newest ``keep`` backups of ``filename``.
+
+    Returns
+    -------
+    list of str
+        The backups removed.
+    """
+    if keep <= 0:
+        return []
+    backups = find_backups(filename)
+    removed = []
+    for path in backups[:max(len(backups) - keep, 0)]:
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        removed.append(path)
+    return removed
+
+
+class RouteTable(object):
+    """
+    An ordered collection of routes, indexed by name, AMS Net ID and address.
+
+    Routes keep the order in which they were added, so saving the table back
+    to StaticRoutes.xml does not shuffle the file.  Conflicting routes are
+    found through the indices instead of by scanning every route.
+
+    Parameters
+    ----------
+    routes : iterable of Route, optional
+        The initial routes, in file order.
+    """
+
+    _index_attrs = ("name", "net_id", "address")
+
+    def __init__(self, routes=None):
+        self._routes = collections.OrderedDict()
+        self._indices = dict((attr, {}) for attr in self._index_attrs)
+        self._next_key = 0
+        for route in routes or ():
+            self.append(route)
+
+    def __len__(self):
+        return len(self._routes)
+
+    def __iter__(self):
+        return iter(list(self._routes.values()))
+
+    def _index(self, key, route):
+        for attr in self._index_attrs:
+            index = self._indices[attr]
+            index.setdefault(getattr(route, attr), set()).add(key)
+
+    def _unindex(self, key, route):
+        for attr in self._index_attrs:
+            index = self._indices[attr]
+            value = getattr(route, attr)
+            keys = index.get(value)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del index[value]
+
+    def _matching_keys(self, route):
+        keys = set()
+        for attr in self._index_attrs:
+            keys.update(self._indices[attr].get(getattr(route, attr), ()))
+        # Keys increase monotonically, so sorting restores file order.
+        return sorted(keys)
+
+    def append(self, route):
+        """Add ``route`` to the end of the table."""
+        key = self._next_key
+        self._next_key += 1
+        self._routes[key] = route
+        self._index(key, route)
+
+    def find_matching(self, route):
+        """
+        Find routes matching the name, Net ID, or IP address of ``route``.
+
+        Returns
+        -------
+        list of Route
+            The matching routes, in table order.
+        """
+        return [self._routes[key] for key in self._matching_keys(route)]
+
+    def ensure(self, new_route):
+        """
+        Ensure a route exists - updating existing ones if required.
+
+        Returns
+        -------
+        dict
+            Route changes (added, removed, modified)
+        """
+        result = dict(
+            routes_added=0,
+            routes_removed=0,
+            routes_modified=0,
+        )
+        existing = self._matching_keys(new_route)
+        if len(existing) == 0:
+            # No existing routes. Easy - add the new one.
+            self.append(new_route)
+            result["routes_added"] = 1
+            return result
+
+        # Existing route(s).  Pick the one with a matching name (if any) and
+        # discard the rest.
+        keep_key = None
+        for key in existing:
+            if self._routes[key].name == new_route.name:
+                keep_key = key
+                break
+
+        if keep_key is None:
+            result["routes_added"] += 1
+            self.append(new_route)
+
+        for key in existing:
+            rt = self._routes[key]
+            if key == keep_key:
+                if rt != new_route:
+                    result["routes_modified"] += 1
+                    self._unindex(key, rt)
+                    rt.name = new_route.name
+                    rt.address = new_route.address
+                    rt.net_id = new_route.net_id
+                    rt.type_ = new_route.type_
+                    rt.flags = new_route.flags
+                    self._index(key, rt)
+            else:
+                self._unindex(key, rt)
+                del self._routes[key]
+                result["routes_removed"] += 1
+
+        return result
+
+    def remove(self, remove_route):
+        """
+        Remove all routes matching ``remove_route``.
+
+        Returns
+        -------
+        dict
+            Route changes (added, removed, modified)
+        """
+        result = dict(routes_removed=0)
+        for key in self._matching_keys(remove_route):
+            self._unindex(key, self._routes.pop(key))
+            result["routes_removed"] += 1
+        return result
+
+    def exact(self, routes):
+        """
+        Make the table hold exactly ``routes``.
+
+        Routes already in the table keep their place; new ones are appended.
+
+        Returns
+        -------
+        dict
+            Route changes (added, removed, modified)
+
+        Raises
+        ------
+        ValueError
+            If two of ``routes`` share a name, AMS Net ID or address, as
+            they could not both be kept.
+        """
+        seen = dict((attr, {}) for attr in self._index_attrs)
+        for route in routes:
+            for attr in self._index_attrs:
+                other = seen[attr].setdefault(getattr(route, attr), route)
+                if other is not route:
+                    raise ValueError(
+                        "%s and %s have the same %s" % (other, route, attr)
+                    )
+
+        result = dict(
+            routes_added=0,
+            routes_removed=0,
+            routes_modified=0,
+        )
+        for route in routes:
+            combine_results(result, self.ensure(route))
+
+        wanted = set(
+            (route.name, route.address, route.net_id, route.type_, route.flags)
+            for route in routes
+        )
+        for key, route in list(self._routes.items()):
+            if (
+                route.name, route.address, route.net_id, route.type_, route.flags
+            ) not in wanted:
+                self._unindex(key, route)
+                del self._routes[key]
+                result["routes_removed"] += 1
+        return result
+
+    def apply(self, state, routes):
+        """
+        Apply a batch of route operations in a single pass.
+
+        Parameters
+        ----------
+        state : str
+            "present" to add/update ``routes``; "absent" to remove them;
+            "exact" to keep only ``routes``.
+        routes : list of Route
+            The requested routes, applied in order.
+
+        Returns
+        -------
+        dict
+            Combined route changes (added, removed, modified)
+        """
+        if state == "exact":
+            return self.exact(routes)
+        if state == "present":
+            operation = self.ensure
+        elif state == "absent":
+            operation = self.remove
+        else:
+            raise ValueError("Unknown state")
+
+        result = dict(
+            routes_added=0,
+            routes_removed=0,
+            routes_modified=0,
+        )
+        for route in routes:
+            combine_results(result, operation(route))
+        return result
 
 
 def find_matching_routes(routes, route):
@@ -289,7 +1202,7 @@ def find_matching_routes(routes, route):
 
     Parameters
     ----------
-    routes : list of Route
+    routes : list of Route or RouteTable
     route : Route
 
     Yields
@@ -298,6 +1211,11 @@ def find_matching_routes(routes, route):
         Route which matches either the name, Net ID, or IP address of
         ``route``.
     """
+    if isinstance(routes, RouteTable):
+        for existing in routes.find_matching(route):
+            yield existing
+        return
+
     for existing in routes:
         if (
             existing.name == route.name
@@ -307,68 +1225,53 @@ def find_matching_routes(routes, route):
             yield existing
 
 
+def _apply_to_routes(routes, operation, route):
+    """
+    Apply a ``RouteTable`` operation to ``routes``.
+
+    Plain lists are updated in place so that existing callers keep working.
+    """
+    if isinstance(routes, RouteTable):
+        return operation(routes, route)
+
+    table = RouteTable(routes)
+    result = operation(table, route)
+    routes[:] = list(table)
+    return result
+
+
 def ensure_route_exists(routes, new_route):
     """
     Ensure a route exists - updating existing ones if required.
 
+    Parameters
+    ----------
+    routes : list of Route or RouteTable
+    new_route : Route
+
     Returns
     -------
     dict
         Route changes (added, removed, modified)
     """
-    result = dict(
-        routes_added=0,
-        routes_removed=0,
-        routes_modified=0,
-    )
-    existing = list(find_matching_routes(routes, new_route))
-    if len(existing) == 0:
-        # No existing routes. Easy - add the new one.
-        routes.append(new_route)
-        result["routes_added"] = 1
-        return result
-
-    # Existing route(s).  Pick the one with a matching name (if any) and
-    # discard the rest.
-    matching_by_name = [rt for rt in existing if rt.name == new_route.name]
-    if len(matching_by_name) > 0:
-        keep_route = matching_by_name[0]
-    else:
-        keep_route = None
-        result["routes_added"] += 1
-        routes.append(new_route)
-
-    for rt in existing:
-        if rt is keep_route:
-            if rt != new_route:
-                result["routes_modified"] += 1
-                rt.name = new_route.name
-                rt.address = new_route.address
-                rt.net_id = new_route.net_id
-                rt.type_ = new_route.type_
-                rt.flags = new_route.flags
-        else:
-            routes.remove(rt)
-            result["routes_removed"] += 1
-
-    return result
+    return _apply_to_routes(routes, RouteTable.ensure, new_route)
 
 
 def remove_route_if_existing(routes, remove_route):
     """
     Remove a matching route if it exists
 
+    Parameters
+    ----------
+    routes : list of Route or RouteTable
+    remove_route : Route
+
     Returns
     -------
     dict
         Route changes (added, removed, modified)
     """
-    result = dict(routes_removed=0)
-    for rt in find_matching_routes(routes, remove_route):
-        routes.remove(rt)
-        result["routes_removed"] += 1
-
-    return result
+    return _apply_to_routes(routes, RouteTable.remove, remove_route)
 
 
 def combine_results(dest_results, results):
@@ -391,6 +1294,43 @@ def combine_results(dest_results, results):
                 dest_results[key] = "\n".join((dest_results[key], results[key]))
 
 
+class Profiler(object):
+    """
+    Wall time spent in each phase of a module run, plus I/O counters.
+
+    Timings are accumulated in milliseconds, as phases may be entered more
+    than once.
+    """
+
+    phases = ("resolve", "parse", "match", "serialize", "write")
+
+    def __init__(self):
+        self.timings = dict((phase, 0.0) for phase in self.phases)
+        self.counts = dict(xml_bytes_read=0, xml_bytes_written=0, dns_lookups=0)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time the enclosed block as part of phase ``name``."""
+        start = _monotonic()
+        try:
+            yield
+        finally:
+            self.timings[name] += (_monotonic() - start) * 1000.0
+
+    def count(self, name, value=1):
+        """Add ``value`` to counter ``name``."""
+        self.counts[name] += value
+
+    def report(self):
+        """Get the ``timings`` and ``counts`` for the module result."""
+        return dict(
+            timings=dict(
+                (phase, round(elapsed, 3)) for phase, elapsed in self.timings.items()
+            ),
+            counts=dict(self.counts),
+        )
+
+
 def run_module():
     """Run the route modifying module."""
     # define available arguments/parameters a user can pass to the module
@@ -400,8 +1340,19 @@ def run_module():
             required=False,
             default="/usr/local/etc/TwinCAT/3.1/Target/StaticRoutes.xml",
         ),
-        state=dict(type="str", required=False, default="present"),
+        state=dict(
+            type="str",
+            required=False,
+            default="present",
+            choices=["present", "absent", "exact"],
+        ),
         routes=dict(type="list", required=True),
+        patch=dict(type="bool", required=False, default=False),
+        backup=dict(type="bool", required=False, default=False),
+        backup_keep=dict(type="int", required=False, default=5),
+        profile=dict(type="bool", required=False, default=False),
+        resolve_timeout=dict(type="float", required=False, default=5.0),
+        resolve_workers=dict(type="int", required=False, default=8),
     )
 
     result = dict(
@@ -428,28 +1379,63 @@ def run_module():
     filename = module.params["file"]
     state = module.params["state"]
     new_routes = []
+    profiler = Profiler()
+    dns_lookups_before = RESOLVER.lookups
+
+    with profiler.phase("resolve"):
+        # Resolve every route missing a Net ID up front, in parallel, so that
+        # building the Route objects below only hits the cache.
+        RESOLVER.timeout = module.params["resolve_timeout"]
+        RESOLVER.max_workers = module.params["resolve_workers"]
+        _, resolve_errors = RESOLVER.resolve_all(
+            route_dict["address"]
+            for route_dict in module.params["routes"]
+            if isinstance(route_dict, dict)
+            and route_dict.get("address")
+            and not route_dict.get("net_id")
+        )
 
-    for new_route_dict in module.params["routes"]:
-        try:
-            new_routes.append(Route(**new_route_dict))
-        except Exception as ex:
-            module.fail_json(
-                msg="Invalid route specified: %s %s" % (new_route_dict, ex),
-                **result,
-            )
+        for new_route_dict in module.params["routes"]:
+            try:
+                address = new_route_dict.get("address")
+                if address in resolve_errors and not new_route_dict.get("net_id"):
+                    raise resolve_errors[address]
+                new_routes.append(Route(**new_route_dict))
+            except Exception as ex:
+                module.fail_json(
+                    msg="Invalid route specified: %s %s" % (new_route_dict, ex),
+                    **result
+                )
 
     # use whatever logic you need to determine whether or not this module
     # made any modifications to your target
-    routes = load_routes_from_file(filename)
-    result["routes_before"] = len(routes)
-    if state == "present":
-        for route in new_routes:
-            combine_results(result, ensure_route_exists(routes, route))
-    elif state == "absent":
-        for route in new_routes:
-            combine_results(result, remove_route_if_existing(routes, route))
-    else:
-        raise ValueError("Unknown state")
+    with profiler.phase("parse"):
+        document = None
+        # Like the template it replaces, exact creates a missing file
+        create = state == "exact" and not os.path.exists(filename)
+        if create:
+            routes = RouteTable()
+        elif module.params["patch"]:
+            try:
+                document = RouteDocument.from_file(filename)
+            except ValueError as ex:
+                module.warn(
+                    "Regenerating %s instead of patching: %s" % (filename, ex)
+                )
+
+        if document is not None:
+            profiler.count("xml_bytes_read", len(document.data))
+            routes = RouteTable(document.routes)
+        elif not create:
+            profiler.count("xml_bytes_read", os.path.getsize(filename))
+            routes = RouteTable(iter_routes_from_file(filename))
+
+    with profiler.phase("match"):
+        result["routes_before"] = len(routes)
+        try:
+            combine_results(result, routes.apply(state, new_routes))
+        except ValueError as ex:
+            module.fail_json(msg="Invalid routes specified: %s" % (ex,), **result)
 
     result["routes_after"] = len(routes)
     if any(
@@ -460,11 +1446,38 @@ def run_module():
             result["routes_before"] != result["routes_after"],
         )
     ):
-        result["changed"] = True
+        backups = []
+
+        def backup(filename):
+            backups.append(module.backup_local(filename))
+
+        # The counters only say something may have changed; the file is
+        # rewritten only if the serialized contents actually differ.
+        result["changed"], result["sha256"] = save_routes_to_file(
+            filename, routes, document=document, profiler=profiler,
+            backup=backup if module.params["backup"] else None,
+        )
+        if backups:
+            result["backup_file"] = backups[0]
+            result["backups_removed"] = prune_backups(
+                filename, module.params["backup_keep"]
+            )
+
+    if result["changed"]:
         result["message"] = "Updated and saved routes"
-        save_routes_to_file(filename, routes)
     else:
         result["message"] = "No changes in routes"
+        if "sha256" not in result:
+            if document is not None:
+                contents = document.data
+            else:
+                contents = read_file(filename) or b""
+                profiler.count("xml_bytes_read", len(contents))
+            result["sha256"] = hashlib.sha256(contents).hexdigest()
+
+    if module.params["profile"]:
+        profiler.count("dns_lookups", RESOLVER.lookups - dns_lookups_before)
+        result.update(profiler.report())
 
     # in the event of a successful module execution, you will want to
     # simple AnsibleModule.exit_json(), passing the key/value results
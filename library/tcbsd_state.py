@@ -0,0 +1,219 @@
+#!/usr/bin/python
+
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+
+from ansible.module_utils.basic import AnsibleModule
+
+try:
+    from ansible.module_utils.tcbsd_files import write_file_atomically
+except ImportError:
+    # Run straight from library/ rather than shipped by ansible
+    import ansible.module_utils
+
+    ansible.module_utils.__path__.append(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "module_utils")
+    )
+    from ansible.module_utils.tcbsd_files import write_file_atomically
+
+__metaclass__ = type
+
+# NOTE: like tcbsd_route, this needs to remain Python 2 compatible.
+
+
+DOCUMENTATION = r"""
+---
+module: tcbsd_state
+
+short_description: Track which playbook sections a PLC has converged to
+
+version_added: "1.0.0"
+
+description:
+    - Keeps a small JSON file on the PLC with a digest of the desired state
+      of each playbook section (for example routes or registry values) as
+      it was last applied.
+    - With C(state=query), compares the stored digests with the ones given
+      in a single call, so that sections whose desired state has not
+      changed since the last successful run can be skipped.
+    - With C(state=present), records the given digests after the sections
+      have been applied.
+
+options:
+    path:
+        description:
+            - Location of the state file on the PLC.
+        required: false
+        type: str
+        default: /var/db/tcbsd-ansible/state.json
+    digests:
+        description:
+            - Mapping of section name to the digest of its desired state, as
+              rendered on the controller.
+        required: true
+        type: dict
+    state:
+        description:
+            - C(query) compares the digests with the state file.
+            - C(present) writes the digests to the state file.  Sections in
+              the file that are not given are kept.
+        required: false
+        type: str
+        choices: [query, present]
+        default: query
+
+author:
+    - klauer (@klauer)
+"""
+
+EXAMPLES = r"""
+- name: Compare section digests with the last converged state
+  tcbsd_state:
+    digests:
+      routes: "{{ tc_add_missing_static_routes | to_json | hash('sha256') }}"
+  register: tc_state
+
+- name: Add any missing static routes
+  when: "'routes' in tc_state.changed_sections"
+  tcbsd_route:
+    routes: "{{ tc_add_missing_static_routes }}"
+
+- name: Record the converged state
+  tcbsd_state:
+    digests:
+      routes: "{{ tc_add_missing_static_routes | to_json | hash('sha256') }}"
+    state: present
+"""
+
+RETURN = r"""
+changed_sections:
+    description: Sections whose digest differs from the stored one, or is not stored
+    type: list
+    returned: always
+    sample: ["routes"]
+unchanged_sections:
+    description: Sections whose digest matches the stored one
+    type: list
+    returned: always
+    sample: ["network", "packages", "pf", "registry"]
+message:
+    description: Summary message
+    type: str
+    returned: always
+    sample: '1 of 5 section(s) changed'
+"""
+
+
+STATE_VERSION = 1
+
+
+def read_state(path):
+    """
+    Read the stored section digests.
+
+    A missing or unreadable file is treated as an empty state, so every
+    section runs.
+    """
+    try:
+        with open(path, "r") as fp:
+            state = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return {}
+    if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+        return {}
+    sections = state.get("sections")
+    return sections if isinstance(sections, dict) else {}
+
+
+def write_state(path, sections):
+    """Write the section digests atomically."""
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0o755)
+    contents = json.dumps(
+        dict(version=STATE_VERSION, sections=sections),
+        indent=2,
+        sort_keys=True,
+    )
+    write_file_atomically(path, (contents + "\n").encode("utf-8"))
+
+
+def compare_digests(stored, digests):
+    """
+    Split sections into changed and unchanged ones.
+
+    Returns
+    -------
+    changed : list of str
+    unchanged : list of str
+    """
+    changed = []
+    unchanged = []
+    for section, digest in sorted(digests.items()):
+        if stored.get(section) == digest:
+            unchanged.append(section)
+        else:
+            changed.append(section)
+    return changed, unchanged
+
+
+def run_module():
+    """Run the state module."""
+    module_args = dict(
+        path=dict(
+            type="str",
+            required=False,
+            default="/var/db/tcbsd-ansible/state.json",
+        ),
+        digests=dict(type="dict", required=True),
+        state=dict(
+            type="str",
+            required=False,
+            default="query",
+            choices=["query", "present"],
+        ),
+    )
+
+    result = dict(
+        changed=False,
+        changed_sections=[],
+        unchanged_sections=[],
+        message="",
+    )
+
+    module = AnsibleModule(
+        argument_spec=module_args,
+        supports_check_mode=True,
+    )
+
+    path = module.params["path"]
+    digests = dict(
+        (str(section), str(digest))
+        for section, digest in module.params["digests"].items()
+    )
+    stored = read_state(path)
+    changed, unchanged = compare_digests(stored, digests)
+    result["changed_sections"] = changed
+    result["unchanged_sections"] = unchanged
+    result["message"] = "%d of %d section(s) changed" % (len(changed), len(digests))
+
+    if module.params["state"] == "present" and changed:
+        result["changed"] = True
+        if not module.check_mode:
+            sections = dict(stored)
+            sections.update(digests)
+            try:
+                write_state(path, sections)
+            except (IOError, OSError) as ex:
+                module.fail_json(msg="Unable to write %s: %s" % (path, ex), **result)
+    module.exit_json(**result)
+
+
+def main():
+    run_module()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""
+Controller cache directory shared by the tcbsd_* action and filter plugins.
+
+scripts/inventory_loader.py has the same lookup for the scripts, which run
+without ansible.
+"""
+from __future__ import absolute_import, division, print_function
+
+import os
+
+__metaclass__ = type
+
+CACHE_DIR_ENV = "TCBSD_ANSIBLE_CACHE_DIR"
+
+
+def default_cache_dir():
+    """Get the cache directory, which can be overridden with an env var."""
+    if os.environ.get(CACHE_DIR_ENV):
+        return os.environ[CACHE_DIR_ENV]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "twincat-bsd-ansible")
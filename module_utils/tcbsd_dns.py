@@ -0,0 +1,68 @@
+"""
+Hostname lookups shared by tcbsd_route and the controller-side filters.
+"""
+from __future__ import absolute_import, division, print_function
+
+import socket
+import threading
+
+__metaclass__ = type
+
+
+class ResolutionError(Exception):
+    """A hostname could not be resolved in time."""
+
+
+def lookup_ipv4_address(hostname):
+    """
+    Get the first IPv4 address of ``hostname``, as gethostbyname would.
+
+    ``getaddrinfo`` is used because it is thread-safe everywhere, and it is
+    looked up on each call so that it can be patched for testing.
+    """
+    infos = socket.getaddrinfo(hostname, None, socket.AF_INET, socket.SOCK_STREAM)
+    return infos[0][4][0]
+
+
+def lookup_with_timeout(lookup, hostname, timeout):
+    """
+    Get ``lookup(hostname)``, giving up after ``timeout`` seconds.
+
+    Parameters
+    ----------
+    lookup : callable
+        Function taking a hostname and returning its IPv4 address.
+    hostname : str
+        The hostname to look up.
+    timeout : float or None
+        Seconds to wait.  None waits indefinitely.
+
+    Raises
+    ------
+    ResolutionError
+        If the lookup did not finish in time.
+    """
+    if timeout is None:
+        return lookup(hostname)
+
+    # getaddrinfo cannot be interrupted, so wait on it from a daemon
+    # thread that is simply abandoned if it does not finish in time.
+    outcome = {}
+
+    def target():
+        try:
+            outcome["address"] = lookup(hostname)
+        except Exception as ex:
+            outcome["error"] = ex
+
+    thread = threading.Thread(target=target)
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise ResolutionError(
+            "Timed out resolving %r after %s seconds" % (hostname, timeout)
+        )
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["address"]
@@ -0,0 +1,67 @@
+"""
+File helpers shared by the tcbsd_* modules.
+"""
+from __future__ import absolute_import, division, print_function
+
+import os
+import stat
+import tempfile
+
+__metaclass__ = type
+
+
+def write_file_atomically(filename, contents):
+    """
+    Replace ``filename`` with ``contents`` without leaving a partial file.
+
+    The contents are written to a temporary file in the same directory,
+    flushed to disk and renamed over the original, keeping its owner and
+    mode.
+
+    Parameters
+    ----------
+    filename : str
+        The destination filename to write to.
+    contents : bytes
+        The new file contents.
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    try:
+        original = os.stat(filename)
+    except OSError:
+        original = None
+
+    fd, temp_filename = tempfile.mkstemp(
+        prefix=".%s." % os.path.basename(filename),
+        suffix=".tmp",
+        dir=directory,
+    )
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(contents)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+        if original is None:
+            os.chmod(temp_filename, 0o644)
+        else:
+            os.chmod(temp_filename, stat.S_IMODE(original.st_mode))
+            try:
+                os.chown(temp_filename, original.st_uid, original.st_gid)
+            except OSError:
+                # Only root may give files away; keep our own ownership.
+                pass
+
+        os.rename(temp_filename, filename)
+    except BaseException:
+        try:
+            os.unlink(temp_filename)
+        except OSError:
+            pass
+        raise
+
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
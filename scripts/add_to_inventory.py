@@ -3,14 +3,30 @@ Helper for adding new plc hosts to the inventory.
 
 Hosts must be in the inventory to be managed with the ansible scripts.
 Hosts can be assigned a group for batch operations.
+
+Membership checks use a fast cached read-only load of the inventory. The
+slower round-trip load, which preserves formatting, only happens when hosts
+are about to be added.
+
+Many hosts can be added at once with --file, which reads one
+"hostname group" pair per line (use - for stdin). Lines without a group use
+--group. All groups are checked before anything is written.
+
+Hosts that would end up in more than one vars group (a group with
+group_vars) are refused, and hosts already listed under more than one
+group are reported.
 """
 from __future__ import annotations
 
 import argparse
+import sys
 from pathlib import Path
-from typing import Any, Literal, Union
+from typing import Any, Iterable, Literal, Union
 
-from ruamel.yaml import YAML
+from inventory_index import InventoryIndex
+from inventory_loader import load_inventory_data
+from make_vars import find_vars_groups
+from make_vars import get_group_options as get_vars_group_options
 
 yaml = None
 # The yaml has top-level group names as strings
@@ -45,14 +61,22 @@ def get_parser() -> argparse.ArgumentParser:
         prog="add_to_inventory.py",
         description=__doc__,
     )
-    parser.add_argument("hostname", type=str)
+    parser.add_argument("hostname", type=str, nargs="?", default="")
     parser.add_argument("--group", type=str, default="")
+    parser.add_argument(
+        "--file",
+        type=str,
+        default="",
+        help="File of 'hostname group' lines to add in bulk, or - for stdin",
+    )
     return parser
 
 
 def init_yaml():
     """Setup a reusable global yaml instance for round-trip reading and writing."""
     global yaml
+    # Imported here: ruamel is only needed when the inventory gets rewritten
+    from ruamel.yaml import YAML
     yaml = YAML(typ="rt")
 
 
@@ -76,19 +100,28 @@ def write_inventory(path: str | Path, inventory: _Inventory) -> None:
         )
 
 
-def host_in_inventory(hostname: str, inventory: _Inventory) -> bool:
+def host_in_inventory(
+    hostname: str,
+    inventory: _Inventory,
+    index: InventoryIndex | None = None,
+) -> bool:
     """Return True if hostname is in the inventory, and False otherwise."""
-    for dct in inventory.values():
-        try:
-            if hostname in dct["hosts"]:
-                return True
-        except (KeyError, TypeError):
-            pass
-    return False
+    if index is None:
+        index = InventoryIndex(inventory)
+    return index.has_host(hostname)
 
 
 def add_host_to_group(hostname: str, group: str, inventory: _Inventory) -> None:
     """Add hostname to the inventory under the selected group."""
+    add_hosts_to_group(hostnames=[hostname], group=group, inventory=inventory)
+
+
+def add_hosts_to_group(
+    hostnames: Iterable[str],
+    group: str,
+    inventory: _Inventory,
+) -> None:
+    """Add several hostnames to the inventory under the selected group at once."""
     group_dict = inventory[group]
     try:
         hosts_dict = group_dict["hosts"]
@@ -97,7 +130,7 @@ def add_host_to_group(hostname: str, group: str, inventory: _Inventory) -> None:
     if hosts_dict is None:
         hosts_dict = {}
     hosts_in_group = list(hosts_dict)
-    hosts_in_group.append(hostname)
+    hosts_in_group.extend(hostnames)
     hosts_in_group.sort()
     inventory[group]["hosts"] = {
         name: hosts_dict.get(name, None) for name in hosts_in_group
@@ -109,18 +142,123 @@ def get_group_options(inventory: _Inventory) -> list[str]:
     return [key for key in inventory if key not in ("plcs", "tcbsd_plcs")]
 
 
-def main(hostname: str, group: str = "") -> int:
+def check_vars_groups(
+    index: InventoryIndex,
+    hostnames: Iterable[str],
+    vars_groups: list[str],
+) -> list[str]:
+    """
+    Report hosts in more than one group, directly or by vars group.
+
+    Returns the hosts that are in more than one vars group, which make_vars
+    and the playbooks cannot pick defaults for.
+    """
+    conflicts = []
+    for hostname in hostnames:
+        if hostname in index.duplicate_hosts:
+            groups = ", ".join(index.duplicate_hosts[hostname])
+            print(f"Warning: {hostname} is listed under more than one group: {groups}")
+        groups = find_vars_groups(hostname, index, vars_groups)
+        if len(groups) > 1:
+            groups = ", ".join(groups)
+            print(f"{hostname} is in more than one vars group: {groups}")
+            conflicts.append(hostname)
+    return conflicts
+
+
+def read_host_list(
+    lines: Iterable[str],
+    default_group: str = "",
+) -> list[tuple[str, str]]:
+    """Parse "hostname group" lines, skipping blank lines and # comments."""
+    pairs = []
+    for line in lines:
+        fields = line.split("#", 1)[0].split()
+        if not fields:
+            continue
+        if len(fields) > 2:
+            raise ValueError(f"Expected 'hostname group', got: {line.strip()}")
+        hostname = fields[0]
+        group = fields[1] if len(fields) == 2 else default_group
+        pairs.append((hostname, group))
+    return pairs
+
+
+def main_bulk(host_file: str, default_group: str = "") -> int:
     inventory_path = Path(__file__).parent.parent / "inventory" / "plcs.yaml"
+    if host_file == "-":
+        pairs = read_host_list(sys.stdin, default_group=default_group)
+    else:
+        with Path(host_file).open("r") as fd:
+            pairs = read_host_list(fd, default_group=default_group)
+
+    inventory_data = load_inventory_data(path=inventory_path)
+    options = get_group_options(inventory=inventory_data)
+    vars_groups = get_vars_group_options(inventory_path.parent.parent / "group_vars")
+
+    # Work out what to do for every host before printing or writing anything
+    index = InventoryIndex(inventory_data)
+    planned = []
+    for hostname, group in pairs:
+        skip = host_in_inventory(
+            hostname=hostname, inventory=inventory_data, index=index,
+        )
+        if not skip:
+            index.add_host(hostname, group)
+        planned.append((hostname, group, skip))
+
+    invalid = [
+        (hostname, group) for hostname, group, skip in planned
+        if not skip and group not in options
+    ]
+    if invalid:
+        for hostname, group in invalid:
+            print(f"Invalid group {group!r} for {hostname}")
+        text_options = "\n".join(options)
+        print(f"Please select groups from the following options:\n{text_options}\n")
+        return 1
+    hostnames = dict.fromkeys(hostname for hostname, _, _ in planned)
+    conflicts = check_vars_groups(index, hostnames, vars_groups)
+    if any(hostname in conflicts for hostname, _, skip in planned if not skip):
+        print("Nothing was added, please pick groups under a single vars group")
+        return 1
+
+    to_add: dict[str, list[str]] = {}
+    for hostname, group, skip in planned:
+        if skip:
+            print(f"{hostname} already in inventory, skipping!")
+            continue
+        print(f"Adding {hostname} to group {group}")
+        to_add.setdefault(group, []).append(hostname)
+
+    if not to_add:
+        return 0
     inventory = load_inventory(path=inventory_path)
-    if host_in_inventory(hostname=hostname, inventory=inventory):
+    for group, hostnames in to_add.items():
+        add_hosts_to_group(hostnames=hostnames, group=group, inventory=inventory)
+    write_inventory(path=inventory_path, inventory=inventory)
+    return 0
+
+
+def main(hostname: str, group: str = "") -> int:
+    inventory_path = Path(__file__).parent.parent / "inventory" / "plcs.yaml"
+    inventory_data = load_inventory_data(path=inventory_path)
+    index = InventoryIndex(inventory_data)
+    if host_in_inventory(hostname=hostname, inventory=inventory_data, index=index):
         print(f"{hostname} already in inventory, skipping!")
         return 0
-    options = get_group_options(inventory=inventory)
+    options = get_group_options(inventory=inventory_data)
     text_options = "\n".join(options)
     while group not in options:
         print(f"Please select a group from the following options:\n{text_options}\n")
         group = input().strip()
+    index.add_host(hostname, group)
+    vars_groups = get_vars_group_options(inventory_path.parent.parent / "group_vars")
+    if check_vars_groups(index, [hostname], vars_groups):
+        print(f"{hostname} was not added, please pick a group under one vars group")
+        return 1
     print(f"Adding {hostname} to group {group}")
+    inventory = load_inventory(path=inventory_path)
     add_host_to_group(hostname=hostname, group=group, inventory=inventory)
     write_inventory(path=inventory_path, inventory=inventory)
     return 0
@@ -129,6 +267,13 @@ def main(hostname: str, group: str = "") -> int:
 if __name__ == "__main__":
     parser = get_parser()
     args = parser.parse_args()
+    if args.file:
+        exit(main_bulk(
+            host_file=args.file,
+            default_group=args.group,
+        ))
+    if not args.hostname:
+        parser.error("a hostname or --file is required")
     exit(main(
         hostname=args.hostname,
         group=args.group,
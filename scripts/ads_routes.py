@@ -0,0 +1,586 @@
+"""
+Discover PLCs and add ADS routes to them over the UDP 48899 protocol.
+
+Speaks the TwinCAT UDP service protocol directly, so neither adstool nor
+ads-async is needed.  Requests to every target are sent concurrently from one
+socket and matched to replies by invoke ID, so adding a workstation's route to
+a whole hutch takes about as long as the slowest PLC.
+
+Targets are inventory groups or hosts (resolved through ``ansible_host``), or
+plain hostnames and IP addresses.  ``discover`` with no targets broadcasts
+instead.  The route password is asked for once, for every target.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import getpass
+import ipaddress
+import itertools
+import json
+import os
+import random
+import socket
+import struct
+import time
+from typing import NamedTuple
+
+from config_cohorts import EffectiveConfigs
+from hostname_resolver import RESOLVER
+
+ADS_UDP_PORT = 48899
+MAGIC = 0x71146603
+RESPONSE_FLAG = 0x80000000
+DEFAULT_AMS_PORT = 10000
+
+SERVICE_DISCOVER = 1
+SERVICE_ADD_ROUTE = 6
+
+TAG_STATUS = 1
+TAG_PASSWORD = 2
+TAG_TC_VERSION = 3
+TAG_COMPUTER_NAME = 5
+TAG_NET_ID = 7
+TAG_ROUTE_NAME = 12
+TAG_USERNAME = 13
+
+_HEADER = struct.Struct("<III6sHI")
+_TAG = struct.Struct("<HH")
+
+
+def ams_net_id_to_bytes(net_id: str) -> bytes:
+    """Pack a dotted AMS Net ID such as 172.21.148.1.1.1."""
+    parts = net_id.split(".")
+    try:
+        octets = bytes(int(part) for part in parts)
+    except ValueError:
+        octets = b""
+    if len(parts) != 6 or len(octets) != 6:
+        raise ValueError(f"Invalid AMS Net ID: {net_id!r}")
+    return octets
+
+
+def bytes_to_ams_net_id(data: bytes) -> str:
+    return ".".join(str(octet) for octet in data)
+
+
+def _string_tag(value: str) -> bytes:
+    return value.encode("utf-8") + b"\x00"
+
+
+def _tag_string(data: bytes) -> str:
+    return data.split(b"\x00", 1)[0].decode("utf-8", errors="replace")
+
+
+class Message(NamedTuple):
+    """One UDP service request or response."""
+
+    invoke_id: int
+    service: int
+    net_id: str
+    port: int
+    tags: tuple[tuple[int, bytes], ...] = ()
+
+    def to_bytes(self) -> bytes:
+        body = b"".join(
+            _TAG.pack(tag, len(data)) + data for tag, data in self.tags
+        )
+        return _HEADER.pack(
+            MAGIC, self.invoke_id, self.service,
+            ams_net_id_to_bytes(self.net_id), self.port, len(self.tags),
+        ) + body
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Message:
+        if len(data) < _HEADER.size:
+            raise ValueError("Datagram too short")
+        magic, invoke_id, service, net_id, port, count = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("Not an ADS UDP datagram")
+        tags = []
+        offset = _HEADER.size
+        for _ in range(count):
+            if offset + _TAG.size > len(data):
+                raise ValueError("Truncated tag header")
+            tag, length = _TAG.unpack_from(data, offset)
+            offset += _TAG.size
+            if offset + length > len(data):
+                raise ValueError("Truncated tag data")
+            tags.append((tag, data[offset:offset + length]))
+            offset += length
+        return cls(invoke_id, service, bytes_to_ams_net_id(net_id), port, tuple(tags))
+
+    def tag(self, tag: int) -> bytes | None:
+        return next((data for key, data in self.tags if key == tag), None)
+
+    @property
+    def status(self) -> int:
+        """The error code of a response; 0 if it reports none."""
+        data = self.tag(TAG_STATUS)
+        if data is None or len(data) < 4:
+            return 0
+        return struct.unpack_from("<I", data)[0]
+
+
+def add_route_request(
+    invoke_id: int,
+    local_net_id: str,
+    route_name: str,
+    net_id: str,
+    address: str,
+    username: str,
+    password: str,
+) -> Message:
+    """Build a request to add a route to (address, net_id) on the PLC."""
+    return Message(
+        invoke_id, SERVICE_ADD_ROUTE, local_net_id, DEFAULT_AMS_PORT,
+        tags=(
+            (TAG_ROUTE_NAME, _string_tag(route_name)),
+            (TAG_NET_ID, ams_net_id_to_bytes(net_id)),
+            (TAG_USERNAME, _string_tag(username)),
+            (TAG_PASSWORD, _string_tag(password)),
+            (TAG_COMPUTER_NAME, _string_tag(address)),
+        ),
+    )
+
+
+def discover_request(invoke_id: int, local_net_id: str) -> Message:
+    return Message(invoke_id, SERVICE_DISCOVER, local_net_id, DEFAULT_AMS_PORT)
+
+
+class PLCInfo(NamedTuple):
+    """What a PLC reports in its discovery response."""
+
+    address: str
+    net_id: str
+    name: str
+    tc_version: str
+
+    @classmethod
+    def from_message(cls, address: str, message: Message) -> PLCInfo:
+        version = message.tag(TAG_TC_VERSION) or b""
+        if len(version) >= 4:
+            major, minor, build = struct.unpack_from("<BBH", version)
+            tc_version = f"{major}.{minor}.{build}"
+        else:
+            tc_version = ""
+        return cls(
+            address=address,
+            net_id=message.net_id,
+            name=_tag_string(message.tag(TAG_COMPUTER_NAME) or b""),
+            tc_version=tc_version,
+        )
+
+
+class Result(NamedTuple):
+    """The outcome of one request to one target."""
+
+    host: str
+    address: str
+    ok: bool
+    latency: float | None
+    message: str
+    info: PLCInfo | None = None
+
+
+class AdsUdpClient(asyncio.DatagramProtocol):
+    """
+    Send service requests from one UDP socket and match the replies.
+
+    Replies are matched on invoke ID, which is unique per request, so any
+    number of requests can be outstanding at once.
+    """
+
+    def __init__(self, port: int = ADS_UDP_PORT):
+        self.port = port
+        self.transport: asyncio.DatagramTransport | None = None
+        self._invoke_ids = itertools.count(random.randrange(1, 1 << 30))
+        self._pending: dict[int, tuple[str, asyncio.Future]] = {}
+        self._collectors: dict[int, list[tuple[str, Message, float]]] = {}
+
+    @classmethod
+    async def open(cls, port: int = ADS_UDP_PORT, broadcast: bool = False):
+        loop = asyncio.get_running_loop()
+        _, client = await loop.create_datagram_endpoint(
+            lambda: cls(port=port),
+            local_addr=("0.0.0.0", 0),
+            allow_broadcast=broadcast,
+        )
+        return client
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        try:
+            message = Message.from_bytes(data)
+        except ValueError:
+            return
+        if not message.service & RESPONSE_FLAG:
+            return
+        collector = self._collectors.get(message.invoke_id)
+        if collector is not None:
+            collector.append((addr[0], message, time.monotonic()))
+            return
+        address, future = self._pending.get(message.invoke_id, (None, None))
+        if future is not None and addr[0] == address and not future.done():
+            future.set_result(message)
+
+    def next_invoke_id(self) -> int:
+        return next(self._invoke_ids) & 0xFFFFFFFF
+
+    def close(self) -> None:
+        if self.transport is not None:
+            self.transport.close()
+
+    async def request(
+        self,
+        address: str,
+        message: Message,
+        timeout: float = 2.0,
+        retries: int = 2,
+    ) -> tuple[Message, float]:
+        """
+        Send a request, resending on timeout, and wait for its response.
+
+        Returns the response and the time from the first send to it.
+
+        Raises
+        ------
+        TimeoutError
+            If no response arrived after the last retry.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message.invoke_id] = (address, future)
+        start = time.monotonic()
+        try:
+            for _ in range(retries + 1):
+                self.transport.sendto(message.to_bytes(), (address, self.port))
+                try:
+                    response = await asyncio.wait_for(asyncio.shield(future), timeout)
+                except asyncio.TimeoutError:
+                    continue
+                if response.service != message.service | RESPONSE_FLAG:
+                    raise ValueError(f"Unexpected service {response.service:#x}")
+                return response, time.monotonic() - start
+            raise TimeoutError(f"No response after {retries + 1} attempt(s)")
+        finally:
+            del self._pending[message.invoke_id]
+
+    async def collect(
+        self,
+        address: str,
+        message: Message,
+        timeout: float = 2.0,
+    ) -> list[tuple[str, Message, float]]:
+        """Send a (broadcast) request and gather every response for timeout."""
+        self._collectors[message.invoke_id] = responses = []
+        start = time.monotonic()
+        try:
+            self.transport.sendto(message.to_bytes(), (address, self.port))
+            await asyncio.sleep(timeout)
+        finally:
+            del self._collectors[message.invoke_id]
+        return [
+            (source, response, received - start)
+            for source, response, received in responses
+            if response.service == message.service | RESPONSE_FLAG
+        ]
+
+
+def local_address_for(address: str, port: int = ADS_UDP_PORT) -> str:
+    """Get our address on the interface that routes to ``address``."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.connect((address, port))
+        return sock.getsockname()[0]
+
+
+def _is_ip_address(text: str) -> bool:
+    try:
+        ipaddress.ip_address(text)
+    except ValueError:
+        return False
+    return True
+
+
+def resolve_targets(targets: list[str]) -> tuple[dict[str, str], dict[str, str]]:
+    """
+    Map each target to an IP address.
+
+    Inventory groups expand to their hosts, which use ``ansible_host``.
+    Anything else is taken as a hostname or address.
+
+    Returns
+    -------
+    addresses : dict of host to address
+    errors : dict of host to the reason it could not be resolved
+    """
+    configs = None
+    hosts: dict[str, str] = {}
+    for target in targets:
+        if _is_ip_address(target):
+            hosts[target] = target
+            continue
+        if configs is None:
+            configs = EffectiveConfigs()
+        try:
+            names = configs.hosts(target)
+        except RuntimeError:
+            hosts[target] = target
+            continue
+        for name in names:
+            hosts[name] = str(configs.host_config(name).get("ansible_host", name))
+
+    addresses, failures = RESOLVER.resolve_all(
+        name for name in hosts.values()
+        if not _is_ip_address(name)
+    )
+    resolved: dict[str, str] = {}
+    errors: dict[str, str] = {}
+    for host, name in hosts.items():
+        if _is_ip_address(name):
+            resolved[host] = name
+        elif name in addresses:
+            resolved[host] = addresses[name]
+        else:
+            errors[host] = f"unable to resolve {name}: {failures[name]}"
+    return resolved, errors
+
+
+async def add_routes(
+    targets: dict[str, str],
+    route_name: str,
+    address: str | None,
+    net_id: str | None,
+    username: str,
+    password: str,
+    timeout: float = 2.0,
+    retries: int = 2,
+    concurrency: int = 64,
+    port: int = ADS_UDP_PORT,
+) -> list[Result]:
+    """
+    Add a route to (address, net_id) on every target at once.
+
+    Without an address, each PLC gets a route to our address on the
+    interface facing it, and without a net_id, that address plus ``.1.1``.
+    """
+    client = await AdsUdpClient.open(port=port)
+    limit = asyncio.Semaphore(max(concurrency, 1))
+
+    async def add_one(host: str, plc_address: str) -> Result:
+        try:
+            route_address = address or local_address_for(plc_address, port)
+            route_net_id = net_id or f"{route_address}.1.1"
+            request = add_route_request(
+                client.next_invoke_id(), route_net_id, route_name, route_net_id,
+                route_address, username, password,
+            )
+        except (OSError, ValueError) as ex:
+            return Result(host, plc_address, False, None, str(ex))
+        async with limit:
+            try:
+                response, latency = await client.request(
+                    plc_address, request, timeout=timeout, retries=retries
+                )
+            except (OSError, TimeoutError, ValueError) as ex:
+                return Result(host, plc_address, False, None, str(ex))
+        if response.status:
+            return Result(
+                host, plc_address, False, latency,
+                f"PLC refused the route (error {response.status:#x})",
+            )
+        return Result(host, plc_address, True, latency, "route added")
+
+    try:
+        return list(await asyncio.gather(
+            *(add_one(host, plc_address) for host, plc_address in targets.items())
+        ))
+    finally:
+        client.close()
+
+
+async def discover(
+    targets: dict[str, str],
+    net_id: str,
+    broadcast: str = "255.255.255.255",
+    timeout: float = 2.0,
+    retries: int = 2,
+    port: int = ADS_UDP_PORT,
+) -> list[Result]:
+    """Ask each target, or everything on the broadcast address, to identify."""
+    client = await AdsUdpClient.open(port=port, broadcast=not targets)
+    try:
+        if not targets:
+            responses = await client.collect(
+                broadcast, discover_request(client.next_invoke_id(), net_id),
+                timeout=timeout,
+            )
+            return [
+                Result(source, source, True, latency, "found",
+                       PLCInfo.from_message(source, response))
+                for source, response, latency in responses
+            ]
+
+        async def discover_one(host: str, plc_address: str) -> Result:
+            request = discover_request(client.next_invoke_id(), net_id)
+            try:
+                response, latency = await client.request(
+                    plc_address, request, timeout=timeout, retries=retries
+                )
+            except (OSError, TimeoutError, ValueError) as ex:
+                return Result(host, plc_address, False, None, str(ex))
+            return Result(host, plc_address, True, latency, "found",
+                          PLCInfo.from_message(plc_address, response))
+
+        return list(await asyncio.gather(
+            *(discover_one(host, plc_address) for host, plc_address in targets.items())
+        ))
+    finally:
+        client.close()
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the parser used for CLI argument parsing."""
+    parser = argparse.ArgumentParser(
+        prog="ads_routes.py",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "command", choices=["add-route", "discover"],
+    )
+    parser.add_argument(
+        "targets", type=str, nargs="*",
+        help="Inventory groups, inventory hosts, hostnames or IP addresses",
+    )
+    parser.add_argument(
+        "--address", type=str, default=os.environ.get("OUR_IP_ADDRESS"),
+        help="Our IP address for the routes (default: the one facing each PLC)",
+    )
+    parser.add_argument(
+        "--net-id", type=str, default=os.environ.get("OUR_NET_ID"),
+        help="Our AMS Net ID for the routes (default: each address + .1.1)",
+    )
+    parser.add_argument(
+        "--route-name", type=str,
+        default=os.environ.get("OUR_ROUTE_NAME", socket.gethostname().split(".")[0]),
+    )
+    parser.add_argument(
+        "--username", type=str,
+        default=os.environ.get("PLC_USERNAME", "Administrator"),
+    )
+    parser.add_argument(
+        "--broadcast", type=str, default="255.255.255.255",
+        help="Broadcast address for discover with no targets",
+    )
+    parser.add_argument("--timeout", type=float, default=2.0)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument(
+        "--json", action="store_true",
+        help="Print the per-host results as JSON",
+    )
+    return parser
+
+
+def print_results(results: list[Result], as_json: bool = False) -> None:
+    if as_json:
+        print(json.dumps(
+            [
+                dict(
+                    result._asdict(),
+                    info=result.info._asdict() if result.info else None,
+                )
+                for result in results
+            ],
+            indent=2,
+        ))
+        return
+    for result in sorted(results, key=lambda result: (result.ok, result.host)):
+        latency = (
+            f"{result.latency * 1000:.1f} ms" if result.latency is not None else "-"
+        )
+        line = f"{result.host} ({result.address}): {result.message} [{latency}]"
+        if result.info is not None:
+            info = result.info
+            line += f" {info.name} {info.net_id} TwinCAT {info.tc_version}"
+        print(line)
+    ok = sum(result.ok for result in results)
+    print(f"{ok} of {len(results)} PLCs succeeded")
+
+
+def main(
+    command: str,
+    targets: list[str],
+    address: str | None = None,
+    net_id: str | None = None,
+    route_name: str = "",
+    username: str = "Administrator",
+    broadcast: str = "255.255.255.255",
+    timeout: float = 2.0,
+    retries: int = 2,
+    concurrency: int = 64,
+    json_output: bool = False,
+) -> int:
+    if command == "add-route" and not targets:
+        print("add-route needs at least one target")
+        return 1
+
+    addresses, errors = resolve_targets(targets)
+    if net_id:
+        try:
+            ams_net_id_to_bytes(net_id)
+        except ValueError as ex:
+            print(ex)
+            return 1
+
+    if command == "discover":
+        if not net_id:
+            try:
+                source = address or local_address_for(
+                    next(iter(addresses.values()), broadcast)
+                )
+            except OSError as ex:
+                print(f"Unable to determine our address (set --address): {ex}")
+                return 1
+            net_id = f"{source}.1.1"
+        results = asyncio.run(discover(
+            addresses, net_id, broadcast=broadcast, timeout=timeout, retries=retries,
+        ))
+    else:
+        if address:
+            ours = f"{address} ({net_id or f'{address}.1.1'})"
+        else:
+            ours = "our address facing each PLC"
+        print(f"Adding route {route_name!r} to {ours} "
+              f"on {len(addresses)} PLC(s) as {username}")
+        password = getpass.getpass("Enter password for adding PLC route: ")
+        results = asyncio.run(add_routes(
+            addresses, route_name=route_name, address=address, net_id=net_id,
+            username=username, password=password, timeout=timeout,
+            retries=retries, concurrency=concurrency,
+        ))
+    results.extend(
+        Result(host, "", False, None, reason) for host, reason in errors.items()
+    )
+    print_results(results, as_json=json_output)
+    return 0 if results and all(result.ok for result in results) else 1
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    args = parser.parse_args()
+    exit(main(
+        command=args.command,
+        targets=args.targets,
+        address=args.address,
+        net_id=args.net_id,
+        route_name=args.route_name,
+        username=args.username,
+        broadcast=args.broadcast,
+        timeout=args.timeout,
+        retries=args.retries,
+        concurrency=args.concurrency,
+        json_output=args.json,
+    ))
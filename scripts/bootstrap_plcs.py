@@ -0,0 +1,361 @@
+"""
+Prepare one or more PLCs for ansible, concurrently.
+
+Does what bootstrap_plc.sh does for a single PLC, for a list of PLCs:
+inventory and host_vars entries, SSH key login, a changed default password,
+and the bootstrap packages python needs, installed by the bootstrap playbook.
+
+Each PLC gets one multiplexed SSH connection (ControlMaster) that all of its
+probes and transfers share, and the probes run as a single remote command.
+The bootstrap package directory is compared by sha256 with what is already
+in ~/bootstrap on the PLC, and only the files that differ are sent.
+
+The steps that need a person (choosing an inventory group, ssh-copy-id and
+changing the default password) run one host at a time. Everything else runs
+--concurrency hosts at a time.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, NamedTuple
+
+import add_to_inventory
+import make_vars
+from inventory_index import InventoryIndex
+from inventory_loader import load_inventory_data
+from provision_fleet import SSHMultiplexer, split_ansible_args
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+INVENTORY_PATH = REPO_ROOT / "inventory" / "plcs.yaml"
+PLAYBOOK = REPO_ROOT / "tcbsd-bootstrap-from-local-playbook.yaml"
+SSH_CONFIG = REPO_ROOT / "ssh_config"
+DEFAULT_KEY = Path.home() / ".ssh" / "tcbsd_key_rsa"
+DEFAULT_BOOTSTRAP_ROOT = "/cds/group/pcds/tcbsd/bootstrap"
+REMOTE_DIR = "bootstrap"
+
+# Every probe in one remote command, one "key=value" line per result
+PROBE_SCRIPT = """
+printf 'python=%s\\n' "$(test -e /usr/local/bin/python3 && echo yes || echo no)"
+printf 'freebsd_version=%s\\n' "$(freebsd-version)"
+if test -x /home/Administrator/.default_warning; then
+  printf 'password_warning=%s\\n' \\
+    "$(/home/Administrator/.default_warning | tr '\\n' ' ')"
+fi
+if test -d ~/{remote_dir}; then
+  cd ~/{remote_dir} && find . -type f -exec sha256 -r {{}} + | sed 's/^/sha256=/'
+fi
+""".format(remote_dir=REMOTE_DIR)
+
+
+class Probe(NamedTuple):
+    """What a PLC reported in its probe."""
+
+    has_python: bool
+    freebsd_version: str
+    password_warning: str
+    files: dict[str, str]
+
+    @classmethod
+    def from_output(cls, output: str) -> Probe:
+        values: dict[str, str] = {}
+        files = {}
+        for line in output.splitlines():
+            key, _, value = line.partition("=")
+            if key == "sha256":
+                digest, name = value.split(None, 1)
+                files[os.path.normpath(name.strip())] = digest
+            else:
+                values[key] = value.strip()
+        return cls(
+            has_python=values.get("python") == "yes",
+            freebsd_version=values.get("freebsd_version", ""),
+            password_warning=values.get("password_warning", ""),
+            files=files,
+        )
+
+    @property
+    def os_major(self) -> str:
+        return self.freebsd_version.split(".", 1)[0]
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the parser used for CLI argument parsing."""
+    parser = argparse.ArgumentParser(
+        prog="bootstrap_plcs.py",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage="%(prog)s [options] hostname [hostname ...] [-- ansible-playbook args]",
+    )
+    parser.add_argument("hostnames", type=str, nargs="+")
+    parser.add_argument(
+        "--username", type=str,
+        default=os.environ.get("PLC_USERNAME", "Administrator"),
+    )
+    parser.add_argument("--private-key", type=str, default=str(DEFAULT_KEY))
+    parser.add_argument(
+        "--bootstrap-root", type=str, default=DEFAULT_BOOTSTRAP_ROOT,
+        help="Directory holding a bsd<major> package directory per OS version",
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--control-persist", type=str, default="10m",
+        help="How long idle SSH master connections are kept open",
+    )
+    return parser
+
+
+def hash_directory(path: str | Path) -> dict[str, str]:
+    """Get the sha256 of every file below path, by relative path."""
+    root = Path(path)
+    hashes = {}
+    for file in sorted(root.rglob("*")):
+        if file.is_file():
+            digest = hashlib.sha256()
+            with file.open("rb") as fp:
+                for chunk in iter(lambda: fp.read(1 << 20), b""):
+                    digest.update(chunk)
+            hashes[os.path.normpath(file.relative_to(root))] = digest.hexdigest()
+    return hashes
+
+
+def plan_transfer(
+    local: dict[str, str],
+    remote: dict[str, str],
+) -> tuple[list[str], list[str]]:
+    """Get the files to send and the stale remote files to delete."""
+    send = [name for name, digest in local.items() if remote.get(name) != digest]
+    delete = sorted(name for name in remote if name not in local)
+    return send, delete
+
+
+class PLCSession:
+    """All SSH calls to one PLC, sharing one master connection."""
+
+    def __init__(
+        self,
+        hostname: str,
+        username: str,
+        private_key: str,
+        mux: SSHMultiplexer,
+    ):
+        self.hostname = hostname
+        self.address = f"{username}@{hostname}"
+        self.private_key = private_key
+        self.mux = mux
+
+    def ssh_command(self, *args: str) -> list[str]:
+        return [
+            "ssh", "-F", str(SSH_CONFIG), "-i", self.private_key,
+            *self.mux.options, *args,
+        ]
+
+    def run(
+        self,
+        command: str,
+        stdin: int | IO[bytes] | None = subprocess.DEVNULL,
+        batch: bool = True,
+    ) -> subprocess.CompletedProcess:
+        options = ["-o", "BatchMode=yes"] if batch else []
+        return subprocess.run(
+            self.ssh_command(*options, self.address, command),
+            stdin=stdin,
+            capture_output=True,
+        )
+
+    def probe(self) -> Probe | None:
+        """Run every probe in one call; None if key login does not work."""
+        proc = self.run(PROBE_SCRIPT)
+        if proc.returncode != 0:
+            return None
+        return Probe.from_output(proc.stdout.decode(errors="replace"))
+
+    def copy_id(self) -> int:
+        """Interactively install our public key on the PLC."""
+        return subprocess.run([
+            "ssh-copy-id", "-i", self.private_key,
+            "-o", "PreferredAuthentications=keyboard-interactive",
+            self.address,
+        ]).returncode
+
+    def change_password(self) -> int:
+        """Interactively run passwd on the PLC."""
+        return subprocess.run(self.ssh_command("-t", self.address, "passwd")).returncode
+
+    def transfer(self, source: Path, send: list[str], delete: list[str]) -> None:
+        """Send files from source into ~/bootstrap and delete stale ones."""
+        remote = f"mkdir -p ~/{REMOTE_DIR} && cd ~/{REMOTE_DIR}"
+        if delete:
+            remote += " && rm -f " + " ".join(shlex.quote(name) for name in delete)
+        if not send:
+            proc = self.run(remote)
+        else:
+            # Stream the changed files through the shared connection
+            tar = subprocess.Popen(
+                ["tar", "-cf", "-", "-C", str(source), *send],
+                stdout=subprocess.PIPE,
+            )
+            proc = self.run(remote + " && tar -xf -", stdin=tar.stdout)
+            tar.stdout.close()
+            if tar.wait() != 0:
+                raise RuntimeError(f"tar exited with {tar.returncode}")
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.decode(errors="replace").strip())
+
+    def close(self) -> None:
+        self.mux.close(self.address)
+
+
+def prepare_inventory(hostnames: list[str]) -> int:
+    """Add missing hosts to the inventory and create missing host_vars."""
+    index = InventoryIndex(load_inventory_data(INVENTORY_PATH))
+    for hostname in hostnames:
+        # Asks which group to use, so one host at a time
+        if not index.has_host(hostname) and add_to_inventory.main(hostname):
+            return 1
+    missing_vars = [
+        hostname for hostname in hostnames
+        if not (REPO_ROOT / "host_vars" / hostname / "vars.yml").exists()
+    ]
+    if missing_vars:
+        return make_vars.main(hostnames=missing_vars)
+    return 0
+
+
+def main(
+    hostnames: list[str],
+    username: str = "Administrator",
+    private_key: str = str(DEFAULT_KEY),
+    bootstrap_root: str = DEFAULT_BOOTSTRAP_ROOT,
+    concurrency: int = 8,
+    control_persist: str = "10m",
+    ansible_args: list[str] | None = None,
+) -> int:
+    hostnames = list(dict.fromkeys(hostnames))
+    if prepare_inventory(hostnames):
+        return 1
+
+    failed: dict[str, str] = {}
+    with tempfile.TemporaryDirectory(prefix="tcbsd-ssh-") as control_dir:
+        mux = SSHMultiplexer(Path(control_dir), persist=control_persist)
+        sessions = {
+            hostname: PLCSession(hostname, username, private_key, mux)
+            for hostname in hostnames
+        }
+        pool = ThreadPoolExecutor(max_workers=max(concurrency, 1))
+
+        def probe_all(names: list[str]) -> dict[str, Probe | None]:
+            return dict(zip(names, pool.map(
+                lambda name: sessions[name].probe(), names
+            )))
+
+        try:
+            probes = probe_all(hostnames)
+            needs_key = [name for name, probe in probes.items() if probe is None]
+            for hostname in needs_key:
+                print(f"{hostname}: sending the public key")
+                if sessions[hostname].copy_id() != 0:
+                    failed[hostname] = "ssh-copy-id failed"
+            probes.update(probe_all([name for name in needs_key if name not in failed]))
+
+            for hostname, probe in probes.items():
+                if hostname in failed:
+                    continue
+                if probe is None:
+                    failed[hostname] = "key-based login failed"
+                elif probe.password_warning:
+                    print(f"{hostname}: please change the default password "
+                          "to the standard admin password.")
+                    if sessions[hostname].change_password() != 0:
+                        failed[hostname] = "passwd failed"
+
+            sources: dict[str, Path] = {}
+            to_install = []
+            for hostname, probe in probes.items():
+                if hostname in failed:
+                    continue
+                if probe.has_python:
+                    print(f"{hostname}: already has python3")
+                    continue
+                source = Path(bootstrap_root) / f"bsd{probe.os_major}"
+                if not source.is_dir():
+                    failed[hostname] = (
+                        f"BSD version {probe.freebsd_version} not supported"
+                    )
+                    continue
+                sources[hostname] = source
+                to_install.append(hostname)
+
+            # Each package set is hashed once, however many hosts use it
+            local_hashes = {
+                source: hash_directory(source) for source in set(sources.values())
+            }
+
+            def transfer(hostname: str) -> str:
+                source = sources[hostname]
+                send, delete = plan_transfer(
+                    local_hashes[source], probes[hostname].files
+                )
+                sessions[hostname].transfer(source, send, delete)
+                return (
+                    f"{hostname}: sent {len(send)} of "
+                    f"{len(local_hashes[source])} bootstrap files"
+                )
+
+            futures = {name: pool.submit(transfer, name) for name in to_install}
+            for hostname, future in futures.items():
+                try:
+                    print(future.result())
+                except (OSError, RuntimeError) as ex:
+                    failed[hostname] = f"transfer failed: {ex}"
+                    to_install.remove(hostname)
+
+            if to_install:
+                proc = subprocess.run(
+                    [
+                        "ansible-playbook", str(PLAYBOOK),
+                        "--extra-vars", f"target={','.join(to_install)}",
+                        "--extra-vars", f"ansible_ssh_private_key_file={private_key}",
+                        "--ask-become-pass",
+                        "--forks", str(max(concurrency, 1)),
+                        *(ansible_args or []),
+                    ],
+                    cwd=REPO_ROOT,
+                    env=mux.ansible_env(),
+                )
+                if proc.returncode != 0:
+                    failed.update(
+                        (hostname, "bootstrap playbook failed")
+                        for hostname in to_install
+                    )
+        finally:
+            pool.shutdown()
+            for session in sessions.values():
+                session.close()
+
+    for hostname, reason in failed.items():
+        print(f"{hostname}: {reason}")
+    print(f"{len(hostnames) - len(failed)} of {len(hostnames)} PLCs bootstrapped")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    argv, ansible_args = split_ansible_args(sys.argv[1:])
+    args = parser.parse_args(argv)
+    exit(main(
+        hostnames=args.hostnames,
+        username=args.username,
+        private_key=args.private_key,
+        bootstrap_root=args.bootstrap_root,
+        concurrency=args.concurrency,
+        control_persist=args.control_persist,
+        ansible_args=ansible_args,
+    ))
@@ -0,0 +1,30 @@
+#!/bin/bash
+# Prepare several plcs for use in the ansible scripts at once.
+# This does what bootstrap_plc.sh does, but for a list of plcs, concurrently,
+# over one shared ssh connection per plc, and only copies the bootstrap
+# packages that are not already on the plc.
+# Steps that need you (picking a group, ssh-copy-id, passwd) run one plc at a time.
+#
+# Expected usage, e.g. on the bsd test plcs:
+#
+#   $ ./bootstrap_plcs.sh plc-tst-bsd1 plc-tst-bsd2
+set -e
+
+if [ -z "${1}" ]; then
+  echo "Error: At least one PLC name required"
+  exit 1
+fi
+
+THIS_SCRIPT="$(realpath "${0}")"
+THIS_DIR="$(dirname "${THIS_SCRIPT}")"
+source "${THIS_DIR}"/paths.sh
+
+# Use the correct python env
+source "${THIS_DIR}"/activate_python.sh
+
+# Register the ssh key with the ssh agent if needed
+source "${THIS_DIR}/ssh_agent_helper.sh"
+# Stop the ssh agent at exit if we started it here
+trap ssh_agent_helper_cleanup EXIT
+
+python "${THIS_DIR}"/bootstrap_plcs.py --private-key "${SSH_KEY_FILENAME}" "$@"
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Ansible inventory script serving a precompiled copy of the static inventory.
+
+Compiles inventory/plcs.yaml, group_vars and host_vars into the single JSON
+document Ansible expects from ``--list``, including ``_meta.hostvars``, and
+caches it. The cache is reused until one of the source files changes: a file
+whose mtime and size differ from the recorded ones is rehashed, and the
+document is only recompiled if its content really changed.
+
+The YAML files remain the source of truth. Use it in place of the inventory
+directory, with the host_group_vars plugin disabled since the compiled
+document already contains those vars:
+
+    ANSIBLE_VARS_ENABLED= ansible-playbook -i scripts/compiled_inventory.py ...
+
+provision_plc.sh does this when TCBSD_COMPILED_INVENTORY=1 is set.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import sys
+from pathlib import Path
+from typing import Any
+
+from inventory_loader import read_cache, write_cache, default_cache_dir, parse_yaml
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+VARS_SUFFIXES = ("", ".yml", ".yaml", ".json")
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the parser used for CLI argument parsing."""
+    parser = argparse.ArgumentParser(
+        prog="compiled_inventory.py",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--list", action="store_true", help="Output the inventory")
+    parser.add_argument("--host", type=str, default="", help="Output one host's vars")
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Recompile even if the cached document is up to date",
+    )
+    parser.add_argument("--root", type=str, default=str(REPO_ROOT))
+    return parser
+
+
+def iter_vars_files(vars_root: Path) -> dict[str, list[Path]]:
+    """
+    Find the vars files for each group or host, in the order Ansible loads them.
+
+    Like the host_group_vars plugin, this accepts either a single file named
+    after the entity or a directory of files.
+    """
+    found: dict[str, list[Path]] = {}
+    if not vars_root.is_dir():
+        return found
+    for path in sorted(vars_root.iterdir()):
+        if path.name.startswith("."):
+            continue
+        if path.is_dir():
+            files = sorted(
+                child for child in path.rglob("*")
+                if child.is_file() and child.suffix in VARS_SUFFIXES
+                and not child.name.startswith(".")
+            )
+            name = path.name
+        elif path.suffix in VARS_SUFFIXES:
+            files = [path]
+            name = path.stem
+        else:
+            continue
+        found.setdefault(name, []).extend(files)
+    return found
+
+
+def get_sources(root: Path) -> dict[str, list[Path]]:
+    """Get every file the compiled inventory depends on, including this script."""
+    return dict(
+        compiler=[Path(__file__).resolve()],
+        inventory=[root / "inventory" / "plcs.yaml"],
+        **{
+            f"group_vars/{name}": files
+            for name, files in iter_vars_files(root / "group_vars").items()
+        },
+        **{
+            f"host_vars/{name}": files
+            for name, files in iter_vars_files(root / "host_vars").items()
+        },
+    )
+
+
+def describe_file(path: Path, digest: bool = True) -> list[Any]:
+    """Get the [mtime_ns, size, sha256] used to validate the cache."""
+    stat = path.stat()
+    sha256 = hashlib.sha256(path.read_bytes()).hexdigest() if digest else ""
+    return [stat.st_mtime_ns, stat.st_size, sha256]
+
+
+def sources_unchanged(
+    recorded: dict[str, list[Any]],
+    paths: list[Path],
+) -> bool:
+    """Check the recorded sources against the files on disk."""
+    if sorted(recorded) != sorted(str(path) for path in paths):
+        return False
+    for path in paths:
+        mtime_ns, size, sha256 = recorded[str(path)]
+        current = describe_file(path, digest=False)
+        if current[:2] == [mtime_ns, size]:
+            continue
+        if describe_file(path)[2] != sha256:
+            return False
+    return True
+
+
+def load_vars(files: list[Path]) -> dict[str, Any]:
+    """Load and merge vars files, later files replacing earlier top-level keys."""
+    merged: dict[str, Any] = {}
+    for path in files:
+        data = parse_yaml(path.read_bytes())
+        if data is None:
+            continue
+        if not isinstance(data, dict):
+            raise ValueError(f"{path} does not contain a mapping of variables")
+        merged.update(data)
+    return merged
+
+
+def compile_inventory(root: Path, sources: dict[str, list[Path]]) -> dict[str, Any]:
+    """Build the ``--list`` document from the YAML sources."""
+    inventory = parse_yaml(sources["inventory"][0].read_bytes()) or {}
+    document: dict[str, Any] = {}
+    hostvars: dict[str, dict[str, Any]] = {}
+
+    for group, group_data in inventory.items():
+        group_data = group_data or {}
+        hosts = group_data.get("hosts") or {}
+        # Always list hosts: Ansible reads a group with no known keys as a host
+        entry: dict[str, Any] = dict(hosts=list(hosts))
+        for hostname, inline_vars in hosts.items():
+            hostvars.setdefault(hostname, {}).update(inline_vars or {})
+        if group_data.get("children"):
+            entry["children"] = list(group_data["children"])
+        if group_data.get("vars"):
+            entry["vars"] = dict(group_data["vars"])
+        document[group] = entry
+
+    for key, files in sources.items():
+        kind, _, name = key.partition("/")
+        if kind == "group_vars":
+            group_entry = document.setdefault(name, dict(hosts=[]))
+            group_vars = group_entry.setdefault("vars", {})
+            group_vars.update(load_vars(files))
+        elif kind == "host_vars" and name in hostvars:
+            hostvars[name].update(load_vars(files))
+
+    document["_meta"] = dict(hostvars=hostvars)
+    return document
+
+
+def load_compiled_inventory(
+    root: str | Path = REPO_ROOT,
+    cache_dir: str | Path | None = None,
+    rebuild: bool = False,
+) -> dict[str, Any]:
+    """Get the compiled inventory, from the cache if the sources are unchanged."""
+    root = Path(root).resolve()
+    sources = get_sources(root)
+    paths = [path for files in sources.values() for path in files]
+    key = hashlib.sha256(str(root).encode()).hexdigest()[:16]
+    cache_file = Path(cache_dir or default_cache_dir()) / f"inventory-{key}.json"
+
+    if not rebuild:
+        entry = read_cache(cache_file)
+        if entry is not None and sources_unchanged(entry.get("sources", {}), paths):
+            return entry["inventory"]
+
+    document = compile_inventory(root, sources)
+    write_cache(cache_file, dict(
+        sources={str(path): describe_file(path) for path in paths},
+        inventory=document,
+    ))
+    return document
+
+
+def main(list_: bool, host: str, rebuild: bool, root: str) -> int:
+    try:
+        document = load_compiled_inventory(root=root, rebuild=rebuild)
+    except Exception as ex:
+        print(f"Unable to compile the inventory: {ex}", file=sys.stderr)
+        return 1
+    if host:
+        json.dump(document["_meta"]["hostvars"].get(host, {}), sys.stdout)
+    elif list_ or rebuild:
+        json.dump(document, sys.stdout)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    args = parser.parse_args()
+    if not (args.list or args.host or args.rebuild):
+        parser.error("one of --list, --host or --rebuild is required")
+    exit(main(list_=args.list, host=args.host, rebuild=args.rebuild, root=args.root))
@@ -0,0 +1,244 @@
+"""
+Group PLCs into cohorts that share an identical effective configuration.
+
+Merges the group_vars and host_vars of every host in one pass, the way
+Ansible does (deeper groups override their parents, then host vars override
+groups), hashes each host's result and groups hosts with the same hash.
+Each cohort is listed with how it differs from the defaults of its vars
+group, so hosts can be provisioned or canaried a cohort at a time.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from compiled_inventory import load_compiled_inventory
+from inventory_index import InventoryIndex
+from make_vars import find_vars_group, get_group_options
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_IGNORE = ("ansible_host",)
+_UNSET = object()
+
+
+class Cohort(NamedTuple):
+    """Hosts sharing one effective configuration."""
+
+    digest: str
+    vars_group: str
+    hosts: list[str]
+    config: dict[str, Any]
+    diff: dict[str, dict[str, Any]]
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the parser used for CLI argument parsing."""
+    parser = argparse.ArgumentParser(
+        prog="config_cohorts.py",
+        description=__doc__,
+    )
+    parser.add_argument(
+        "target",
+        type=str,
+        nargs="?",
+        default="all",
+        help="Inventory group or host to consider (default: all)",
+    )
+    parser.add_argument(
+        "--ignore",
+        type=str,
+        nargs="*",
+        default=list(DEFAULT_IGNORE),
+        help="Variables left out of the comparison (default: ansible_host)",
+    )
+    parser.add_argument("--json", action="store_true", help="Output JSON")
+    return parser
+
+
+def group_depths(index: InventoryIndex) -> dict[str, int]:
+    """Get each group's depth below "all", as Ansible uses to order group vars."""
+    depths = {"all": 0}
+    parents: dict[str, list[str]] = {}
+    for parent, children in index.children.items():
+        for child in children:
+            parents.setdefault(child, []).append(parent)
+
+    def depth(group: str, seen: frozenset[str] = frozenset()) -> int:
+        if group in depths:
+            return depths[group]
+        if group in seen:
+            return 1
+        depths[group] = 1 + max(
+            (depth(parent, seen | {group}) for parent in parents.get(group, ())),
+            default=0,
+        )
+        return depths[group]
+
+    for group in index.groups:
+        depth(group)
+    return depths
+
+
+def config_digest(config: dict[str, Any]) -> str:
+    """Hash a configuration independently of key order."""
+    text = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def diff_config(
+    defaults: dict[str, Any],
+    config: dict[str, Any],
+) -> dict[str, dict[str, Any]]:
+    """Describe the keys whose value in config differs from defaults."""
+    diff = {}
+    for key in sorted(set(defaults) | set(config)):
+        before = defaults.get(key, _UNSET)
+        after = config.get(key, _UNSET)
+        if before != after:
+            diff[key] = dict(
+                default=None if before is _UNSET else before,
+                value=None if after is _UNSET else after,
+                **({"unset_by_default": True} if before is _UNSET else {}),
+            )
+    return diff
+
+
+class EffectiveConfigs:
+    """Effective variables for every host, computed from one compiled inventory."""
+
+    def __init__(self, root: str | Path = REPO_ROOT):
+        self.root = Path(root)
+        self.document = load_compiled_inventory(root=self.root)
+        inventory = {
+            group: entry for group, entry in self.document.items()
+            if group != "_meta"
+        }
+        self.index = InventoryIndex(inventory)
+        self.group_vars = {
+            group: entry.get("vars") or {} for group, entry in inventory.items()
+        }
+        self.group_vars.setdefault("all", {})
+        self.depths = group_depths(self.index)
+        self.group_options = get_group_options(self.root / "group_vars")
+
+    def group_defaults(self, hostname: str) -> dict[str, Any]:
+        """Merge the vars of all of a host's groups, shallowest first."""
+        groups = sorted(
+            set(self.index.groups_of(hostname)) | {"all"},
+            key=lambda group: (self.depths.get(group, 1), group),
+        )
+        merged: dict[str, Any] = {}
+        for group in groups:
+            merged.update(self.group_vars.get(group, {}))
+        return merged
+
+    def host_config(self, hostname: str) -> dict[str, Any]:
+        """Get the effective variables for a host."""
+        merged = self.group_defaults(hostname)
+        merged.update(self.document["_meta"]["hostvars"].get(hostname, {}))
+        return merged
+
+    def hosts(self, target: str = "all") -> list[str]:
+        """Get the hosts matched by a group name or a hostname."""
+        if target == "all":
+            return list(self.index.direct_groups)
+        if self.index.has_host(target):
+            return [target]
+        if target in self.index.group_hosts:
+            return self.index.hosts_of(target)
+        raise RuntimeError(f"{target} is not a group or host in the inventory!")
+
+    def cohorts(
+        self,
+        target: str = "all",
+        ignore: tuple[str, ...] | list[str] = DEFAULT_IGNORE,
+    ) -> list[Cohort]:
+        """Group hosts by vars group and identical effective configuration."""
+        found: dict[tuple[str, str], Cohort] = {}
+        for hostname in self.hosts(target):
+            try:
+                vars_group = find_vars_group(
+                    hostname=hostname,
+                    index=self.index,
+                    group_options=self.group_options,
+                )
+            except RuntimeError:
+                vars_group = ""
+            config = {
+                key: value for key, value in self.host_config(hostname).items()
+                if key not in ignore
+            }
+            digest = config_digest(config)
+            cohort = found.get((vars_group, digest))
+            if cohort is None:
+                defaults = {
+                    key: value
+                    for key, value in self.group_defaults(hostname).items()
+                    if key not in ignore
+                }
+                cohort = Cohort(
+                    digest=digest,
+                    vars_group=vars_group,
+                    hosts=[],
+                    config=config,
+                    diff=diff_config(defaults, config),
+                )
+                found[(vars_group, digest)] = cohort
+            cohort.hosts.append(hostname)
+        return sorted(
+            found.values(),
+            key=lambda cohort: (cohort.vars_group, -len(cohort.hosts), cohort.digest),
+        )
+
+
+def format_cohorts(cohorts: list[Cohort]) -> str:
+    """Describe cohorts for humans."""
+    lines = []
+    for number, cohort in enumerate(cohorts, start=1):
+        lines.append(
+            f"Cohort {number} ({cohort.vars_group or 'no vars group'}, "
+            f"{len(cohort.hosts)} host{'' if len(cohort.hosts) == 1 else 's'}, "
+            f"{cohort.digest[:12]}):"
+        )
+        lines.append(f"  hosts: {', '.join(sorted(cohort.hosts))}")
+        if not cohort.diff:
+            lines.append("  same as the group defaults")
+        for key, change in cohort.diff.items():
+            default = (
+                "(unset)" if change.get("unset_by_default")
+                else json.dumps(change["default"], default=str)
+            )
+            value = json.dumps(change["value"], default=str)
+            lines.append(f"  {key}: {default} -> {value}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def main(target: str, ignore: list[str], json_output: bool) -> int:
+    cohorts = EffectiveConfigs().cohorts(target=target, ignore=tuple(ignore))
+    if json_output:
+        print(json.dumps(
+            [
+                dict(
+                    digest=cohort.digest,
+                    vars_group=cohort.vars_group,
+                    hosts=sorted(cohort.hosts),
+                    diff=cohort.diff,
+                )
+                for cohort in cohorts
+            ],
+            indent=2,
+            default=str,
+        ))
+    else:
+        print(format_cohorts(cohorts))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    args = parser.parse_args()
+    exit(main(target=args.target, ignore=args.ignore, json_output=args.json))
@@ -10,6 +10,11 @@
 #   $ ./dry_run.sh tst_all
 #
 # Groups are defined in the inventory file.
+#
+# PLC facts gathered less than tc_facts_cache_ttl seconds ago are reused from
+# the controller cache.  To gather them again:
+#
+#   $ ./dry_run.sh tst_all -e tc_facts_cache_ttl=0
 set -e
 
 if [ -z "${1}" ]; then
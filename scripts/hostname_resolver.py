@@ -0,0 +1,127 @@
+"""
+Cached, concurrent hostname resolution for the helper scripts.
+
+Lookups go through a replaceable ``lookup`` callable, so a local stand-in can
+be used in place of site DNS.
+"""
+from __future__ import annotations
+
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable
+
+Lookup = Callable[[str], str]
+
+
+class ResolutionError(RuntimeError):
+    """A hostname could not be resolved in time."""
+
+
+def lookup_ipv4_address(hostname: str) -> str:
+    """
+    Get the first IPv4 address of hostname, as gethostbyname would.
+
+    getaddrinfo is used because it is thread-safe everywhere, and it is
+    looked up on each call so that it can be patched for testing.
+    """
+    infos = socket.getaddrinfo(hostname, None, socket.AF_INET, socket.SOCK_STREAM)
+    return infos[0][4][0]
+
+
+class Resolver:
+    """Hostname to IPv4 address resolution with a TTL cache and timeouts."""
+
+    def __init__(
+        self,
+        lookup: Lookup = lookup_ipv4_address,
+        ttl: float = 300.0,
+        timeout: float | None = 5.0,
+        max_workers: int = 8,
+    ):
+        self.lookup = lookup
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.lookups = 0
+        self._cache: dict[str, tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def _get_cached(self, hostname: str) -> str | None:
+        with self._lock:
+            entry = self._cache.get(hostname)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def _lookup_with_timeout(self, hostname: str) -> str:
+        with self._lock:
+            self.lookups += 1
+        if self.timeout is None:
+            return self.lookup(hostname)
+
+        # getaddrinfo cannot be interrupted, so wait on it from a daemon
+        # thread that is abandoned if it does not finish in time.
+        outcome: dict[str, Any] = {}
+
+        def target() -> None:
+            try:
+                outcome["address"] = self.lookup(hostname)
+            except Exception as ex:
+                outcome["error"] = ex
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(self.timeout)
+        if thread.is_alive():
+            raise ResolutionError(
+                f"Timed out resolving {hostname} after {self.timeout} seconds"
+            )
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["address"]
+
+    def clear(self) -> None:
+        """Forget all cached addresses."""
+        with self._lock:
+            self._cache.clear()
+
+    def resolve(self, hostname: str) -> str:
+        """Resolve a single hostname, using the cache where possible."""
+        address = self._get_cached(hostname)
+        if address is None:
+            address = self._lookup_with_timeout(hostname)
+            with self._lock:
+                self._cache[hostname] = (time.monotonic() + self.ttl, address)
+        return address
+
+    def resolve_all(
+        self,
+        hostnames: Iterable[str],
+    ) -> tuple[dict[str, str], dict[str, Exception]]:
+        """
+        Resolve many hostnames concurrently.
+
+        Returns a mapping of hostname to address for each host that resolved
+        and a mapping of hostname to exception for each host that did not.
+        """
+        unique = list(dict.fromkeys(hostnames))
+        addresses: dict[str, str] = {}
+        errors: dict[str, Exception] = {}
+        if not unique:
+            return addresses, errors
+
+        def resolve_one(hostname: str) -> None:
+            try:
+                addresses[hostname] = self.resolve(hostname)
+            except Exception as ex:
+                errors[hostname] = ex
+
+        workers = min(max(self.max_workers, 1), len(unique))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(resolve_one, unique))
+        return addresses, errors
+
+
+RESOLVER = Resolver()
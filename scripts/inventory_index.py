@@ -0,0 +1,112 @@
+"""
+Host and group lookups for the plcs.yaml inventory, built in a single walk.
+
+The inventory maps group names to a "hosts" dict, a "children" dict of
+sub-group names, or both. The index answers "which groups is this host in"
+and "which hosts are in this group", both directly and through children,
+with constant-time membership checks.
+"""
+from __future__ import annotations
+
+from typing import Any, Iterable, Mapping
+
+# Dicts are used as insertion-ordered sets throughout
+_OrderedSet = dict[str, None]
+
+
+class InventoryIndex:
+    """
+    Precomputed host/group relationships for an inventory.
+
+    Children hierarchies that loop back on themselves are recorded in
+    ``cycles`` rather than followed forever. Hosts listed directly under more
+    than one group are recorded in ``duplicate_hosts``.
+    """
+
+    def __init__(self, inventory: Mapping[str, Any]):
+        self.groups: list[str] = list(inventory)
+        self.direct_hosts: dict[str, _OrderedSet] = {}
+        self.children: dict[str, list[str]] = {}
+        self.direct_groups: dict[str, _OrderedSet] = {}
+        for group, group_data in inventory.items():
+            group_data = group_data or {}
+            hosts = dict.fromkeys(group_data.get("hosts") or ())
+            self.direct_hosts[group] = hosts
+            self.children[group] = list(group_data.get("children") or ())
+            for hostname in hosts:
+                self.direct_groups.setdefault(hostname, {})[group] = None
+
+        self.cycles: list[list[str]] = []
+        self.group_hosts: dict[str, _OrderedSet] = {}
+        for group in self.groups:
+            self._collect(group, path=[])
+
+        self.host_groups: dict[str, _OrderedSet] = {}
+        for group, hosts in self.group_hosts.items():
+            for hostname in hosts:
+                self.host_groups.setdefault(hostname, {})[group] = None
+
+        self.duplicate_hosts: dict[str, list[str]] = {
+            hostname: list(groups)
+            for hostname, groups in self.direct_groups.items()
+            if len(groups) > 1
+        }
+
+    def _collect(self, group: str, path: list[str]) -> _OrderedSet:
+        """Gather the hosts of ``group`` and its children, memoized."""
+        if group in self.group_hosts:
+            return self.group_hosts[group]
+        if group in path:
+            self.cycles.append(path[path.index(group):] + [group])
+            return {}
+        hosts = dict(self.direct_hosts.get(group, {}))
+        path.append(group)
+        for child in self.children.get(group, ()):
+            hosts.update(self._collect(child, path))
+        path.pop()
+        self.group_hosts[group] = hosts
+        return hosts
+
+    def has_host(self, hostname: str) -> bool:
+        """Return True if hostname is listed anywhere in the inventory."""
+        return hostname in self.direct_groups
+
+    def in_group(self, hostname: str, group: str) -> bool:
+        """Return True if hostname is in group, directly or via its children."""
+        return hostname in self.group_hosts.get(group, ())
+
+    def groups_of(self, hostname: str, direct: bool = False) -> list[str]:
+        """Get the groups a host belongs to, optionally only the direct ones."""
+        groups = self.direct_groups if direct else self.host_groups
+        return list(groups.get(hostname, ()))
+
+    def hosts_of(self, group: str, direct: bool = False) -> list[str]:
+        """Get the hosts in a group, optionally excluding those of its children."""
+        hosts = self.direct_hosts if direct else self.group_hosts
+        return list(hosts.get(group, ()))
+
+    def add_host(self, hostname: str, group: str) -> None:
+        """Record that hostname was added directly to group."""
+        self.direct_hosts.setdefault(group, {})[hostname] = None
+        self.direct_groups.setdefault(hostname, {})[group] = None
+        if len(self.direct_groups[hostname]) > 1:
+            self.duplicate_hosts[hostname] = list(self.direct_groups[hostname])
+        for ancestor in self._ancestors(group):
+            self.group_hosts.setdefault(ancestor, {})[hostname] = None
+            self.host_groups.setdefault(hostname, {})[ancestor] = None
+
+    def _ancestors(self, group: str) -> Iterable[str]:
+        """Yield group and every group that contains it through children."""
+        parents: dict[str, list[str]] = {}
+        for parent, children in self.children.items():
+            for child in children:
+                parents.setdefault(child, []).append(parent)
+        seen = set()
+        pending = [group]
+        while pending:
+            current = pending.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            yield current
+            pending.extend(parents.get(current, ()))
@@ -0,0 +1,128 @@
+"""
+Fast, cached read-only loading of YAML files such as the inventory.
+
+Read-only callers get plain dicts and lists from PyYAML's C safe loader,
+falling back to the pure Python one when libyaml is missing. Parsed results
+are cached as JSON, keyed by the file's path, mtime and content hash, so
+repeated calls from the shell scripts skip parsing entirely. Results that
+JSON would change, such as integer keys or dates, are not cached, so a warm
+cache returns the same types as a fresh parse. Callers that are about to
+rewrite the file should keep using ruamel's round-trip loader.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+try:
+    SafeLoader = yaml.CSafeLoader
+except AttributeError:
+    SafeLoader = yaml.SafeLoader
+
+# Kept in step with module_utils/tcbsd_cache.py, which the plugins use
+CACHE_DIR_ENV = "TCBSD_ANSIBLE_CACHE_DIR"
+CACHE_VERSION = 2
+
+
+def default_cache_dir() -> Path:
+    """Get the cache directory, which can be overridden with an env var."""
+    if os.environ.get(CACHE_DIR_ENV):
+        return Path(os.environ[CACHE_DIR_ENV])
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "twincat-bsd-ansible"
+
+
+def load_cached_facts(hostname: str) -> dict[str, Any] | None:
+    """Get the facts the tcbsd_facts action plugin cached for a host."""
+    path = default_cache_dir() / "facts" / f"{hostname}.json"
+    try:
+        return json.loads(path.read_text())["facts"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def cache_path_for(path: str | Path, cache_dir: str | Path | None = None) -> Path:
+    """Get the cache file used for the YAML file at path."""
+    key = hashlib.sha256(str(Path(path).resolve()).encode()).hexdigest()[:16]
+    return Path(cache_dir or default_cache_dir()) / f"yaml-{key}.json"
+
+
+def parse_yaml(data: bytes | str) -> Any:
+    """Parse YAML into plain Python objects with the fastest safe loader."""
+    return yaml.load(data, Loader=SafeLoader)
+
+
+def read_cache(cache_file: Path) -> dict[str, Any] | None:
+    try:
+        with cache_file.open("r") as fd:
+            return json.load(fd)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(cache_file: Path, entry: dict[str, Any]) -> None:
+    """
+    Write a cache entry atomically. Failing to cache is not an error.
+
+    Entries that would not read back equal, such as ones with integer keys
+    or dates, are not written.
+    """
+    try:
+        text = json.dumps(entry)
+        if json.loads(text) != entry:
+            return
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=cache_file.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as fp:
+            fp.write(text)
+        os.replace(temp_name, cache_file)
+    except (OSError, TypeError, ValueError):
+        pass
+
+
+def load_yaml_cached(
+    path: str | Path,
+    cache_dir: str | Path | None = None,
+    use_cache: bool = True,
+) -> Any:
+    """
+    Load a YAML file read-only, using the on-disk cache where possible.
+
+    The cache entry is only used if the path, mtime and sha256 of the file
+    all match what was recorded when it was parsed.
+    """
+    path = Path(path).resolve()
+    data = path.read_bytes()
+    if not use_cache:
+        return parse_yaml(data)
+
+    key = dict(
+        # Earlier caches could hold JSON-changed results; they are not reused
+        version=CACHE_VERSION,
+        path=str(path),
+        mtime_ns=path.stat().st_mtime_ns,
+        sha256=hashlib.sha256(data).hexdigest(),
+    )
+    cache_file = cache_path_for(path, cache_dir)
+    entry = read_cache(cache_file)
+    if entry is not None and entry.get("key") == key:
+        return entry["data"]
+
+    parsed = parse_yaml(data)
+    write_cache(cache_file, dict(key=key, data=parsed))
+    return parsed
+
+
+def load_inventory_data(
+    path: str | Path,
+    cache_dir: str | Path | None = None,
+    use_cache: bool = True,
+) -> dict[str, Any]:
+    """Load the inventory read-only, as plain dicts."""
+    return load_yaml_cached(path, cache_dir=cache_dir, use_cache=use_cache) or {}
@@ -3,17 +3,22 @@ Script to make a host-specific vars.yml from the tcbsd-plc.yaml.template
 
 Includes the defaults for all variables as a commented-out section below,
 for easy per-host reconfiguration.
+
+Several hosts can be handled at once: list them, pick an inventory group with
+--group, or use --all-missing for every inventory host without a vars.yml.
+Existing files are left alone unless --force is given.
 """
 from __future__ import annotations
 
 import argparse
-import socket
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterator
 from pathlib import Path
 
-from ruamel.yaml import YAML
-
-_Inventory = dict[str, dict]
+from hostname_resolver import RESOLVER, Resolver
+from inventory_index import InventoryIndex
+from inventory_loader import load_inventory_data
 
 
 def get_parser() -> argparse.ArgumentParser:
@@ -22,45 +27,92 @@ def get_parser() -> argparse.ArgumentParser:
         prog="make_vars.py",
         description=__doc__,
     )
-    parser.add_argument("hostname", type=str)
+    parser.add_argument("hostnames", type=str, nargs="*")
+    parser.add_argument(
+        "--group",
+        type=str,
+        default="",
+        help="Also make vars for every host in this inventory group",
+    )
+    parser.add_argument(
+        "--all-missing",
+        action="store_true",
+        help="Also make vars for every inventory host that has none yet",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Overwrite existing host vars files",
+    )
+    parser.add_argument("--workers", type=int, default=8)
     return parser
 
 
+def load_index(inventory_path: str | Path) -> InventoryIndex:
+    """Load the inventory read-only and index it, rejecting cyclic groups."""
+    index = InventoryIndex(load_inventory_data(inventory_path))
+    if index.cycles:
+        cycles = "; ".join(" -> ".join(cycle) for cycle in index.cycles)
+        raise RuntimeError(f"Inventory has cyclic children groups: {cycles}")
+    return index
+
+
+def get_group_options(groups_path: str | Path) -> list[str]:
+    """Get the names of the groups that have group vars."""
+    return [path.name for path in Path(groups_path).glob("*")]
+
+
+def find_vars_groups(
+    hostname: str,
+    index: InventoryIndex,
+    group_options: list[str],
+) -> list[str]:
+    """Get the names of every vars group a host belongs to, using an index."""
+    return sorted(group for group in group_options if index.in_group(hostname, group))
+
+
+def find_vars_group(
+    hostname: str,
+    index: InventoryIndex,
+    group_options: list[str],
+) -> str:
+    """
+    Get the name of the vars group a host belongs to, using an index.
+
+    A host in more than one vars group is an error, since there is no
+    telling which group's defaults it should get.
+    """
+    groups = find_vars_groups(hostname, index, group_options)
+    if not groups:
+        raise RuntimeError(f"Did not find {hostname} in any vars groups!")
+    if len(groups) > 1:
+        raise RuntimeError(
+            f"{hostname} is in more than one vars group: {', '.join(groups)}"
+        )
+    return groups[0]
+
+
 def get_group(
     hostname: str,
     inventory_path: str | Path,
     groups_path: str | Path,
 ) -> str:
     """For a given hostname, get the name of the vars group it belongs to."""
-    yaml = YAML()
-    with Path(inventory_path).open("r") as fd:
-        inventory_data = yaml.load(fd)
-    group_options = [path.name for path in Path(groups_path).glob("*")]
-    for group in group_options:
-        if hostname in iter_child_hosts(inventory_data=inventory_data, group=group):
-            return group
-    raise RuntimeError(f"Did not find {hostname} in any vars groups!")
-
-
-def iter_child_hosts(inventory_data: _Inventory, group: str) -> Iterator[str]:
-    """Yield all the hostnames associated with a group."""
-    group_data = inventory_data[group]
-    hosts_dicts = group_data.get("hosts")
-    if hosts_dicts is not None:
-        for hostname in hosts_dicts:
-            yield hostname
-    child_dicts = group_data.get("children")
-    if child_dicts is not None:
-        for child_group in child_dicts:
-            yield from iter_child_hosts(
-                inventory_data=inventory_data,
-                group=child_group,
-            )
+    return find_vars_group(
+        hostname=hostname,
+        index=load_index(inventory_path),
+        group_options=get_group_options(groups_path),
+    )
+
+
+def iter_child_hosts(index: InventoryIndex, group: str) -> Iterator[str]:
+    """Yield all the hostnames associated with a group, from a built index."""
+    yield from index.hosts_of(group)
 
 
-def get_netid(hostname: str) -> str:
+def get_netid(hostname: str, resolver: Resolver | None = None) -> str:
     """Get the expected AMS netid for a given hostname."""
-    ipaddr = socket.gethostbyname(hostname)
+    ipaddr = (resolver or RESOLVER).resolve(hostname)
     return ipaddr + ".1.1"
 
 
@@ -80,6 +132,7 @@ def tcbsd_plcs_extra_vars() -> dict[str, str]:
 
 def tcbsd_vms_extra_vars(
     hostname: str,
+    resolver: Resolver | None = None,
 ) -> dict[str, str]:
     """
     Assign a starting ams net id for the tcbsd vms.
@@ -87,7 +140,26 @@ def tcbsd_vms_extra_vars(
     The IPs for these can be less stable than for CDS PLCs,
     so don't dynamically update it every run.
     """
-    return {"tc_ams_net_id": get_netid(hostname)}
+    return {"tc_ams_net_id": get_netid(hostname, resolver=resolver)}
+
+
+def get_extra_vars(
+    hostname: str,
+    group: str,
+    resolver: Resolver | None = None,
+) -> dict[str, str]:
+    """Get the group-specific extra vars for a new host vars file."""
+    if group == "tcbsd_plcs":
+        return tcbsd_plcs_extra_vars()
+    elif group == "tcbsd_vms":
+        return tcbsd_vms_extra_vars(hostname, resolver=resolver)
+    return {}
+
+
+def read_commented_group_vars(group_vars_path: str | Path) -> list[str]:
+    """Load the group vars, prepending each line with a comment."""
+    with Path(group_vars_path).open("r") as fd:
+        return ["#" + line for line in fd.read().splitlines()[1:]]
 
 
 def write_host_vars(
@@ -95,13 +167,13 @@ def write_host_vars(
     host_vars_path: str | Path,
     group_vars_path: str | Path,
     extra_vars: dict[str, str] | None = None,
+    group_vars_lines: list[str] | None = None,
 ) -> None:
     """Write the vars.yml file given the necessary information."""
     if extra_vars is None:
         extra_vars = {}
-    # Load the group vars, prepend with comment
-    with Path(group_vars_path).open("r") as fd:
-        group_vars_lines = ["#" + line for line in fd.read().splitlines()[1:]]
+    if group_vars_lines is None:
+        group_vars_lines = read_commented_group_vars(group_vars_path)
     # Write the new file
     with Path(host_vars_path).open("w") as fd:
         fd.write("---\n")
@@ -118,38 +190,134 @@ def write_host_vars(
         fd.write("\n")
 
 
-def main(hostname: str) -> int:
+def select_hosts(
+    index: InventoryIndex,
+    hostnames: list[str],
+    group: str,
+    all_missing: bool,
+    group_options: list[str],
+    host_vars_root: Path,
+) -> list[str]:
+    """Get the unique hosts to make vars for, in the order requested."""
+    selected = list(hostnames)
+    if group:
+        if group not in index.group_hosts:
+            raise RuntimeError(f"Group {group} is not in the inventory!")
+        selected.extend(index.hosts_of(group))
+    if all_missing:
+        for vars_group in group_options:
+            selected.extend(
+                hostname for hostname in index.hosts_of(vars_group)
+                if not (host_vars_root / hostname / "vars.yml").exists()
+            )
+    return list(dict.fromkeys(selected))
+
+
+def main(
+    hostnames: list[str],
+    group: str = "",
+    all_missing: bool = False,
+    force: bool = False,
+    workers: int = 8,
+) -> int:
     repo_root = Path(__file__).parent.parent
     inventory_path = repo_root / "inventory" / "plcs.yaml"
     groups_path = repo_root / "group_vars"
-    group = get_group(
-        hostname=hostname,
-        inventory_path=inventory_path,
-        groups_path=groups_path,
+    host_vars_root = repo_root / "host_vars"
+    index = load_index(inventory_path)
+    group_options = get_group_options(groups_path)
+    selected = select_hosts(
+        index=index,
+        hostnames=hostnames,
+        group=group,
+        all_missing=all_missing,
+        group_options=group_options,
+        host_vars_root=host_vars_root,
     )
-    if group == "tcbsd_plcs":
-        extra_vars = tcbsd_plcs_extra_vars()
-    elif group == "tcbsd_vms":
-        extra_vars = tcbsd_vms_extra_vars(hostname)
-    else:
-        extra_vars = {}
-    group_vars_path = groups_path / group / "vars.yml"
-    host_vars_path = repo_root / "host_vars" / hostname / "vars.yml"
-    host_vars_path.parent.mkdir(exist_ok=True)
-    write_host_vars(
-        hostname=hostname,
-        host_vars_path=host_vars_path,
-        group_vars_path=group_vars_path,
-        extra_vars=extra_vars,
-    )
-    print(
-        f"Created {host_vars_path}, "
-        "please edit this as needed for plc-specific settings."
+
+    created: list[Path] = []
+    skipped: list[Path] = []
+    failed: dict[str, str] = {}
+    vars_groups: dict[str, str] = {}
+    for hostname in selected:
+        if hostname in index.duplicate_hosts:
+            groups = ", ".join(index.duplicate_hosts[hostname])
+            print(
+                f"Warning: {hostname} is listed under more than one group: {groups}",
+                file=sys.stderr,
+            )
+        host_vars_path = host_vars_root / hostname / "vars.yml"
+        if host_vars_path.exists() and not force:
+            skipped.append(host_vars_path)
+            continue
+        try:
+            vars_groups[hostname] = find_vars_group(
+                hostname=hostname, index=index, group_options=group_options,
+            )
+        except RuntimeError as ex:
+            failed[hostname] = str(ex)
+
+    # Resolve every vm's AMS net id up front, concurrently, into the cache
+    _, errors = RESOLVER.resolve_all(
+        hostname for hostname, vars_group in vars_groups.items()
+        if vars_group == "tcbsd_vms"
     )
-    return 0
+    for hostname, ex in errors.items():
+        failed[hostname] = f"Could not resolve {hostname}: {ex}"
+        del vars_groups[hostname]
+
+    group_vars_lines = {
+        vars_group: read_commented_group_vars(groups_path / vars_group / "vars.yml")
+        for vars_group in set(vars_groups.values())
+    }
+
+    def make_one(hostname: str) -> None:
+        vars_group = vars_groups[hostname]
+        host_vars_path = host_vars_root / hostname / "vars.yml"
+        try:
+            host_vars_path.parent.mkdir(exist_ok=True)
+            write_host_vars(
+                hostname=hostname,
+                host_vars_path=host_vars_path,
+                group_vars_path=groups_path / vars_group / "vars.yml",
+                extra_vars=get_extra_vars(hostname, vars_group),
+                group_vars_lines=group_vars_lines[vars_group],
+            )
+        except Exception as ex:
+            failed[hostname] = f"{type(ex).__name__}: {ex}"
+        else:
+            created.append(host_vars_path)
+
+    if vars_groups:
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            list(executor.map(make_one, vars_groups))
+
+    for host_vars_path in sorted(created):
+        print(
+            f"Created {host_vars_path}, "
+            "please edit this as needed for plc-specific settings."
+        )
+    for host_vars_path in skipped:
+        print(f"{host_vars_path} already exists, skipping (use --force to replace).")
+    for hostname, reason in failed.items():
+        print(f"Failed to make vars for {hostname}: {reason}", file=sys.stderr)
+    if len(selected) > 1:
+        print(
+            f"Created {len(created)}, skipped {len(skipped)}, "
+            f"failed {len(failed)} of {len(selected)} hosts."
+        )
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
     parser = get_parser()
     args = parser.parse_args()
-    exit(main(hostname=args.hostname))
+    if not (args.hostnames or args.group or args.all_missing):
+        parser.error("give at least one hostname, --group or --all-missing")
+    exit(main(
+        hostnames=args.hostnames,
+        group=args.group,
+        all_missing=args.all_missing,
+        force=args.force,
+        workers=args.workers,
+    ))
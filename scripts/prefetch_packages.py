@@ -0,0 +1,485 @@
+"""
+Prefetch TwinCAT packages on the controller and push them to the PLCs.
+
+Works out the union of packages the targeted hosts need from the SLAC
+mirror: the pinned TC31-XAR build plus tc_libraries, tc_tools_packages,
+tc_packages_to_install and their dependencies. Each file is downloaded once
+into a content-addressed cache on the controller and checked against the
+catalog's sha256. Then each PLC is sent only the files its pkg cache is
+missing, so the following pkg install does not download them again.
+
+Writing to the pkg cache needs root, and doas on the PLCs asks for a
+password, so the push has two steps.  rsync copies the missing files as the
+login user into a staging directory in its home.  Then one ansible run
+moves them into the pkg cache with become, prompting once for the password
+with --ask-become-pass, the same as the provision playbook.
+
+The mirror is given as a URL template, so a local file:// repository can
+stand in for the real mirror.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import shlex
+import subprocess
+import tarfile
+import tempfile
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Iterable, NamedTuple
+
+from config_cohorts import EffectiveConfigs
+from inventory_loader import default_cache_dir, load_cached_facts
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SSH_CONFIG = REPO_ROOT / "ssh_config"
+DEFAULT_KEY = Path.home() / ".ssh" / "tcbsd_key_rsa"
+# Same layout as templates/etc/pkg/SLAC.conf
+DEFAULT_MIRROR = "https://sdfrepo.sdf.slac.stanford.edu/tcbsd/{os_major}/{xar_version}"
+CATALOG_NAMES = ("packagesite.pkg", "packagesite.txz")
+PKG_CACHE_DIR = "/var/cache/pkg"
+# Relative to the login user's home on the PLC
+STAGING_DIR = ".tcbsd-pkg-prefetch"
+XAR_PACKAGE = "TC31-XAR"
+PACKAGE_VARS = ("tc_libraries", "tc_tools_packages", "tc_packages_to_install")
+# e.g. "plc-tst-bsd1 | CHANGED | rc=0 >>" or "plc-tst-bsd1 | UNREACHABLE! => {"
+MINIMAL_HEADER = re.compile(
+    r"^(?P<host>\S+) \| (?P<status>[A-Z]+)!?(?: \| .*>>| => (?P<json>.*))?$"
+)
+
+
+class CatalogEntry(NamedTuple):
+    """One package from a repository's packagesite.yaml."""
+
+    name: str
+    version: str
+    repopath: str
+    sha256: str
+    size: int
+    deps: tuple[str, ...]
+
+    @classmethod
+    def from_manifest(cls, manifest: dict[str, Any]) -> CatalogEntry:
+        return cls(
+            name=manifest["name"],
+            version=manifest["version"],
+            repopath=manifest["repopath"],
+            sha256=manifest["sum"],
+            size=int(manifest.get("pkgsize", 0)),
+            deps=tuple(manifest.get("deps") or ()),
+        )
+
+    @property
+    def cache_name(self) -> str:
+        """The file name pkg (1.11+) uses for this package in its cache."""
+        return f"{self.name}-{self.version}~{self.sha256[:10]}.pkg"
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the parser used for CLI argument parsing."""
+    parser = argparse.ArgumentParser(
+        prog="prefetch_packages.py",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("target", type=str, help="Inventory group or host")
+    parser.add_argument(
+        "--mirror", type=str, default=DEFAULT_MIRROR,
+        help="Repository URL template with {os_major} and {xar_version}",
+    )
+    parser.add_argument(
+        "--os-major", type=str, default="14",
+        help="TwinCAT/BSD major version of PLCs without cached facts",
+    )
+    parser.add_argument("--cache-dir", type=str, default="")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--private-key", type=str, default=str(DEFAULT_KEY))
+    parser.add_argument(
+        "--ask-become-pass", action="store_true",
+        help="Prompt once for the become password used to fill the pkg caches",
+    )
+    parser.add_argument(
+        "--fetch-only", action="store_true",
+        help="Fill the controller cache without pushing to any PLC",
+    )
+    return parser
+
+
+def read_url(url: str) -> bytes:
+    """Read a http(s):// or file:// URL."""
+    with urllib.request.urlopen(url) as response:
+        return response.read()
+
+
+def parse_catalog(data: bytes) -> dict[str, list[CatalogEntry]]:
+    """Parse a packagesite archive into entries by package name."""
+    try:
+        with tarfile.open(fileobj=io.BytesIO(data), mode="r:*") as archive:
+            member = archive.extractfile("packagesite.yaml")
+            lines = member.read().decode().splitlines()
+    except (tarfile.TarError, KeyError) as ex:
+        raise ValueError(f"Unable to read the packagesite catalog: {ex}")
+    catalog: dict[str, list[CatalogEntry]] = {}
+    for line in lines:
+        if line.strip():
+            entry = CatalogEntry.from_manifest(json.loads(line))
+            catalog.setdefault(entry.name, []).append(entry)
+    return catalog
+
+
+def load_catalog(repo_url: str) -> dict[str, list[CatalogEntry]]:
+    """Download and parse a repository's catalog."""
+    errors = []
+    for name in CATALOG_NAMES:
+        try:
+            return parse_catalog(read_url(f"{repo_url}/{name}"))
+        except (OSError, ValueError) as ex:
+            errors.append(f"{name}: {ex}")
+    raise RuntimeError(f"No usable catalog at {repo_url} ({'; '.join(errors)})")
+
+
+def pick_xar(entries: list[CatalogEntry], xar_version: str) -> CatalogEntry | None:
+    """Pick the newest build of xar_version, as tcbsd_pkg does."""
+    builds = [
+        entry for entry in entries
+        if entry.version == xar_version or entry.version.startswith(xar_version + "_")
+    ]
+
+    def build_number(entry: CatalogEntry) -> int:
+        _, _, build = entry.version.partition("_")
+        return int(build) if build.isdigit() else 0
+
+    return max(builds, key=build_number, default=None)
+
+
+def resolve_packages(
+    catalog: dict[str, list[CatalogEntry]],
+    names: Iterable[str],
+    xar_version: str = "",
+) -> tuple[dict[str, CatalogEntry], list[str]]:
+    """
+    Get the catalog entries for names and all their dependencies.
+
+    Returns the entries by name, and the requested names that are not in
+    this catalog (they may come from another repository).
+    """
+    resolved: dict[str, CatalogEntry] = {}
+    missing = []
+    pending = list(names)
+    if xar_version:
+        xar = pick_xar(catalog.get(XAR_PACKAGE, []), xar_version)
+        if xar is None:
+            missing.append(f"{XAR_PACKAGE}-{xar_version}")
+        else:
+            resolved[xar.name] = xar
+            pending.extend(xar.deps)
+    while pending:
+        name = pending.pop()
+        if name in resolved:
+            continue
+        entries = catalog.get(name)
+        if not entries:
+            missing.append(name)
+            continue
+        resolved[name] = entries[-1]
+        pending.extend(entries[-1].deps)
+    return resolved, sorted(set(missing))
+
+
+class PackageCache:
+    """Content-addressed store of package files, keyed by sha256."""
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root)
+
+    def path_for(self, sha256: str) -> Path:
+        return self.root / "sha256" / sha256[:2] / sha256
+
+    def has(self, entry: CatalogEntry) -> bool:
+        return self.path_for(entry.sha256).is_file()
+
+    def fetch(self, repo_url: str, entry: CatalogEntry) -> bool:
+        """
+        Download entry into the cache if it is not there yet.
+
+        Returns True if it was downloaded.
+        """
+        path = self.path_for(entry.sha256)
+        if path.is_file():
+            return False
+        data = read_url(f"{repo_url}/{entry.repopath}")
+        digest = hashlib.sha256(data).hexdigest()
+        if digest != entry.sha256:
+            raise ValueError(
+                f"{entry.repopath} has sha256 {digest}, expected {entry.sha256}"
+            )
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+        os.replace(temp_name, path)
+        return True
+
+
+def host_repo_url(mirror: str, config: dict[str, Any], os_major: str) -> str:
+    """
+    Get a host's repository URL, as templates/etc/pkg/SLAC.conf builds it.
+
+    The repository is chosen by fixed_xar_version whether or not
+    set_fixed_xar pins TC31-XAR, and by the host's own OS major version.
+    """
+    xar_version = str(config.get("fixed_xar_version") or "")
+    return mirror.format(os_major=os_major[:2], xar_version=xar_version)
+
+
+def host_os_major(hostname: str, default: str = "14") -> str:
+    """Get a host's OS major version from its cached facts, or default."""
+    facts = load_cached_facts(hostname) or {}
+    return str(facts.get("freebsd_version") or default)[:2]
+
+
+def host_requirements(config: dict[str, Any]) -> tuple[str, list[str]]:
+    """
+    Get the XAR version to pin and package names a host's config asks for.
+
+    The XAR version is blank unless set_fixed_xar is set.
+    """
+    xar_version = str(config.get("fixed_xar_version") or "")
+    if not config.get("set_fixed_xar"):
+        xar_version = ""
+    names = []
+    for var in PACKAGE_VARS:
+        names.extend(str(name) for name in config.get(var) or [] if name)
+    return xar_version, names
+
+
+def push_to_host(
+    address: str,
+    entries: list[CatalogEntry],
+    cache: PackageCache,
+    private_key: str,
+    staging_dir: str = STAGING_DIR,
+    pkg_cache_dir: str = PKG_CACHE_DIR,
+) -> dict[str, Any]:
+    """Stage the cached files the host's pkg cache is missing, without root."""
+    with tempfile.TemporaryDirectory(prefix="tcbsd-pkg-") as staging:
+        # Name the content-addressed files the way pkg names its cache files
+        for entry in entries:
+            os.symlink(cache.path_for(entry.sha256), Path(staging) / entry.cache_name)
+        ssh = ["ssh", "-F", str(SSH_CONFIG), "-i", private_key]
+        command = [
+            "rsync", "--copy-links", "--times", "--size-only",
+            # Files already in the pkg cache are not sent again
+            f"--compare-dest={pkg_cache_dir}/",
+            "--out-format=%n",
+            "-e", " ".join(shlex.quote(arg) for arg in ssh),
+            f"{staging}/",
+            f"{address}:{staging_dir}/",
+        ]
+        proc = subprocess.run(command, capture_output=True, text=True)
+    sent = [line for line in proc.stdout.splitlines() if line.endswith(".pkg")]
+    return dict(
+        ok=proc.returncode == 0,
+        sent=sent,
+        error=proc.stderr.strip() if proc.returncode else "",
+    )
+
+
+def install_script(
+    staging_dir: str,
+    pkg_cache_dir: str = PKG_CACHE_DIR,
+    owner: str = "root:wheel",
+) -> str:
+    """
+    Get the shell script that moves staged files into the pkg cache.
+
+    staging_dir is a shell word, so that ~user is expanded on the PLC.
+    Symlinks are not followed, and files already in the cache are kept.
+    """
+    chown = f'chown {owner} "$cache/$name.tmp"' if owner else ":"
+    return "\n".join([
+        "set -e",
+        f"staging={staging_dir}",
+        f"cache={shlex.quote(pkg_cache_dir)}",
+        '[ -d "$staging" ] || exit 0',
+        'for file in "$staging"/*.pkg; do',
+        '  [ -f "$file" ] && [ ! -L "$file" ] || continue',
+        '  name=${file##*/}',
+        '  [ -f "$cache/$name" ] && continue',
+        '  cp "$file" "$cache/$name.tmp"',
+        '  chmod 0644 "$cache/$name.tmp"',
+        f"  {chown}",
+        '  mv "$cache/$name.tmp" "$cache/$name"',
+        '  echo "installed $name"',
+        "done",
+        'rm -rf "$staging"',
+    ])
+
+
+def parse_install_output(
+    output: str, hostnames: list[str]
+) -> dict[str, dict[str, Any]]:
+    """Get per-host results from ansible's minimal callback output."""
+    bodies: dict[str, tuple[str, list[str]]] = {}
+    body: list[str] = []
+    for line in output.splitlines():
+        match = MINIMAL_HEADER.match(line)
+        if match and match["host"] in hostnames:
+            body = [match["json"]] if match["json"] else []
+            bodies[match["host"]] = (match["status"], body)
+        else:
+            body.append(line)
+
+    results = {}
+    for hostname in hostnames:
+        status, lines = bodies.get(hostname, ("", []))
+        ok = status in ("SUCCESS", "CHANGED")
+        error = "no result from ansible"
+        if status:
+            text = "\n".join(lines).strip()
+            try:
+                # Results without stdout are printed as JSON
+                text = json.loads(text).get("msg", text)
+            except (ValueError, AttributeError):
+                pass
+            error = f"{status}: {text}"
+        results[hostname] = dict(
+            ok=ok,
+            installed=sum(line.startswith("installed ") for line in lines),
+            error="" if ok else error,
+        )
+    return results
+
+
+def install_on_hosts(
+    hostnames: list[str],
+    private_key: str,
+    ask_become_pass: bool = False,
+    forks: int = 4,
+) -> dict[str, dict[str, Any]]:
+    """Move the staged files into the pkg caches with one become run."""
+    script = install_script(f"~{{{{ ansible_user }}}}/{STAGING_DIR}")
+    command = [
+        "ansible", ",".join(hostnames), "--become",
+        "--forks", str(max(forks, 1)),
+        "--extra-vars", f"ansible_ssh_private_key_file={private_key}",
+        "-m", "ansible.builtin.shell", "-a", script,
+    ]
+    if ask_become_pass:
+        command.append("--ask-become-pass")
+    env = dict(os.environ, ANSIBLE_STDOUT_CALLBACK="ansible.builtin.minimal")
+    # The prompt is read from the terminal, not from the captured output
+    proc = subprocess.run(
+        command, cwd=REPO_ROOT, env=env, stdout=subprocess.PIPE, text=True,
+    )
+    return parse_install_output(proc.stdout, hostnames)
+
+
+def main(
+    target: str,
+    mirror: str = DEFAULT_MIRROR,
+    os_major: str = "14",
+    cache_dir: str = "",
+    concurrency: int = 4,
+    private_key: str = str(DEFAULT_KEY),
+    ask_become_pass: bool = False,
+    fetch_only: bool = False,
+) -> int:
+    configs = EffectiveConfigs()
+    cache = PackageCache(cache_dir or default_cache_dir() / "pkg")
+
+    # Hosts sharing a mirror repository share one catalog download
+    repos: dict[str, list[tuple[str, str, str, list[str]]]] = {}
+    for hostname in configs.hosts(target):
+        config = configs.host_config(hostname)
+        if not config.get("enable_slac_packages"):
+            print(f"{hostname}: SLAC packages are not enabled, skipping")
+            continue
+        xar_version, names = host_requirements(config)
+        repo_url = host_repo_url(mirror, config, host_os_major(hostname, os_major))
+        address = str(config.get("ansible_host") or hostname)
+        user = config.get("ansible_user")
+        if user:
+            address = f"{user}@{address}"
+        repos.setdefault(repo_url, []).append((hostname, address, xar_version, names))
+
+    host_entries: dict[str, tuple[str, list[CatalogEntry]]] = {}
+    to_fetch: dict[str, tuple[str, CatalogEntry]] = {}
+    failed = 0
+    for repo_url, hosts in repos.items():
+        try:
+            catalog = load_catalog(repo_url)
+        except RuntimeError as ex:
+            print(ex)
+            failed += len(hosts)
+            continue
+        for hostname, address, xar_version, names in hosts:
+            resolved, missing = resolve_packages(catalog, names, xar_version)
+            for name in missing:
+                print(f"{hostname}: {name} is not in {repo_url}")
+            host_entries[hostname] = (address, list(resolved.values()))
+            for entry in resolved.values():
+                to_fetch.setdefault(entry.sha256, (repo_url, entry))
+
+    downloaded = 0
+    for repo_url, entry in to_fetch.values():
+        try:
+            downloaded += cache.fetch(repo_url, entry)
+        except (OSError, ValueError) as ex:
+            print(f"Failed to fetch {entry.repopath}: {ex}")
+            failed += 1
+    print(
+        f"{len(to_fetch)} package files needed, {downloaded} downloaded, "
+        f"{len(to_fetch) - downloaded - failed} already cached in {cache.root}"
+    )
+    if fetch_only or failed:
+        return 1 if failed else 0
+
+    def push(item: tuple[str, tuple[str, list[CatalogEntry]]]) -> bool:
+        hostname, (address, entries) = item
+        result = push_to_host(address, entries, cache, private_key)
+        if result["ok"]:
+            print(f"{hostname}: staged {len(result['sent'])} of {len(entries)} files")
+        else:
+            print(f"{hostname}: rsync failed: {result['error']}")
+        return result["ok"]
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        staged = [
+            hostname
+            for hostname, ok in zip(
+                host_entries, executor.map(push, host_entries.items())
+            )
+            if ok
+        ]
+    failed += len(host_entries) - len(staged)
+    if staged:
+        results = install_on_hosts(staged, private_key, ask_become_pass, concurrency)
+        for hostname, result in results.items():
+            if result["ok"]:
+                print(f"{hostname}: added {result['installed']} files to the pkg cache")
+            else:
+                print(f"{hostname}: install failed: {result['error']}")
+                failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    args = parser.parse_args()
+    exit(main(
+        target=args.target,
+        mirror=args.mirror,
+        os_major=args.os_major,
+        cache_dir=args.cache_dir,
+        concurrency=args.concurrency,
+        private_key=args.private_key,
+        ask_become_pass=args.ask_become_pass,
+        fetch_only=args.fetch_only,
+    ))
@@ -0,0 +1,356 @@
+"""
+Provision an inventory group in waves, canaries first.
+
+Hosts are provisioned by separate ansible-playbook runs, at most
+--concurrency at a time. The first wave holds one canary host from each
+configuration cohort (see config_cohorts.py). Later waves only start if the
+failures so far stay within --max-failures and --max-failure-rate.
+
+Every run shares one set of persistent, multiplexed SSH connections
+(ControlMaster/ControlPersist) and uses pipelining. The repository's
+ssh_config is still applied first, so its security settings hold: no agent
+or X11 forwarding, publickey authentication only.
+
+A per-host timing and outcome report is written as JSON, and each host's
+ansible output is kept in a log file next to it.
+"""
+from __future__ import annotations
+
+import argparse
+import getpass
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from config_cohorts import EffectiveConfigs
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+PLAYBOOK = REPO_ROOT / "tcbsd-provision-playbook.yaml"
+SSH_CONFIG = REPO_ROOT / "ssh_config"
+COMPILED_INVENTORY = Path(__file__).resolve().parent / "compiled_inventory.py"
+DEFAULT_KEY = Path.home() / ".ssh" / "tcbsd_key_rsa"
+
+# ansible-playbook exit codes
+OUTCOMES = {0: "ok", 2: "failed", 4: "unreachable"}
+
+# The security settings of ssh_config
+SECURITY_OPTIONS = (
+    "-o", "ForwardAgent=no",
+    "-o", "ForwardX11=no",
+    "-o", "ForwardX11Trusted=no",
+    "-o", "PreferredAuthentications=publickey",
+)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the parser used for CLI argument parsing."""
+    parser = argparse.ArgumentParser(
+        prog="provision_fleet.py",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        usage="%(prog)s [options] target [-- ansible-playbook args]",
+    )
+    parser.add_argument("target", type=str, help="Inventory group or host")
+    parser.add_argument(
+        "--concurrency", type=int, default=5,
+        help="Hosts provisioned at the same time",
+    )
+    parser.add_argument(
+        "--wave-size", type=int, default=0,
+        help="Hosts per wave after the canaries (default: 2x concurrency)",
+    )
+    parser.add_argument(
+        "--canary", type=str, nargs="*", default=None,
+        help="Canary hosts (default: one host per configuration cohort)",
+    )
+    parser.add_argument(
+        "--max-failures", type=int, default=0,
+        help="Stop starting new waves after more than this many failed hosts",
+    )
+    parser.add_argument(
+        "--max-failure-rate", type=float, default=1.0,
+        help="Stop starting new waves above this fraction of failed hosts",
+    )
+    parser.add_argument(
+        "--control-persist", type=str, default="30m",
+        help="How long idle SSH master connections are kept open",
+    )
+    parser.add_argument("--private-key", type=str, default=str(DEFAULT_KEY))
+    parser.add_argument(
+        "--ask-become-pass", action="store_true",
+        help="Prompt once for the become password and use it for every host",
+    )
+    parser.add_argument(
+        "--report", type=str, default="",
+        help="JSON report path (default: a timestamped file in ./provision_logs)",
+    )
+    parser.add_argument(
+        "--compiled-inventory", action="store_true",
+        help="Use the cached compiled_inventory.py instead of the YAML inventory",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true",
+        help="Only print the waves that would be run",
+    )
+    return parser
+
+
+def split_ansible_args(argv: list[str]) -> tuple[list[str], list[str]]:
+    """Split off the extra ansible-playbook arguments given after --."""
+    if "--" not in argv:
+        return argv, []
+    split = argv.index("--")
+    return argv[:split], argv[split + 1:]
+
+
+def plan_waves(
+    hosts: list[str],
+    canaries: list[str],
+    wave_size: int,
+) -> list[list[str]]:
+    """Split hosts into a canary wave followed by waves of wave_size hosts."""
+    canaries = [host for host in dict.fromkeys(canaries) if host in hosts]
+    rest = [host for host in hosts if host not in canaries]
+    waves = [canaries] if canaries else []
+    size = max(wave_size, 1)
+    waves.extend(rest[start:start + size] for start in range(0, len(rest), size))
+    return waves
+
+
+def default_canaries(configs: EffectiveConfigs, target: str) -> list[str]:
+    """Pick the first host, alphabetically, of each configuration cohort."""
+    return [min(cohort.hosts) for cohort in configs.cohorts(target=target)]
+
+
+def too_many_failures(
+    failures: int,
+    finished: int,
+    max_failures: int,
+    max_failure_rate: float,
+) -> bool:
+    """Check the stop-on-failure thresholds."""
+    if failures > max_failures:
+        return True
+    return finished > 0 and failures / finished > max_failure_rate
+
+
+class SSHMultiplexer:
+    """Shared ControlMaster settings for every ansible and ssh call of a run."""
+
+    def __init__(self, control_dir: Path, persist: str = "30m"):
+        self.control_dir = control_dir
+        self.persist = persist
+
+    @property
+    def options(self) -> list[str]:
+        return [
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPersist={self.persist}",
+            "-o", f"ControlPath={self.control_dir}/%C",
+        ]
+
+    def ansible_env(self) -> dict[str, str]:
+        """Environment that makes ansible reuse the shared connections."""
+        # A -o option overrides ssh_config, and ansible adds its own -o
+        # options (e.g. PreferredAuthentications) after these.  The first -o
+        # given for an option wins, so repeat ssh_config's security settings
+        # here to keep them.
+        ssh_args = ["-F", str(SSH_CONFIG), *self.options, *SECURITY_OPTIONS]
+        return dict(
+            os.environ,
+            ANSIBLE_SSH_ARGS=" ".join(shlex.quote(arg) for arg in ssh_args),
+            ANSIBLE_PIPELINING="True",
+        )
+
+    def close(self, address: str) -> None:
+        """Ask the master connection for address, if any, to exit."""
+        subprocess.run(
+            ["ssh", "-F", str(SSH_CONFIG), *self.options, "-O", "exit", address],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=False,
+        )
+
+
+def provision_host(
+    hostname: str,
+    target: str,
+    wave: int,
+    env: dict[str, str],
+    log_dir: Path,
+    extra_args: list[str],
+) -> dict[str, Any]:
+    """Run the provision playbook for a single host and time it."""
+    log_path = log_dir / f"{hostname}.log"
+    command = [
+        "ansible-playbook", str(PLAYBOOK),
+        "--extra-vars", f"target={target}",
+        "--limit", hostname,
+        *extra_args,
+    ]
+    start = time.time()
+    with log_path.open("w") as log:
+        returncode = subprocess.run(
+            command,
+            cwd=REPO_ROOT,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        ).returncode
+    seconds = time.time() - start
+    outcome = OUTCOMES.get(returncode, "error")
+    print(f"[wave {wave}] {hostname}: {outcome} in {seconds:.1f}s")
+    return dict(
+        host=hostname,
+        wave=wave,
+        outcome=outcome,
+        returncode=returncode,
+        started=time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(start)),
+        seconds=round(seconds, 3),
+        log=str(log_path),
+    )
+
+
+def main(
+    target: str,
+    concurrency: int = 5,
+    wave_size: int = 0,
+    canary: list[str] | None = None,
+    max_failures: int = 0,
+    max_failure_rate: float = 1.0,
+    control_persist: str = "30m",
+    private_key: str = str(DEFAULT_KEY),
+    ask_become_pass: bool = False,
+    report: str = "",
+    compiled_inventory: bool = False,
+    dry_run: bool = False,
+    ansible_args: list[str] | None = None,
+) -> int:
+    configs = EffectiveConfigs()
+    hosts = configs.hosts(target)
+    canaries = default_canaries(configs, target) if canary is None else canary
+    waves = plan_waves(hosts, canaries, wave_size or 2 * concurrency)
+    has_canary_wave = any(host in hosts for host in canaries)
+    for number, wave in enumerate(waves, start=1):
+        print(f"Wave {number}: {', '.join(wave)}")
+    if dry_run:
+        return 0
+
+    extra_args = [
+        "--extra-vars", f"ansible_ssh_private_key_file={private_key}",
+        *(ansible_args or []),
+    ]
+    if compiled_inventory:
+        extra_args += ["-i", str(COMPILED_INVENTORY)]
+    if not report:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        report = str(REPO_ROOT / "provision_logs" / f"{stamp}-{target}.json")
+    report_path = Path(report)
+    log_dir = report_path.with_suffix("")
+    log_dir.mkdir(parents=True, exist_ok=True)
+
+    results: list[dict[str, Any]] = []
+    stopped_after = 0
+    with tempfile.TemporaryDirectory(prefix="tcbsd-ssh-") as control_dir:
+        mux = SSHMultiplexer(Path(control_dir), persist=control_persist)
+        env = mux.ansible_env()
+        if compiled_inventory:
+            # The compiled inventory already holds the group and host vars
+            env["ANSIBLE_VARS_ENABLED"] = ""
+        if ask_become_pass:
+            # Prompt once here; every host's run reads it from a private file
+            vars_path = Path(control_dir) / "become.json"
+            fd = os.open(vars_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w") as fp:
+                json.dump(dict(ansible_become_password=getpass.getpass(
+                    "BECOME password: "
+                )), fp)
+            extra_args += ["--extra-vars", f"@{vars_path}"]
+
+        try:
+            for number, wave in enumerate(waves, start=1):
+                with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+                    results.extend(pool.map(
+                        lambda host, number=number: provision_host(
+                            hostname=host,
+                            target=target,
+                            wave=number,
+                            env=env,
+                            log_dir=log_dir,
+                            extra_args=extra_args,
+                        ),
+                        wave,
+                    ))
+                failures = sum(result["outcome"] != "ok" for result in results)
+                # Any canary failure stops the run
+                limit = 0 if number == 1 and has_canary_wave else max_failures
+                if number < len(waves) and too_many_failures(
+                    failures, len(results), limit, max_failure_rate,
+                ):
+                    stopped_after = number
+                    print(
+                        f"Stopping after wave {number}: "
+                        f"{failures} of {len(results)} hosts failed"
+                    )
+                    break
+        finally:
+            hostvars = configs.document["_meta"]["hostvars"]
+            for result in results:
+                mux.close(hostvars.get(result["host"], {}).get(
+                    "ansible_host", result["host"]
+                ))
+
+    provisioned = {result["host"] for result in results}
+    for number, wave in enumerate(waves, start=1):
+        results.extend(
+            dict(host=host, wave=number, outcome="skipped")
+            for host in wave if host not in provisioned
+        )
+    report_path.write_text(json.dumps(
+        dict(
+            target=target,
+            concurrency=concurrency,
+            waves=waves,
+            stopped_after_wave=stopped_after or None,
+            hosts=results,
+        ),
+        indent=2,
+    ) + "\n")
+
+    counts: dict[str, int] = {}
+    for result in results:
+        counts[result["outcome"]] = counts.get(result["outcome"], 0) + 1
+    summary = ", ".join(
+        f"{count} {outcome}" for outcome, count in sorted(counts.items())
+    )
+    print(f"{summary}. Report written to {report_path}")
+    return 0 if counts.get("ok", 0) == len(results) else 1
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    argv, ansible_args = split_ansible_args(sys.argv[1:])
+    args = parser.parse_args(argv)
+    exit(main(
+        target=args.target,
+        concurrency=args.concurrency,
+        wave_size=args.wave_size,
+        canary=args.canary,
+        max_failures=args.max_failures,
+        max_failure_rate=args.max_failure_rate,
+        control_persist=args.control_persist,
+        private_key=args.private_key,
+        ask_become_pass=args.ask_become_pass,
+        report=args.report,
+        compiled_inventory=args.compiled_inventory,
+        dry_run=args.dry_run,
+        ansible_args=ansible_args,
+    ))
@@ -0,0 +1,34 @@
+#!/bin/bash
+# Provision an inventory group in waves, canaries first, with shared SSH connections.
+# See provision_fleet.py --help for the wave, concurrency and failure options.
+#
+# To provision all of the tst plcs, two at a time:
+#
+#   $ ./provision_fleet.sh tst_all --concurrency 2
+#
+# Extra ansible-playbook arguments go after --, e.g. for a dry run:
+#
+#   $ ./provision_fleet.sh tst_all -- --check --diff
+set -e
+
+if [ -z "${1}" ]; then
+  echo "Ansible target required"
+  exit 1
+fi
+
+THIS_SCRIPT="$(realpath "${0}")"
+THIS_DIR="$(dirname "${THIS_SCRIPT}")"
+source "${THIS_DIR}"/paths.sh
+
+# Use the correct python env
+source "${THIS_DIR}"/activate_python.sh
+
+# Register the ssh key with the ssh agent if needed
+source "${THIS_DIR}/ssh_agent_helper.sh"
+# Stop the ssh agent at exit if we started it here
+trap ssh_agent_helper_cleanup EXIT
+
+python "${THIS_DIR}"/provision_fleet.py --private-key "${SSH_KEY_FILENAME}" --ask-become-pass "$@"
+
+# Prompt to update deployment docs
+"${THIS_DIR}"/docs_prompt.sh
@@ -10,6 +10,9 @@
 #   $ ./provision_plc.sh tst_all
 #
 # Groups are defined in the inventory file.
+#
+# Set TCBSD_COMPILED_INVENTORY=1 to use the cached, precompiled inventory
+# from compiled_inventory.py instead of parsing the YAML files on every run.
 set -e
 
 if [ -z "${1}" ]; then
@@ -32,8 +35,16 @@ source "${THIS_DIR}/ssh_agent_helper.sh"
 # Stop the ssh agent at exit if we started it here
 trap ssh_agent_helper_cleanup EXIT
 
+# Use the compiled inventory if requested. It already includes the
+# group_vars and host_vars, so the vars plugin that loads them is disabled.
+INVENTORY_ARGS=()
+if [ "${TCBSD_COMPILED_INVENTORY:-0}" == "1" ]; then
+  INVENTORY_ARGS=(-i "${THIS_DIR}/compiled_inventory.py")
+  export ANSIBLE_VARS_ENABLED=""
+fi
+
 # Run the provision playbook
-ansible-playbook "${ANSIBLE_ROOT}/tcbsd-provision-playbook.yaml" --extra-vars "target=${TARGET} ansible_ssh_private_key_file=${SSH_KEY_FILENAME}" --ask-become-pass "$@"
+ansible-playbook "${ANSIBLE_ROOT}/tcbsd-provision-playbook.yaml" "${INVENTORY_ARGS[@]}" --extra-vars "target=${TARGET} ansible_ssh_private_key_file=${SSH_KEY_FILENAME}" --ask-become-pass "$@"
 
 # Prompt to update deployment docs
 "${THIS_DIR}"/docs_prompt.sh
@@ -0,0 +1,476 @@
+"""
+Render the files the provision playbook manages, for every PLC, offline.
+
+For each host, the playbook's file tasks are replayed on the controller from
+the host's effective vars (see config_cohorts.py): the pkg repo files and
+pkg.conf, TcRegistry.xml values, StaticRoutes.xml (the exact and the merged
+tcbsd_route routes), the pf siteconf and pf.conf, and the bash dotfiles.
+They are applied on top of local snapshots of the PLC's files and written
+to a per-host tree, and each file is diffed against its snapshot. Hosts are
+rendered in parallel across CPU cores and nothing talks to the PLCs.
+
+Snapshots use the layout ansible's fetch module writes,
+<snapshots>/<hostname>/<absolute path>, so they can be refreshed with:
+
+    ansible-playbook tcbsd-snapshot-playbook.yaml --extra-vars "target=tst_all"
+
+TcSysExe.exe facts are taken from the tcbsd_facts controller cache when
+available.
+"""
+from __future__ import annotations
+
+import argparse
+import difflib
+import ipaddress
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import jinja2
+import lxml.etree
+
+from config_cohorts import EffectiveConfigs
+from hostname_resolver import ResolutionError, Resolver
+from inventory_loader import load_cached_facts
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+TEMPLATES = REPO_ROOT / "templates"
+sys.path.insert(0, str(REPO_ROOT / "library"))
+
+import tcbsd_registry  # noqa: E402
+import tcbsd_route  # noqa: E402
+
+REGISTRY_PATH = "/usr/local/etc/TwinCAT/3.1/TcRegistry.xml"
+ROUTES_PATH = "/usr/local/etc/TwinCAT/3.1/Target/StaticRoutes.xml"
+SYSTEM_KEY = "HKLM/Software/Beckhoff/TwinCAT3/System"
+# Seconds to wait for each hostname lookup while rendering
+DNS_TIMEOUT = 1.0
+# Every file the provision playbook writes; tcbsd-snapshot-playbook.yaml
+# fetches the same list.
+MANAGED_FILES = (
+    "/usr/local/etc/pkg/repos/FreeBSD.conf",
+    "/usr/local/etc/pkg/repos/TCBSD.conf",
+    "/usr/local/etc/pkg/repos/SLAC.conf",
+    "/etc/pkg/SLAC.conf",
+    "/usr/local/etc/pkg.conf",
+    REGISTRY_PATH,
+    ROUTES_PATH,
+    "/etc/pf.conf.d/siteconf",
+    "/etc/pf.conf",
+    "/home/Administrator/.bashrc",
+    "/home/Administrator/.bash_profile",
+)
+PSPROXY_BLOCK = """\
+PKG_ENV {
+    http_proxy: "http://psproxy:3128",
+    https_proxy: "http://psproxy:3128",
+}"""
+PF_BLOCK = """\
+anchor siteconf
+load anchor siteconf from "/etc/pf.conf.d/siteconf\""""
+
+
+class FileResult(NamedTuple):
+    """The outcome of rendering one managed file for one host."""
+
+    host: str
+    path: str
+    # unchanged, changed, created, removed, or skipped if it cannot be
+    # rendered without a snapshot
+    status: str
+    diff: str = ""
+    reason: str = ""
+
+
+class RenderError(Exception):
+    """A file cannot be rendered offline."""
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Return the parser used for CLI argument parsing."""
+    parser = argparse.ArgumentParser(
+        prog="render_fleet.py",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "target", type=str, nargs="?", default="all",
+        help="Inventory group or host (default: all)",
+    )
+    parser.add_argument(
+        "--snapshots", type=str, default=str(REPO_ROOT / "snapshots"),
+        help="Directory of fetched PLC files",
+    )
+    parser.add_argument(
+        "--output", type=str, default=str(REPO_ROOT / "rendered"),
+        help="Directory the per-host trees are rendered into",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=os.cpu_count() or 1,
+        help="Hosts rendered at the same time (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--os-major", type=str, default="14",
+        help="TwinCAT/BSD major version for hosts without cached facts",
+    )
+    parser.add_argument("--diff", action="store_true", help="Print the diffs")
+    return parser
+
+
+def blockinfile(original: bytes | None, block: str, present: bool) -> bytes:
+    """Apply an ansible.builtin.blockinfile edit with the default markers."""
+    if original is None:
+        raise RenderError("blockinfile needs the existing file")
+    markers = (b"# BEGIN ANSIBLE MANAGED BLOCK", b"# END ANSIBLE MANAGED BLOCK")
+    lines = original.splitlines()
+    block_lines = [markers[0], *block.encode().splitlines(), markers[1]]
+    if not present:
+        block_lines = []
+    begin = end = None
+    for number, line in enumerate(lines):
+        if line == markers[0]:
+            begin = number
+        elif line == markers[1]:
+            end = number
+    if begin is not None and end is not None and begin < end:
+        del lines[begin:end + 1]
+        position = begin
+    else:
+        position = len(lines)
+    lines[position:position] = block_lines
+    if not lines:
+        return b""
+    result = b"\n".join(lines)
+    if original.endswith(b"\n") or not original:
+        result += b"\n"
+    return result
+
+
+def is_ip_address(text: str) -> bool:
+    try:
+        ipaddress.IPv4Address(text)
+    except ValueError:
+        return False
+    return True
+
+
+def registry_settings(
+    config: dict[str, Any],
+    resolver: Resolver,
+) -> dict[str, Any]:
+    """The TcRegistry values the playbook sets, as in tc_registry_settings."""
+    if config.get("dynamic_ams"):
+        host = str(config["ansible_host"])
+        address = host if is_ip_address(host) else resolver.resolve(host)
+        ams_net_id = f"{address}.1.1"
+    else:
+        ams_net_id = config["tc_ams_net_id"]
+    values: dict[str, Any] = {
+        f"{SYSTEM_KEY}/AmsNetId": dict(ams_net_id=ams_net_id),
+        f"{SYSTEM_KEY}/LockedMemSize": str(config["tc_locked_memory_size_bytes"]),
+    }
+    if int(config.get("tc_heap_memory_size_mb") or 0) > 0:
+        values[f"{SYSTEM_KEY}/HeapMemSizeMB"] = dict(
+            value=str(config["tc_heap_memory_size_mb"]),
+            attributes=dict(Type="DW"),
+        )
+    return values
+
+
+def apply_registry(original: bytes | None, values: dict[str, Any]) -> bytes:
+    """Apply values to TcRegistry.xml as the tcbsd_registry module does."""
+    if original is None:
+        raise RenderError("TcRegistry.xml is needed to apply registry values")
+    settings = [
+        tcbsd_registry.RegistrySetting.from_param(path, setting)
+        for path, setting in sorted(values.items())
+    ]
+    tree = lxml.etree.ElementTree(lxml.etree.fromstring(original))
+    details = tcbsd_registry.apply_settings(tree.getroot(), settings)
+    if not any(detail["changed"] for detail in details.values()):
+        return original
+    contents = lxml.etree.tostring(
+        tree,
+        xml_declaration=True,
+        encoding=tree.docinfo.encoding or "UTF-8",
+    )
+    if not contents.endswith(b"\n"):
+        contents += b"\n"
+    return contents
+
+
+def merge_routes(
+    original: bytes | None,
+    route_dicts: list[dict[str, Any]],
+    state: str = "present",
+) -> bytes:
+    """Apply routes as the tcbsd_route module does with patch: true."""
+    new_routes = [tcbsd_route.Route(**route_dict) for route_dict in route_dicts]
+    document = None
+    if original is None:
+        if state != "exact":
+            raise RenderError("StaticRoutes.xml is needed to merge routes")
+        routes = tcbsd_route.RouteTable()
+    else:
+        try:
+            document = tcbsd_route.RouteDocument(original)
+        except ValueError:
+            pass
+        if document is not None:
+            routes = tcbsd_route.RouteTable(document.routes)
+        else:
+            routes = tcbsd_route.RouteTable(
+                tcbsd_route.iter_routes_from_file(tcbsd_route.io.BytesIO(original))
+            )
+    before = len(routes)
+    result = routes.apply(state, new_routes)
+    if not any(
+        (
+            result["routes_added"],
+            result["routes_modified"],
+            result["routes_removed"],
+            before != len(routes),
+        )
+    ):
+        return original if original is not None else tcbsd_route.routes_to_bytes(routes)
+    if document is not None:
+        return document.patch(routes)
+    return tcbsd_route.routes_to_bytes(routes)
+
+
+class HostRenderer:
+    """Replays the provision playbook's file tasks for one host."""
+
+    def __init__(
+        self,
+        hostname: str,
+        config: dict[str, Any],
+        facts: dict[str, Any],
+        snapshot_root: Path,
+    ):
+        self.hostname = hostname
+        self.config = config
+        self.snapshot_root = snapshot_root
+        self.env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(str(TEMPLATES)),
+            trim_blocks=True,
+            keep_trailing_newline=True,
+            undefined=jinja2.StrictUndefined,
+        )
+        self.variables = dict(
+            config,
+            inventory_hostname=hostname,
+            ansible_facts=facts,
+        )
+        self.snapshots: dict[str, bytes | None] = {}
+        self.files: dict[str, bytes | None] = {}
+        self.errors: dict[str, str] = {}
+
+    def snapshot(self, path: str) -> bytes | None:
+        if path not in self.snapshots:
+            try:
+                self.snapshots[path] = (
+                    self.snapshot_root / path.lstrip("/")
+                ).read_bytes()
+            except FileNotFoundError:
+                self.snapshots[path] = None
+        return self.snapshots[path]
+
+    def current(self, path: str) -> bytes | None:
+        return self.files[path] if path in self.files else self.snapshot(path)
+
+    def template(self, dest: str) -> None:
+        try:
+            self.files[dest] = self.env.get_template(dest.lstrip("/")).render(
+                self.variables
+            ).encode()
+        except jinja2.TemplateError as ex:
+            self.errors[dest] = f"Unable to render the template: {ex}"
+
+    def absent(self, path: str) -> None:
+        self.files[path] = None
+
+    def edit(self, path: str, func, *args) -> None:
+        try:
+            self.files[path] = func(self.current(path), *args)
+        except (RenderError, ValueError, tcbsd_route.ResolutionError) as ex:
+            self.errors[path] = str(ex)
+        except OSError as ex:
+            # socket.gaierror, for a route hostname that does not resolve
+            self.errors[path] = f"Unable to resolve a route: {ex}"
+        except lxml.etree.XMLSyntaxError as ex:
+            self.errors[path] = f"Unable to parse the snapshot: {ex}"
+
+    def render(self, resolver: Resolver) -> None:
+        config = self.config
+        if config.get("enable_freebsd_packages"):
+            self.absent("/usr/local/etc/pkg/repos/FreeBSD.conf")
+        else:
+            self.template("/usr/local/etc/pkg/repos/FreeBSD.conf")
+        if config.get("enable_tcbsd_packages"):
+            # As in the playbook: this removes FreeBSD.conf
+            self.absent("/usr/local/etc/pkg/repos/FreeBSD.conf")
+        else:
+            self.template("/usr/local/etc/pkg/repos/TCBSD.conf")
+        if config.get("enable_slac_packages"):
+            self.template("/etc/pkg/SLAC.conf")
+            self.absent("/usr/local/etc/pkg/repos/SLAC.conf")
+        else:
+            self.template("/usr/local/etc/pkg/repos/SLAC.conf")
+        self.edit(
+            "/usr/local/etc/pkg.conf", blockinfile,
+            PSPROXY_BLOCK, bool(config.get("use_psproxy")),
+        )
+
+        try:
+            values = registry_settings(config, resolver)
+        except KeyError as ex:
+            self.errors[REGISTRY_PATH] = f"{ex.args[0]} is not set"
+        except (ResolutionError, OSError) as ex:
+            self.errors[REGISTRY_PATH] = f"Unable to resolve the AMS Net ID: {ex}"
+        else:
+            self.edit(REGISTRY_PATH, apply_registry, values)
+
+        if config.get("tc_use_bash"):
+            self.template("/home/Administrator/.bashrc")
+            self.template("/home/Administrator/.bash_profile")
+
+        self.template("/etc/pf.conf.d/siteconf")
+        self.edit("/etc/pf.conf", blockinfile, PF_BLOCK, True)
+
+        if config.get("tc_set_fixed_static_routes"):
+            self.edit(
+                ROUTES_PATH, merge_routes,
+                config["tc_set_fixed_static_routes"], "exact",
+            )
+        if config.get("tc_add_missing_static_routes"):
+            self.edit(ROUTES_PATH, merge_routes, config["tc_add_missing_static_routes"])
+
+    def results(self) -> list[FileResult]:
+        results = []
+        for path in MANAGED_FILES:
+            before = self.snapshot(path)
+            if path in self.errors:
+                results.append(FileResult(
+                    self.hostname, path, "skipped", reason=self.errors[path]
+                ))
+                continue
+            after = self.current(path)
+            if before == after:
+                status = "unchanged"
+            elif before is None:
+                status = "created"
+            elif after is None:
+                status = "removed"
+            else:
+                status = "changed"
+            diff = ""
+            if status != "unchanged":
+                diff = "".join(difflib.unified_diff(
+                    (before or b"").decode(errors="replace").splitlines(True),
+                    (after or b"").decode(errors="replace").splitlines(True),
+                    fromfile=f"a/{self.hostname}{path}",
+                    tofile=f"b/{self.hostname}{path}",
+                ))
+            results.append(FileResult(self.hostname, path, status, diff=diff))
+        return results
+
+    def write_tree(self, root: Path) -> None:
+        """Write the rendered files to root/<hostname>/<path>."""
+        host_root = root / self.hostname
+        if host_root.exists():
+            shutil.rmtree(host_root)
+        for path in MANAGED_FILES:
+            contents = self.current(path)
+            if contents is None or path in self.errors:
+                continue
+            dest = host_root / path.lstrip("/")
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            dest.write_bytes(contents)
+
+
+def render_host(
+    hostname: str,
+    config: dict[str, Any],
+    facts: dict[str, Any],
+    snapshots: str,
+    output: str,
+) -> list[FileResult]:
+    """Render, write and diff every managed file for one host."""
+    if not (Path(snapshots) / hostname).is_dir():
+        return [FileResult(hostname, "", "skipped", reason="no snapshot")]
+    renderer = HostRenderer(
+        hostname=hostname,
+        config=config,
+        facts=facts,
+        snapshot_root=Path(snapshots) / hostname,
+    )
+    # dynamic_ams and routes without a net_id still need DNS.  Lookups get a
+    # short timeout, and a name that does not resolve in time is reported as
+    # an error for its file rather than holding up the render.
+    tcbsd_route.RESOLVER.timeout = DNS_TIMEOUT
+    renderer.render(Resolver(timeout=DNS_TIMEOUT))
+    renderer.write_tree(Path(output))
+    return renderer.results()
+
+
+def main(
+    target: str = "all",
+    snapshots: str = str(REPO_ROOT / "snapshots"),
+    output: str = str(REPO_ROOT / "rendered"),
+    jobs: int = 1,
+    os_major: str = "14",
+    diff: bool = False,
+) -> int:
+    configs = EffectiveConfigs()
+    hosts = configs.hosts(target)
+    work = []
+    for hostname in hosts:
+        facts = load_cached_facts(hostname) or dict(freebsd_version=os_major)
+        work.append((hostname, configs.host_config(hostname), dict(tcbsd=facts)))
+
+    with ProcessPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = [
+            executor.submit(render_host, hostname, config, facts, snapshots, output)
+            for hostname, config, facts in work
+        ]
+        per_host = [future.result() for future in futures]
+
+    totals: dict[str, int] = {}
+    for results in per_host:
+        counts: dict[str, int] = {}
+        for result in results:
+            counts[result.status] = counts.get(result.status, 0) + 1
+            totals[result.status] = totals.get(result.status, 0) + 1
+            if diff and result.diff:
+                print(result.diff, end="")
+            if result.status == "skipped":
+                what = result.path or "host"
+                print(f"{result.host}: skipped {what}: {result.reason}")
+        pending = {
+            status: count for status, count in sorted(counts.items())
+            if status != "unchanged"
+        }
+        summary = ", ".join(f"{count} {status}" for status, count in pending.items())
+        print(f"{results[0].host}: {summary or 'no changes'}")
+    print(
+        f"{len(hosts)} hosts rendered into {output}: "
+        + ", ".join(f"{count} {status}" for status, count in sorted(totals.items()))
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    parser = get_parser()
+    args = parser.parse_args()
+    exit(main(
+        target=args.target,
+        snapshots=args.snapshots,
+        output=args.output,
+        jobs=args.jobs,
+        os_major=args.os_major,
+        diff=args.diff,
+    ))